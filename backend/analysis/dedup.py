@@ -0,0 +1,65 @@
+"""
+Reuse of parsed data between identical data files.
+
+Files are stored by content hash (see ``prtcltech.uploads``), so identical
+uploads share one blob; a file with the same content as one already
+processed copies its parsed qPCR and Western blot rows instead of being
+parsed again.
+"""
+
+import logging
+from typing import Optional
+from django.db import connection, transaction
+from .models import DataFile, WesternBlotData, qPCRData
+
+logger = logging.getLogger(__name__)
+
+# Rows parsed out of a data file, copied to identical files
+PARSED_MODELS = (qPCRData, WesternBlotData)
+
+
+def _copy_rows(model, source_id, target_id) -> int:
+    qn = connection.ops.quote_name
+    columns = [
+        qn(field.column) for field in model._meta.concrete_fields
+        if field.name not in ('id', 'data_file')
+    ]
+    table = qn(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, data_file_id, {', '.join(columns)})
+            SELECT gen_random_uuid(), %s, {', '.join(columns)}
+            FROM {table} WHERE data_file_id = %s
+            """,
+            [target_id, source_id]
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def reuse_parsed_data(data_file: DataFile) -> Optional[DataFile]:
+    """
+    Copy the parsed rows of a processed file with the same content.
+
+    Each model's rows are copied with one ``INSERT ... SELECT``, replacing
+    any rows ``data_file`` already had.
+
+    Returns:
+        The file reused, or None if no identical file has been processed
+    """
+    if not data_file.content_hash:
+        return None
+    source = DataFile.objects.filter(content_hash=data_file.content_hash, is_processed=True) \
+        .exclude(id=data_file.id).only('id').order_by('uploaded_at').first()
+    if source is None:
+        return None
+
+    copied = 0
+    for model in PARSED_MODELS:
+        model.objects.filter(data_file_id=data_file.id).delete()
+        copied += _copy_rows(model, source.id, data_file.id)
+    DataFile.objects.filter(id=data_file.id).update(is_processed=True, processing_error='')
+
+    logger.info(f"Data file {data_file.id} reused {copied} parsed rows of data file {source.id}")
+    return source
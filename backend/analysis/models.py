@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from prtcltech.uploads import ContentAddressedUploadTo
 import uuid
 
 
@@ -18,7 +19,9 @@ class DataFile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200)
     file_type = models.CharField(max_length=20, choices=FILE_TYPES)
-    file = models.FileField(upload_to='data_files/')
+    # Stored by content hash and shared by identical uploads
+    file = models.FileField(upload_to=ContentAddressedUploadTo('data_files'))
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of file
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_files')
     uploaded_at = models.DateTimeField(default=timezone.now)
     
@@ -33,6 +36,11 @@ class DataFile(models.Model):
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Keyset pagination over all files and per uploader
+            models.Index(fields=['-uploaded_at', '-id'], name='datafile_uploaded_id_idx'),
+            models.Index(fields=['uploaded_by', '-uploaded_at', '-id'], name='datafile_uploader_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_file_type_display()})"
@@ -85,6 +93,11 @@ class AnalysisTask(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination over all tasks and per creator
+            models.Index(fields=['-created_at', '-id'], name='analysistask_created_id_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'], name='analysistask_creator_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_task_type_display()})"
@@ -106,6 +119,7 @@ class AnalysisResult(models.Model):
     chart_config = models.JSONField(default=dict)  # Chart configuration
     
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)  # Row version for conditional GETs
     
     class Meta:
         ordering = ['-created_at']
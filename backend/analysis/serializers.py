@@ -1,20 +1,22 @@
 from rest_framework import serializers
+from prtcltech.fields import SparseFieldsSerializerMixin
 from .models import DataFile, AnalysisTask, AnalysisResult, qPCRData, WesternBlotData, AnalysisTemplate
 
 
-class DataFileSerializer(serializers.ModelSerializer):
+class DataFileSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     uploaded_by = serializers.ReadOnlyField(source='uploaded_by.username')
     
     class Meta:
         model = DataFile
         fields = [
             'id', 'name', 'file_type', 'file', 'uploaded_by', 'uploaded_at',
-            'file_size', 'description', 'tags', 'is_processed', 'processing_error'
+            'file_size', 'description', 'tags', 'is_processed', 'processing_error',
+            'content_hash'
         ]
-        read_only_fields = ['id', 'uploaded_by', 'uploaded_at', 'file_size']
+        read_only_fields = ['id', 'uploaded_by', 'uploaded_at', 'file_size', 'content_hash']
 
 
-class AnalysisTaskSerializer(serializers.ModelSerializer):
+class AnalysisTaskSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     data_files = DataFileSerializer(many=True, read_only=True)
     
@@ -28,17 +30,17 @@ class AnalysisTaskSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_at', 'started_at', 'completed_at']
 
 
-class AnalysisResultSerializer(serializers.ModelSerializer):
+class AnalysisResultSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = AnalysisResult
         fields = [
             'id', 'task', 'result_type', 'data', 'metadata',
-            'chart_data', 'chart_config', 'created_at'
+            'chart_data', 'chart_config', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class qPCRDataSerializer(serializers.ModelSerializer):
+class qPCRDataSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = qPCRData
         fields = [
@@ -49,7 +51,7 @@ class qPCRDataSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class WesternBlotDataSerializer(serializers.ModelSerializer):
+class WesternBlotDataSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = WesternBlotData
         fields = [
@@ -61,7 +63,7 @@ class WesternBlotDataSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class AnalysisTemplateSerializer(serializers.ModelSerializer):
+class AnalysisTemplateSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     
     class Meta:
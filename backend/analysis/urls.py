@@ -5,6 +5,7 @@ from . import views
 router = DefaultRouter()
 router.register(r'files', views.DataFileViewSet, basename='datafile')
 router.register(r'tasks', views.AnalysisTaskViewSet, basename='analysistask')
+router.register(r'results', views.AnalysisResultViewSet, basename='analysisresult')
 router.register(r'templates', views.AnalysisTemplateViewSet, basename='analysistemplate')
 
 urlpatterns = [
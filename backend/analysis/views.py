@@ -4,7 +4,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from prtcltech.conditional import ConditionalGetMixin
+from prtcltech.fields import SparseFieldsetMixin
+from prtcltech.pagination import KeysetOrPageNumberPagination
+from prtcltech.uploads import deduplicate_upload
 
+from .dedup import reuse_parsed_data
 from .models import DataFile, AnalysisTask, AnalysisResult, qPCRData, WesternBlotData, AnalysisTemplate
 from .serializers import (
     DataFileSerializer, AnalysisTaskSerializer, AnalysisResultSerializer,
@@ -12,7 +17,7 @@ from .serializers import (
 )
 
 
-class DataFileViewSet(viewsets.ModelViewSet):
+class DataFileViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for DataFile CRUD operations."""
     
     queryset = DataFile.objects.all()
@@ -22,7 +27,8 @@ class DataFileViewSet(viewsets.ModelViewSet):
     filterset_fields = ['file_type', 'is_processed']
     search_fields = ['name', 'description']
     ordering_fields = ['uploaded_at', 'name']
-    ordering = ['-uploaded_at']
+    ordering = ['-uploaded_at', '-id']
+    pagination_class = KeysetOrPageNumberPagination
     
     def get_queryset(self):
         """Filter files based on user permissions."""
@@ -32,14 +38,27 @@ class DataFileViewSet(viewsets.ModelViewSet):
         return DataFile.objects.filter(uploaded_by=user)
     
     def perform_create(self, serializer):
-        """Set the uploader when creating a file."""
-        serializer.save(uploaded_by=self.request.user)
+        """Set the uploader when creating a file, sharing the blob and parsed rows of any identical file."""
+        data_file = serializer.save(
+            uploaded_by=self.request.user,
+            **deduplicate_upload(DataFile, 'file', serializer.validated_data.get('file'))
+        )
+        if reuse_parsed_data(data_file):
+            data_file.refresh_from_db()
+    
+    def perform_update(self, serializer):
+        """Store a replacement file by content hash like a new upload."""
+        serializer.save(**deduplicate_upload(DataFile, 'file', serializer.validated_data.get('file')))
     
     @action(detail=True, methods=['post'])
     def process(self, request, pk=None):
         """Process the uploaded file."""
         data_file = self.get_object()
         
+        source = reuse_parsed_data(data_file)
+        if source is not None:
+            return Response({'message': 'Reused the parsed data of an identical file', 'reused_from': str(source.id)})
+        
         # TODO: Implement file processing logic
         # This would involve:
         # 1. Parsing CSV files for qPCR data
@@ -49,7 +68,7 @@ class DataFileViewSet(viewsets.ModelViewSet):
         return Response({'message': 'File processing started'})
 
 
-class AnalysisTaskViewSet(viewsets.ModelViewSet):
+class AnalysisTaskViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for AnalysisTask CRUD operations."""
     
     queryset = AnalysisTask.objects.all()
@@ -59,7 +78,8 @@ class AnalysisTaskViewSet(viewsets.ModelViewSet):
     filterset_fields = ['task_type', 'status']
     search_fields = ['name', 'description']
     ordering_fields = ['created_at', 'completed_at']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    pagination_class = KeysetOrPageNumberPagination
     
     def get_queryset(self):
         """Filter tasks based on user permissions."""
@@ -86,7 +106,7 @@ class AnalysisTaskViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Analysis task started'})
 
 
-class AnalysisResultViewSet(viewsets.ModelViewSet):
+class AnalysisResultViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for AnalysisResult CRUD operations."""
     
     queryset = AnalysisResult.objects.all()
@@ -101,7 +121,7 @@ class AnalysisResultViewSet(viewsets.ModelViewSet):
         return AnalysisResult.objects.filter(task__created_by=user)
 
 
-class qPCRDataViewSet(viewsets.ModelViewSet):
+class qPCRDataViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for qPCRData CRUD operations."""
     
     queryset = qPCRData.objects.all()
@@ -116,7 +136,7 @@ class qPCRDataViewSet(viewsets.ModelViewSet):
         return qPCRData.objects.filter(data_file__uploaded_by=user)
 
 
-class WesternBlotDataViewSet(viewsets.ModelViewSet):
+class WesternBlotDataViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for WesternBlotData CRUD operations."""
     
     queryset = WesternBlotData.objects.all()
@@ -131,7 +151,7 @@ class WesternBlotDataViewSet(viewsets.ModelViewSet):
         return WesternBlotData.objects.filter(data_file__uploaded_by=user)
 
 
-class AnalysisTemplateViewSet(viewsets.ModelViewSet):
+class AnalysisTemplateViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for AnalysisTemplate CRUD operations."""
     
     queryset = AnalysisTemplate.objects.all()
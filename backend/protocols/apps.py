@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class ProtocolsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'protocols'
-    verbose_name = 'Protocol Builder' 
\ No newline at end of file
+    verbose_name = 'Protocol Builder'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
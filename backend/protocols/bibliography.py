@@ -0,0 +1,497 @@
+"""
+Streaming bulk import of bibliographies into ``ResearchPaper`` rows.
+
+BibTeX, RIS and PubMed XML files are parsed incrementally: records are
+yielded as soon as they are complete, and PubMed XML elements are freed as
+they are consumed, so memory use is bounded by one batch of records rather
+than by the size of the library. Records are checked against the
+importer's existing papers by DOI and PMID one batch at a time and
+inserted with one ``INSERT ... SELECT FROM unnest(...)`` per batch.
+"""
+
+import io
+import json
+import logging
+import re
+import uuid
+import xml.etree.ElementTree as ElementTree
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .dedup import normalize_doi, normalize_pmid
+from .keywords import schedule_keyword_update
+from .models import ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+Record = Dict[str, Any]
+
+MONTHS = {
+    name: number for number, names in enumerate((
+        ('jan', 'january'), ('feb', 'february'), ('mar', 'march'), ('apr', 'april'),
+        ('may',), ('jun', 'june'), ('jul', 'july'), ('aug', 'august'),
+        ('sep', 'sept', 'september'), ('oct', 'october'), ('nov', 'november'), ('dec', 'december'),
+    ), start=1) for name in names
+}
+
+YEAR_PATTERN = re.compile(r'\b(\d{4})\b')
+LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+\s*|\\(.)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def _date(year: Any, month: Any = None, day: Any = None) -> Optional[date]:
+    """Best-effort publication date; missing month and day default to 1."""
+    match = YEAR_PATTERN.search(str(year or ''))
+    if match is None:
+        return None
+    month = str(month or '').strip().lower().rstrip('.')
+    month_number = int(month) if month.isdigit() else MONTHS.get(month[:3], 1)
+    day = str(day or '').strip()
+    try:
+        return date(int(match.group(1)), month_number or 1, int(day) if day.isdigit() else 1)
+    except ValueError:
+        return date(int(match.group(1)), 1, 1)
+
+
+def _record(key: str, title: str = '', authors: Iterable[str] = (), abstract: str = '', doi: str = '',
+            pmid: str = '', journal: str = '', publication_date: Optional[date] = None) -> Record:
+    return {
+        'key': key,
+        'title': WHITESPACE.sub(' ', title or '').strip(),
+        'authors': [author for author in (WHITESPACE.sub(' ', author).strip() for author in authors) if author],
+        'abstract': (abstract or '').strip(),
+        'doi': normalize_doi(doi),
+        'pmid': normalize_pmid(pmid),
+        'journal': WHITESPACE.sub(' ', journal or '').strip(),
+        'publication_date': publication_date,
+    }
+
+
+# BibTeX
+
+ENTRY_START = re.compile(r'@\s*([a-zA-Z]+)\s*\{')
+BRACE = re.compile(r'[{}]')
+VALUE_DELIMITER = re.compile(r'[{}"]')
+
+
+def _bibtex_entries(stream: TextIO) -> Iterator[Tuple[str, str]]:
+    """Yield ``(type, body)`` for each ``@type{body}`` entry, reading line by line."""
+    entry_type, buffer, depth = None, [], 0
+    for line in stream:
+        position = 0
+        while position < len(line):
+            if entry_type is None:
+                match = ENTRY_START.search(line, position)
+                if match is None:
+                    break
+                entry_type, buffer, depth = match.group(1).lower(), [], 1
+                position = match.end()
+
+            for brace in BRACE.finditer(line, position):
+                depth += 1 if brace.group() == '{' else -1
+                if depth == 0:
+                    buffer.append(line[position:brace.start()])
+                    yield entry_type, ''.join(buffer)
+                    entry_type, position = None, brace.end()
+                    break
+            else:
+                buffer.append(line[position:])
+                break
+
+
+def _bibtex_value(body: str, position: int, strings: Dict[str, str]):
+    """Parse one (possibly ``#``-concatenated) field value starting at ``position``."""
+    parts = []
+    while position < len(body):
+        while position < len(body) and body[position].isspace():
+            position += 1
+        if position >= len(body):
+            break
+        char = body[position]
+        if char in '{"':
+            # Braced or quoted; quotes inside braces don't end a quoted value
+            depth, start, end = 1 if char == '{' else 0, position + 1, len(body)
+            for token in VALUE_DELIMITER.finditer(body, start):
+                if token.group() == '"':
+                    if char == '"' and depth == 0:
+                        end = token.start()
+                        break
+                    continue
+                depth += 1 if token.group() == '{' else -1
+                if char == '{' and depth == 0:
+                    end = token.start()
+                    break
+            parts.append(body[start:end])
+            position = end + 1
+        else:
+            start = position
+            while position < len(body) and body[position] not in ',#' and not body[position].isspace():
+                position += 1
+            word = body[start:position]
+            parts.append(strings.get(word.lower(), word))
+        while position < len(body) and body[position].isspace():
+            position += 1
+        if position < len(body) and body[position] == '#':
+            position += 1
+            continue
+        break
+    return ''.join(parts), position
+
+
+def _bibtex_fields(body: str, strings: Dict[str, str]) -> Dict[str, str]:
+    fields, position = {}, 0
+    while position < len(body):
+        equals = body.find('=', position)
+        if equals == -1:
+            break
+        name = body[position:equals].strip().strip(',').strip().lower()
+        value, position = _bibtex_value(body, equals + 1, strings)
+        fields[name] = value
+        comma = body.find(',', position)
+        position = len(body) if comma == -1 else comma + 1
+    return fields
+
+
+def _latex_text(value: str) -> str:
+    return LATEX_COMMAND.sub(lambda match: match.group(1) or '', value).replace('{', '').replace('}', '').replace('~', ' ')
+
+
+def _bibtex_authors(value: str) -> List[str]:
+    # Split on "and" outside braces ({Smith and Jones Lab} is one author)
+    authors, depth, start = [], 0, 0
+    for match in re.finditer(r'[{}]|\s+and\s+', value):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+        elif depth == 0:
+            authors.append(value[start:match.start()])
+            start = match.end()
+    authors.append(value[start:])
+    return [_latex_text(author) for author in authors if author.strip()]
+
+
+def parse_bibtex(stream: TextIO) -> Iterator[Record]:
+    """Yield a record per BibTeX entry; ``@string`` macros are expanded."""
+    strings: Dict[str, str] = {}
+    for entry_type, body in _bibtex_entries(stream):
+        if entry_type in ('comment', 'preamble'):
+            continue
+        if entry_type == 'string':
+            strings.update(_bibtex_fields(body, strings))
+            continue
+
+        key, _, rest = body.partition(',')
+        fields = _bibtex_fields(rest, strings)
+        yield _record(
+            key=key.strip(),
+            title=_latex_text(fields.get('title', '')),
+            authors=_bibtex_authors(fields.get('author', '')),
+            abstract=_latex_text(fields.get('abstract', '')),
+            doi=fields.get('doi', ''),
+            pmid=fields.get('pmid', ''),
+            journal=_latex_text(fields.get('journal') or fields.get('booktitle', '')),
+            publication_date=_date(fields.get('year'), fields.get('month'), fields.get('day')),
+        )
+
+
+# RIS
+
+RIS_LINE = re.compile(r'^([A-Z][A-Z0-9])  -(?: (.*))?$')
+
+
+def _ris_record(tags: Dict[str, List[str]], index: int) -> Record:
+    def first(*names):
+        for name in names:
+            if tags.get(name):
+                return tags[name][0]
+        return ''
+
+    date_parts = (first('DA', 'PY', 'Y1') + '///').split('/')
+    accession = first('AN')
+    return _record(
+        key=first('ID') or str(index),
+        title=first('TI', 'T1', 'CT', 'BT'),
+        authors=tags.get('AU', []) + tags.get('A1', []),
+        abstract=first('AB', 'N2'),
+        doi=first('DO'),
+        pmid=accession if accession.isdigit() else '',
+        journal=first('JO', 'JF', 'T2', 'JA', 'J2'),
+        publication_date=_date(date_parts[0], date_parts[1], date_parts[2]),
+    )
+
+
+def parse_ris(stream: TextIO) -> Iterator[Record]:
+    """Yield a record per RIS reference (``TY`` to ``ER``)."""
+    tags: Dict[str, List[str]] = {}
+    last, index = None, 0
+    for line in stream:
+        line = line.rstrip('\r\n')
+        match = RIS_LINE.match(line.lstrip('\ufeff'))
+        if match is None:
+            # Continuation of a wrapped value
+            if last and tags.get(last) and line.strip():
+                tags[last][-1] += ' ' + line.strip()
+            continue
+        tag, value = match.group(1), (match.group(2) or '').strip()
+        if tag == 'TY':
+            tags, last = {}, None
+        elif tag == 'ER':
+            index += 1
+            yield _ris_record(tags, index)
+            tags, last = {}, None
+        else:
+            tags.setdefault(tag, []).append(value)
+            last = tag
+
+
+# PubMed XML
+
+def _text(element: Optional[ElementTree.Element]) -> str:
+    return ''.join(element.itertext()) if element is not None else ''
+
+
+def _pubmed_record(article: ElementTree.Element) -> Record:
+    citation = article.find('MedlineCitation')
+    details = citation.find('Article') if citation is not None else None
+    if details is None:
+        details = ElementTree.Element('Article')
+
+    authors = []
+    for author in details.iterfind('AuthorList/Author'):
+        collective = author.findtext('CollectiveName')
+        if collective:
+            authors.append(collective)
+        else:
+            authors.append(' '.join(part for part in (author.findtext('ForeName'), author.findtext('LastName')) if part))
+
+    doi = article.findtext("PubmedData/ArticleIdList/ArticleId[@IdType='doi']") \
+        or details.findtext("ELocationID[@EIdType='doi']") or ''
+    pub_date = details.find('Journal/JournalIssue/PubDate')
+    publication_date = None
+    if pub_date is not None:
+        if pub_date.findtext('Year'):
+            publication_date = _date(pub_date.findtext('Year'), pub_date.findtext('Month'), pub_date.findtext('Day'))
+        else:
+            medline_date = (pub_date.findtext('MedlineDate') or '').split()
+            publication_date = _date(medline_date[0] if medline_date else None,
+                                     medline_date[1].split('-')[0] if len(medline_date) > 1 else None)
+
+    pmid = citation.findtext('PMID') if citation is not None else ''
+    return _record(
+        key=pmid or '',
+        title=_text(details.find('ArticleTitle')),
+        authors=authors,
+        abstract='\n'.join(_text(part) for part in details.iterfind('Abstract/AbstractText')),
+        doi=doi,
+        pmid=pmid or '',
+        journal=details.findtext('Journal/Title') or '',
+        publication_date=publication_date,
+    )
+
+
+def parse_pubmed_xml(stream) -> Iterator[Record]:
+    """Yield a record per ``PubmedArticle``, freeing each element once parsed."""
+    root = None
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if root is None:
+            root = element
+        if event == 'end' and element.tag == 'PubmedArticle':
+            yield _pubmed_record(element)
+            # Drop parsed articles so the tree never holds more than one
+            root.clear()
+
+
+PARSERS: Dict[str, Callable[[Any], Iterator[Record]]] = {
+    'bibtex': parse_bibtex,
+    'ris': parse_ris,
+    'pubmed': parse_pubmed_xml,
+}
+
+# Formats parsed from bytes rather than text
+BINARY_FORMATS = {'pubmed'}
+
+EXTENSIONS = {'.bib': 'bibtex', '.bibtex': 'bibtex', '.ris': 'ris', '.txt': 'ris', '.xml': 'pubmed'}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """Bibliography format for a file name, from its extension."""
+    name = (filename or '').lower()
+    for extension, bibliography_format in EXTENSIONS.items():
+        if name.endswith(extension):
+            return bibliography_format
+    return None
+
+
+def parse_bibliography(stream, bibliography_format: str) -> Iterator[Record]:
+    """Parse a binary stream in ``bibliography_format`` (one of ``PARSERS``)."""
+    if bibliography_format not in BINARY_FORMATS:
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace')
+    return PARSERS[bibliography_format](stream)
+
+
+# Import
+
+def _field_limit(name: str) -> Optional[int]:
+    return ResearchPaper._meta.get_field(name).max_length
+
+
+def _problem(record: Record) -> Optional[str]:
+    if not record['title']:
+        return 'Missing title'
+    for name in ('doi', 'pmid'):
+        if len(record[name]) > _field_limit(name):
+            return f"{name.upper()} is too long"
+    if record['pmid'] and not record['pmid'].isdigit():
+        return 'PMID is not numeric'
+    return None
+
+
+# Columns filled from each record; every other column gets its default
+RECORD_FIELDS = ('id', 'title', 'authors', 'abstract', 'doi', 'pmid', 'journal', 'publication_date')
+
+
+def _insert_papers(papers: List[Record], user):
+    """
+    Insert papers with a single statement binding one array per record column.
+
+    ``bulk_create`` prepares every field of every row in Python, which
+    costs more than the insert itself at this batch size; here only the
+    record columns vary and the other columns are bound once.
+    """
+    if not papers:
+        return
+    qn = connection.ops.quote_name
+    constants = {'uploaded_by': user.pk, 'uploaded_at': timezone.now()}
+
+    columns, selected, constant_params, arrays, array_params = [], [], [], [], []
+    for field in ResearchPaper._meta.concrete_fields:
+        columns.append(qn(field.column))
+        db_type = field.db_type(connection)
+        if field.name in RECORD_FIELDS:
+            values = [paper[field.name] for paper in papers]
+            if field.name == 'authors':
+                values = [json.dumps(value) for value in values]
+            arrays.append(f'%s::{db_type}[]')
+            array_params.append(values)
+            selected.append(f'rows.c{len(arrays)}')
+        else:
+            value = constants[field.name] if field.name in constants else field.get_default()
+            selected.append(f'%s::{db_type}')
+            constant_params.append(field.get_db_prep_save(value, connection))
+
+    sql = f"""
+        INSERT INTO {qn(ResearchPaper._meta.db_table)} ({', '.join(columns)})
+        SELECT {', '.join(selected)}
+        FROM unnest({', '.join(arrays)}) AS rows({', '.join(f'c{i}' for i in range(1, len(arrays) + 1))})
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, constant_params + array_params)
+
+
+def _import_batch(batch: List[Record], user, seen_dois: set, seen_pmids: set) -> Iterator[Dict[str, Any]]:
+    dois = {record['doi'] for record in batch if record['doi']}
+    pmids = {record['pmid'] for record in batch if record['pmid']}
+    existing_dois, existing_pmids = {}, {}
+    if dois or pmids:
+        for paper_id, doi, pmid in ResearchPaper.objects.filter(uploaded_by=user) \
+                .filter(Q(doi__in=dois) | Q(pmid__in=pmids)).values_list('id', 'doi', 'pmid'):
+            if doi:
+                existing_dois.setdefault(doi, paper_id)
+            if pmid:
+                existing_pmids.setdefault(pmid, paper_id)
+
+    title_limit, journal_limit = _field_limit('title'), _field_limit('journal')
+    papers, results = [], []
+    for record in batch:
+        result = {'index': record['index'], 'key': record['key'], 'title': record['title']}
+        duplicate_of = existing_dois.get(record['doi']) or existing_pmids.get(record['pmid'])
+        if duplicate_of or (record['doi'] and record['doi'] in seen_dois) or (record['pmid'] and record['pmid'] in seen_pmids):
+            result['status'] = 'duplicate'
+            result['paper_id'] = str(duplicate_of) if duplicate_of else None
+            results.append(result)
+            continue
+
+        if record['doi']:
+            seen_dois.add(record['doi'])
+        if record['pmid']:
+            seen_pmids.add(record['pmid'])
+        paper = {
+            **record,
+            'id': uuid.uuid4(),
+            'title': record['title'][:title_limit],
+            'journal': record['journal'][:journal_limit],
+        }
+        papers.append(paper)
+        result['status'] = 'created'
+        result['paper_id'] = str(paper['id'])
+        results.append(result)
+
+    _insert_papers(papers, user)
+    if papers:
+        # The raw insert skips post_save
+        schedule_keyword_update('paper', [paper['id'] for paper in papers])
+    yield from results
+
+
+def import_bibliography(stream, bibliography_format: str, user, batch_size: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    Import every record of a bibliography as a paper uploaded by ``user``.
+
+    Records whose DOI or PMID the user already has, or that repeat an
+    earlier record of the same file, are skipped.
+
+    Args:
+        stream: Binary file object
+        bibliography_format: One of ``PARSERS``
+        user: The importing user
+        batch_size: Records checked and inserted together; defaults to
+            ``BIBLIOGRAPHY_IMPORT_BATCH_SIZE``
+
+    Yields:
+        A report per record, in file order: its ``index`` (1-based),
+        ``key`` and ``title``, ``status`` (``created``, ``duplicate`` or
+        ``invalid``) and ``paper_id`` (the new or existing paper) or
+        ``error``
+    """
+    batch_size = batch_size or settings.BIBLIOGRAPHY_IMPORT_BATCH_SIZE
+    seen_dois, seen_pmids = set(), set()
+    # Reports in file order; valid records get theirs once their batch is imported
+    batch, reports = [], []
+    records = parse_bibliography(stream, bibliography_format)
+    index = 0
+    while True:
+        try:
+            record = next(records)
+        except StopIteration:
+            break
+        except (ElementTree.ParseError, ValueError) as e:
+            # The rest of the file cannot be parsed
+            logger.warning(f"Bibliography import stopped after {index} records: {str(e)}")
+            reports.append({'index': index + 1, 'key': '', 'title': '', 'status': 'invalid', 'error': str(e)})
+            break
+
+        index += 1
+        record['index'] = index
+        problem = _problem(record)
+        if problem:
+            reports.append({'index': index, 'key': record['key'], 'title': record['title'],
+                            'status': 'invalid', 'error': problem})
+        else:
+            batch.append(record)
+            reports.append(None)
+        if len(batch) >= batch_size:
+            yield from _merge(reports, _import_batch(batch, user, seen_dois, seen_pmids))
+            batch, reports = [], []
+
+    yield from _merge(reports, _import_batch(batch, user, seen_dois, seen_pmids))
+
+
+def _merge(reports: List[Optional[Dict[str, Any]]], imported: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    imported = iter(list(imported))
+    for report in reports:
+        yield report if report is not None else next(imported)
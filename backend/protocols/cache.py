@@ -0,0 +1,347 @@
+"""
+Content-addressed caches for LLM protocol generations, search results,
+protocol version diffs and extracted parameters.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt so trivially different requests share a cache key."""
+    return ' '.join(prompt.lower().split())
+
+
+class ProtocolGenerationCache:
+    """
+    Cache of parsed protocol dicts keyed on the normalized prompt and options.
+
+    Storage goes through the ``llm`` Django cache alias, which is an in-process
+    LRU cache in development and Redis (with ``allkeys-lru``) in production.
+    Entries expire after ``LLM_CACHE_TIMEOUT`` seconds.
+    """
+
+    KEY_PREFIX = 'protocol-generation'
+    STATS_KEYS = ('hits', 'misses', 'coalesced')
+
+    def __init__(self, alias: str = 'llm'):
+        self.cache = caches[alias]
+        self.timeout = settings.LLM_CACHE_TIMEOUT
+
+    def make_key(self, prompt: str, model_name: str, **options) -> str:
+        """Build the content address for a generation request."""
+        payload = json.dumps(
+            {'prompt': normalize_prompt(prompt), 'model': model_name, **options},
+            sort_keys=True
+        )
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached protocol data for ``key`` and record a hit or miss."""
+        data = self.cache.get(key)
+        self._incr('hits' if data is not None else 'misses')
+        return data
+
+    def set(self, key: str, data: Dict[str, Any]):
+        """Store parsed protocol data under ``key``."""
+        self.cache.set(key, data, self.timeout)
+
+    def acquire_inflight(self, key: str) -> bool:
+        """
+        Claim the right to generate ``key`` across all processes.
+
+        Returns False if another process is already generating it. The claim
+        expires after ``LLM_INFLIGHT_TIMEOUT`` seconds in case its owner dies.
+        """
+        return self.cache.add(self._inflight_key(key), 1, settings.LLM_INFLIGHT_TIMEOUT)
+
+    def release_inflight(self, key: str):
+        """Release a claim taken with ``acquire_inflight``."""
+        self.cache.delete(self._inflight_key(key))
+
+    def wait_for(self, key: str, poll_interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """
+        Wait for another process to finish generating ``key``.
+
+        Returns the cached result, or None if the owner released its claim
+        (or timed out) without storing one.
+        """
+        deadline = time.monotonic() + settings.LLM_INFLIGHT_TIMEOUT
+        while time.monotonic() < deadline:
+            data = self.cache.get(key)
+            if data is not None:
+                self._incr('coalesced')
+                return data
+            if self.cache.get(self._inflight_key(key)) is None:
+                return None
+            time.sleep(poll_interval)
+        return None
+
+    def claim_job(self, key: str, job_id: str) -> str:
+        """
+        Register ``job_id`` as the generation job for ``key``.
+
+        Returns the id of the job that owns ``key``: ``job_id`` itself, or the
+        id of an identical job that is already queued or running.
+        """
+        job_key = self._job_key(key)
+        if self.cache.add(job_key, job_id, settings.LLM_INFLIGHT_TIMEOUT):
+            return job_id
+        return self.cache.get(job_key) or job_id
+
+    def release_job(self, key: str):
+        """Forget the generation job registered for ``key``."""
+        self.cache.delete(self._job_key(key))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this cache."""
+        counters = self.cache.get_many([self._stats_key(name) for name in self.STATS_KEYS])
+        stats = {name: counters.get(self._stats_key(name), 0) for name in self.STATS_KEYS}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _job_key(self, key: str) -> str:
+        return f"{self.KEY_PREFIX}:job:{key}"
+
+    def _inflight_key(self, key: str) -> str:
+        return f"{key}:inflight"
+
+    def _stats_key(self, name: str) -> str:
+        return f"{self.KEY_PREFIX}:stats:{name}"
+
+    def _incr(self, name: str):
+        key = self._stats_key(name)
+        try:
+            # add() is a no-op if the counter exists, so incr() never misses
+            self.cache.add(key, 0, None)
+            self.cache.incr(key)
+        except ValueError:
+            logger.warning(f"Could not update LLM cache counter {name}")
+
+
+class SearchResultCache:
+    """
+    Cache of ranked protocol search hits, versioned by a global generation.
+
+    Keys include the current search generation, which is bumped whenever a
+    protocol or step changes; entries from older generations are never read
+    again and simply expire, so invalidation needs no key scan. Only ids and
+    ranking annotations are stored, so cached hits are re-fetched through the
+    caller's queryset and always reflect current row data and visibility.
+    """
+
+    KEY_PREFIX = 'protocol-search'
+    ANNOTATIONS = ('rank', 'headline', 'scores')
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+        self.timeout = settings.SEARCH_CACHE_TIMEOUT
+
+    def generation(self) -> int:
+        """Return the current search generation."""
+        generation = self.cache.get(self._generation_key())
+        if generation is None:
+            # Seed from the clock so a lost counter can't fall back to a
+            # generation that older entries were cached under
+            self.cache.add(self._generation_key(), time.time_ns() // 1_000_000, None)
+            generation = self.cache.get(self._generation_key())
+        return generation
+
+    def bump_generation(self):
+        """Invalidate every cached search result."""
+        try:
+            self.cache.incr(self._generation_key())
+        except ValueError:
+            self.generation()
+
+    def make_key(self, query: str, search_type: str, filters: Dict[str, Any],
+                 limit: int, scope: str) -> str:
+        """
+        Build the key for a search request in the current generation.
+
+        Args:
+            query: Search query (normalized like a prompt)
+            search_type: 'keyword', 'semantic' or 'both'
+            filters: Search filters
+            limit: Maximum number of results
+            scope: Identifies the set of protocols the caller may see
+        """
+        payload = json.dumps(
+            {
+                'query': normalize_prompt(query),
+                'search_type': search_type,
+                'filters': filters or {},
+                'limit': limit,
+                'scope': scope,
+            },
+            sort_keys=True
+        )
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return f"{self.KEY_PREFIX}:{self.generation()}:{digest}"
+
+    def get(self, key: str, queryset) -> Optional[List[Any]]:
+        """
+        Return the cached hits for ``key`` as protocols from ``queryset``.
+
+        Hits keep their cached order and ranking annotations; protocols no
+        longer in ``queryset`` are dropped. Returns None on a miss.
+        """
+        entries = self.cache.get(key)
+        if entries is None:
+            return None
+
+        protocols = queryset.in_bulk([entry['id'] for entry in entries])
+        results = []
+        for entry in entries:
+            protocol = protocols.get(entry['id'])
+            if protocol is not None:
+                for name in self.ANNOTATIONS:
+                    setattr(protocol, name, entry.get(name))
+                results.append(protocol)
+        return results
+
+    def set(self, key: str, protocols: List[Any]):
+        """Store the ids and ranking annotations of ``protocols`` under ``key``."""
+        entries = [
+            {'id': protocol.id, **{name: getattr(protocol, name, None) for name in self.ANNOTATIONS}}
+            for protocol in protocols
+        ]
+        self.cache.set(key, entries, self.timeout)
+
+    def _generation_key(self) -> str:
+        return f"{self.KEY_PREFIX}:generation"
+
+
+class ProtocolDiffCache:
+    """
+    Cache of computed diffs between two versions of a protocol.
+
+    Versions are immutable and their numbers are never reused, so an entry
+    stays valid until it expires after ``PROTOCOL_DIFF_CACHE_TIMEOUT``
+    seconds, or until compaction deletes versions of the protocol: keys
+    include a per-protocol history generation that ``invalidate`` bumps.
+    ``FORMAT`` is part of the key so a change to the diff layout never
+    serves entries in the old one.
+    """
+
+    KEY_PREFIX = 'protocol-diff'
+    FORMAT = 1
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+        self.timeout = settings.PROTOCOL_DIFF_CACHE_TIMEOUT
+
+    def generation(self, protocol_id) -> int:
+        """Return the current history generation of a protocol."""
+        key = self._generation_key(protocol_id)
+        generation = self.cache.get(key)
+        if generation is None:
+            # Seeded from the clock like SearchResultCache.generation
+            self.cache.add(key, time.time_ns() // 1_000_000, None)
+            generation = self.cache.get(key)
+        return generation
+
+    def invalidate(self, protocol_id):
+        """Invalidate every cached diff of a protocol."""
+        try:
+            self.cache.incr(self._generation_key(protocol_id))
+        except ValueError:
+            self.generation(protocol_id)
+
+    def make_key(self, protocol_id, from_version: int, to_version: int) -> str:
+        """Build the key for the diff from ``from_version`` to ``to_version``."""
+        generation = self.generation(protocol_id)
+        return f"{self.KEY_PREFIX}:{self.FORMAT}:{protocol_id}:{generation}:{from_version}:{to_version}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached diff for ``key``, or None on a miss."""
+        return self.cache.get(key)
+
+    def set(self, key: str, diff: Dict[str, Any]):
+        """Store a computed diff under ``key``."""
+        self.cache.set(key, diff, self.timeout)
+
+    def _generation_key(self, protocol_id) -> str:
+        return f"{self.KEY_PREFIX}:generation:{protocol_id}"
+
+
+class ParameterExtractionCache:
+    """
+    Cache of parameter extraction results keyed on a hash of the text.
+
+    ``VERSION`` is part of the key; bump it whenever extraction rules change
+    so results from the old rules are never served.
+    """
+
+    KEY_PREFIX = 'protocol-parameters'
+    VERSION = 4
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+        self.timeout = settings.PARAMETER_EXTRACTION_CACHE_TIMEOUT
+
+    def make_key(self, text: str, vocabulary: str = '') -> str:
+        """Build the key for ``text`` extracted with reagent ``vocabulary``."""
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.KEY_PREFIX}:{self.VERSION}:{vocabulary}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Return the cached results among ``keys``, by key."""
+        return self.cache.get_many(keys)
+
+    def set_many(self, results: Dict[str, Any]):
+        """Store extraction results by key."""
+        self.cache.set_many(results, self.timeout)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key within one process.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block and receive the same result (or exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,123 @@
+"""
+Deduplication of research papers.
+
+Papers with an identical PDF (same ``content_hash``) are the same paper,
+whoever uploaded them. A paper without a PDF of its own also matches the
+uploader's own papers with the same DOI or PMID; a DOI never matches
+another user's paper, whose text and file are private. PDFs are already
+shared through content-addressed storage (see ``prtcltech.uploads``); this
+module lets a new copy reuse the extracted text and passage index of a copy
+that has been extracted, instead of extracting and embedding it again.
+"""
+
+import logging
+import re
+from typing import Optional
+from django.db import connection, transaction
+from django.db.models import Subquery
+from .keywords import schedule_keyword_update
+from .models import PaperPassage, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+DOI_PREFIX = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+PMID_PREFIX = re.compile(r'^pmid:\s*', re.IGNORECASE)
+
+# Extraction results copied from a duplicate
+EXTRACTION_FIELDS = ('extracted_text', 'page_offsets', 'page_count')
+
+
+def normalize_doi(doi: str) -> str:
+    """Bare, lowercased DOI (DOIs are case-insensitive): ``10.1000/xyz123``."""
+    return DOI_PREFIX.sub('', (doi or '').strip()).lower()
+
+
+def normalize_pmid(pmid: str) -> str:
+    """Bare PubMed id: ``12345678``."""
+    return PMID_PREFIX.sub('', (pmid or '').strip())
+
+
+def find_extracted_duplicate(paper: ResearchPaper) -> Optional[ResearchPaper]:
+    """
+    Another copy of ``paper`` whose text has been extracted.
+
+    A paper with a PDF only matches copies of the same PDF content. One
+    without a PDF matches the uploader's own copies with the same DOI or
+    PMID.
+    """
+    extracted = ResearchPaper.objects.filter(extraction_status='completed').exclude(id=paper.id) \
+        .only('id', 'pdf_file', 'content_hash').order_by('uploaded_at')
+    if paper.content_hash:
+        return extracted.filter(content_hash=paper.content_hash).first()
+    if paper.pdf_file:
+        return None
+
+    own = extracted.filter(uploaded_by_id=paper.uploaded_by_id)
+    for field in ('doi', 'pmid'):
+        value = getattr(paper, field)
+        if value:
+            duplicate = own.filter(**{field: value}).first()
+            if duplicate is not None:
+                return duplicate
+    return None
+
+
+def copy_passages(source_id, target_id) -> int:
+    """
+    Replace the passage index of one paper with a copy of another's.
+
+    Runs as a single ``INSERT ... SELECT``; embeddings are copied, not
+    recomputed.
+
+    Returns:
+        Number of passages copied
+    """
+    qn = connection.ops.quote_name
+    columns = [
+        qn(field.column) for field in PaperPassage._meta.concrete_fields
+        if field.name not in ('id', 'paper')
+    ]
+    table = qn(PaperPassage._meta.db_table)
+
+    PaperPassage.objects.filter(paper_id=target_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, paper_id, {', '.join(columns)})
+            SELECT gen_random_uuid(), %s, {', '.join(columns)}
+            FROM {table} WHERE paper_id = %s
+            """,
+            [target_id, source_id]
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def reuse_extracted_content(paper: ResearchPaper) -> Optional[ResearchPaper]:
+    """
+    Fill in ``paper``'s extraction results from an extracted duplicate.
+
+    Text and page offsets are copied inside the database. A paper without
+    a PDF also gets the duplicate's file, which is then the uploader's own.
+
+    Returns:
+        The duplicate reused, or None if there is none
+    """
+    source = find_extracted_duplicate(paper)
+    if source is None:
+        return None
+
+    values = {
+        field: Subquery(ResearchPaper.objects.filter(id=source.id).values(field)[:1])
+        for field in EXTRACTION_FIELDS
+    }
+    if not paper.pdf_file and source.pdf_file:
+        values.update(pdf_file=source.pdf_file.name, content_hash=source.content_hash)
+    ResearchPaper.objects.filter(id=paper.id).update(
+        **values, extraction_status='completed', extraction_error='', extraction_task_id=''
+    )
+    passages = copy_passages(source.id, paper.id)
+    schedule_keyword_update('paper', [paper.id])
+
+    logger.info(f"Paper {paper.id} reused the extracted text and {passages} passages of paper {source.id}")
+    return source
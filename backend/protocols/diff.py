@@ -0,0 +1,203 @@
+"""
+Structural diffs between protocol versions.
+
+Steps are aligned by id, falling back to identical title and content for
+steps that were deleted and re-created, so alignment is linear in the
+number of steps. Steps whose relative order changed are found with a
+longest increasing subsequence over the aligned step numbers (O(n log n)):
+everything outside it moved, while steps merely renumbered by an insert or
+delete elsewhere do not count as moved.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Set
+from .cache import ProtocolDiffCache
+from .versioning import PROTOCOL_FIELDS, reconstruct_version
+
+# Step fields reported as experimental parameter changes
+PARAMETER_FIELDS = ('duration_minutes', 'temperature_celsius', 'alternatives')
+
+
+def _change(old: Any, new: Any) -> Dict[str, Any]:
+    return {'old': old, 'new': new}
+
+
+def _parameter_change(old: Any, new: Any) -> Dict[str, Any]:
+    change = _change(old, new)
+    if isinstance(old, list) and isinstance(new, list):
+        change['added'] = [item for item in new if item not in old]
+        change['removed'] = [item for item in old if item not in new]
+    elif old is not None and new is not None:
+        try:
+            change['delta'] = str(Decimal(str(new)) - Decimal(str(old)))
+        except InvalidOperation:
+            pass
+    return change
+
+
+def _step_ref(step_id: str, step: Dict[str, Any]) -> Dict[str, Any]:
+    return {'id': step_id, 'step_number': step.get('step_number'), 'title': step.get('title')}
+
+
+def _content_key(step: Dict[str, Any]):
+    return step.get('title'), step.get('content')
+
+
+def align_steps(old_steps: Dict[str, Dict], new_steps: Dict[str, Dict]) -> Dict[str, str]:
+    """
+    Pair the steps of two snapshots.
+
+    Returns:
+        Mapping of old step id to the id of the same step in ``new_steps``
+    """
+    pairs = {step_id: step_id for step_id in old_steps if step_id in new_steps}
+
+    # Deleted and re-created steps get new ids; match them on content
+    by_content = defaultdict(list)
+    for step_id, step in old_steps.items():
+        if step_id not in pairs:
+            by_content[_content_key(step)].append(step_id)
+    for step_id, step in new_steps.items():
+        if step_id in pairs:
+            continue
+        candidates = by_content.get(_content_key(step))
+        if candidates:
+            pairs[candidates.pop(0)] = step_id
+    return pairs
+
+
+def _longest_increasing(values: List[int]) -> Set[int]:
+    """Indices of a longest strictly increasing subsequence of ``values``."""
+    tails, tail_indices, previous = [], [], [None] * len(values)
+    for i, value in enumerate(values):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[k] = value
+            tail_indices[k] = i
+        previous[i] = tail_indices[k - 1] if k else None
+
+    kept, i = set(), tail_indices[-1] if tail_indices else None
+    while i is not None:
+        kept.add(i)
+        i = previous[i]
+    return kept
+
+
+def diff_steps(old_steps: Dict[str, Dict], new_steps: Dict[str, Dict]) -> Dict[str, List]:
+    """Added, removed, moved and modified steps between two snapshots' ``steps``."""
+    pairs = align_steps(old_steps, new_steps)
+    matched_new = set(pairs.values())
+
+    ordered = sorted(pairs, key=lambda step_id: old_steps[step_id]['step_number'])
+    in_order = _longest_increasing([new_steps[pairs[step_id]]['step_number'] for step_id in ordered])
+
+    moved, modified = [], []
+    for index, old_id in enumerate(ordered):
+        new_id = pairs[old_id]
+        old, new = old_steps[old_id], new_steps[new_id]
+        if index not in in_order:
+            moved.append({
+                **_step_ref(new_id, new),
+                'from_step_number': old['step_number'],
+                'to_step_number': new['step_number'],
+            })
+
+        fields, parameters = {}, {}
+        for field in sorted(new.keys() | old.keys()):
+            if field == 'step_number' or old.get(field) == new.get(field):
+                continue
+            if field in PARAMETER_FIELDS:
+                parameters[field] = _parameter_change(old.get(field), new.get(field))
+            else:
+                fields[field] = _change(old.get(field), new.get(field))
+        if fields or parameters:
+            entry = {**_step_ref(new_id, new), 'fields': fields, 'parameters': parameters}
+            if old_id != new_id:
+                entry['previous_id'] = old_id
+            modified.append(entry)
+
+    by_number = itemgetter('step_number')
+    return {
+        'added': sorted(
+            (_step_ref(step_id, step) for step_id, step in new_steps.items() if step_id not in matched_new),
+            key=by_number
+        ),
+        'removed': sorted(
+            (_step_ref(step_id, step) for step_id, step in old_steps.items() if step_id not in pairs),
+            key=by_number
+        ),
+        'moved': sorted(moved, key=by_number),
+        'modified': sorted(modified, key=by_number),
+    }
+
+
+def diff_reagents(old_reagents: Dict[str, Dict], new_reagents: Dict[str, Dict]) -> Dict[str, List]:
+    """Added, removed and modified reagents between two snapshots' ``reagents``."""
+    modified = []
+    for reagent_id in old_reagents.keys() & new_reagents.keys():
+        old, new = old_reagents[reagent_id], new_reagents[reagent_id]
+        fields = {
+            field: _change(old.get(field), new.get(field))
+            for field in sorted(old.keys() | new.keys()) if old.get(field) != new.get(field)
+        }
+        if fields:
+            modified.append({'id': reagent_id, 'name': new.get('name'), 'fields': fields})
+
+    return {
+        'added': [
+            {'id': reagent_id, **reagent} for reagent_id, reagent in new_reagents.items()
+            if reagent_id not in old_reagents
+        ],
+        'removed': [
+            {'id': reagent_id, **reagent} for reagent_id, reagent in old_reagents.items()
+            if reagent_id not in new_reagents
+        ],
+        'modified': modified,
+    }
+
+
+def diff_snapshots(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Structural diff between two protocol snapshots (see ``protocol_snapshot``)."""
+    return {
+        'fields': {
+            field: _change(old.get(field), new.get(field))
+            for field in PROTOCOL_FIELDS if old.get(field) != new.get(field)
+        },
+        'steps': diff_steps(old.get('steps', {}), new.get('steps', {})),
+        'reagents': diff_reagents(old.get('reagents', {}), new.get('reagents', {})),
+    }
+
+
+def diff_versions(protocol_id, from_version: int, to_version: int) -> Optional[Dict[str, Any]]:
+    """
+    Diff two versions of a protocol, using the diff cache.
+
+    Args:
+        protocol_id: The protocol
+        from_version: Version number to diff from
+        to_version: Version number to diff to; may be older than ``from_version``
+
+    Returns:
+        The diff (see ``diff_snapshots``) with both version numbers, or None
+        if either version does not exist
+    """
+    cache = ProtocolDiffCache()
+    key = cache.make_key(protocol_id, from_version, to_version)
+    diff = cache.get(key)
+    if diff is not None:
+        return diff
+
+    old = reconstruct_version(protocol_id, from_version)
+    new = reconstruct_version(protocol_id, to_version) if to_version != from_version else old
+    if old is None or new is None:
+        return None
+
+    diff = {'from_version': from_version, 'to_version': to_version, **diff_snapshots(old, new)}
+    cache.set(key, diff)
+    return diff
@@ -0,0 +1,352 @@
+"""
+Sentence embeddings for protocols: the shared prompt index behind the
+semantic cache, and the stored protocol and step embeddings behind
+semantic search.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Largest hnsw.ef_search pgvector accepts
+HNSW_MAX_EF_SEARCH = 1000
+
+# Restricted sets up to this size are scanned exactly instead of through the index
+EXACT_SCAN_MAX_ROWS = 5000
+
+
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    """Load the sentence-transformers model once per process."""
+    # Imported lazily so web processes that never embed don't pay for torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(settings.EMBEDDING_MODEL)
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """Embed ``texts`` into L2-normalized float32 vectors (one row per text)."""
+    model = get_embedding_model()
+    vectors = model.encode(list(texts), batch_size=64, normalize_embeddings=True,
+                           show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(f"{settings.EMBEDDING_MODEL}\n{text}".encode('utf-8')).hexdigest()
+
+
+def protocol_embedding_text(protocol) -> str:
+    """Text embedded for a protocol as a whole."""
+    return '\n'.join(part for part in (protocol.title, protocol.description, protocol.original_prompt) if part)
+
+
+def step_embedding_text(step) -> str:
+    """Text embedded for a single step."""
+    return f"{step.title}\n{step.content}"
+
+
+def update_protocol_embeddings(protocol_ids: Iterable) -> int:
+    """
+    Bring the stored embeddings of the given protocols and their steps up to date.
+
+    Only texts whose content hash changed are re-embedded, in one batch, and
+    written back with one INSERT and one UPDATE. Embeddings of deleted steps
+    go away with the steps themselves.
+
+    Returns:
+        Number of texts embedded
+    """
+    from .cache import SearchResultCache
+    from .models import Protocol, ProtocolEmbedding
+
+    protocols = list(Protocol.objects.filter(id__in=list(protocol_ids)).prefetch_related('steps'))
+    existing = {
+        (embedding.protocol_id, embedding.step_id): embedding
+        for embedding in ProtocolEmbedding.objects.filter(protocol__in=protocols).defer('embedding')
+    }
+
+    pending = []
+    for protocol in protocols:
+        texts = [(None, protocol_embedding_text(protocol))]
+        texts += [(step, step_embedding_text(step)) for step in protocol.steps.all()]
+        for step, text in texts:
+            content_hash = _content_hash(text)
+            current = existing.get((protocol.id, step.id if step else None))
+            if current is None or current.content_hash != content_hash:
+                pending.append((protocol, step, text, content_hash, current))
+
+    if not pending:
+        return 0
+
+    vectors = embed_texts([text for _, _, text, _, _ in pending])
+    to_create, to_update = [], []
+    for (protocol, step, _, content_hash, current), vector in zip(pending, vectors):
+        if current is None:
+            to_create.append(ProtocolEmbedding(
+                protocol=protocol, step=step, embedding=vector, content_hash=content_hash
+            ))
+        else:
+            current.embedding, current.content_hash = vector, content_hash
+            current.updated_at = timezone.now()
+            to_update.append(current)
+
+    with transaction.atomic():
+        # A concurrent run may have inserted the same rows; either copy is current
+        ProtocolEmbedding.objects.bulk_create(to_create, ignore_conflicts=True)
+        ProtocolEmbedding.objects.bulk_update(to_update, ['embedding', 'content_hash', 'updated_at'])
+        # Semantic rankings just changed without a protocol save
+        transaction.on_commit(SearchResultCache().bump_generation)
+
+    logger.info(f"Embedded {len(pending)} texts for {len(protocols)} protocols")
+    return len(pending)
+
+
+def step_vectors(steps: Sequence) -> np.ndarray:
+    """
+    Embeddings of ``steps``, one row per step, in order.
+
+    Stored step embeddings are reused when their content hash is current;
+    only the remaining steps are embedded, in one batch.
+    """
+    from .models import ProtocolEmbedding
+
+    texts = [step_embedding_text(step) for step in steps]
+    stored = {
+        (step_id, content_hash): vector
+        for step_id, content_hash, vector in ProtocolEmbedding.objects
+        .filter(step__in=[step.id for step in steps])
+        .values_list('step_id', 'content_hash', 'embedding')
+    }
+
+    vectors = np.zeros((len(steps), settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+    missing = []
+    for index, (step, text) in enumerate(zip(steps, texts)):
+        vector = stored.get((step.id, _content_hash(text)))
+        if vector is None:
+            missing.append(index)
+        else:
+            vectors[index] = vector
+    if missing:
+        vectors[missing] = embed_texts([texts[index] for index in missing])
+    return vectors
+
+
+def nearest_neighbours(queryset, vectors: Sequence, limit: int, fields: Sequence[str]) -> List[List[dict]]:
+    """
+    The ``limit`` rows of ``queryset`` nearest each of ``vectors``.
+
+    ``queryset`` (``ProtocolEmbedding`` or ``PaperPassage`` rows) carries
+    the caller's restrictions, such as visibility, so they apply inside the
+    vector query. All vectors are looked up in one query. An HNSW scan can
+    only post-filter the ``ef_search`` candidates it visits, so a set of at
+    most ``EXACT_SCAN_MAX_ROWS`` rows is scanned exactly right away; for a
+    larger one, vectors with a short result are retried with the widest
+    ``ef_search`` and then as an exact scan.
+
+    Returns:
+        Per vector, dicts of ``fields`` plus the cosine ``distance``,
+        nearest first
+    """
+    results = [[] for _ in vectors]
+    pending = list(range(len(vectors)))
+    if not pending:
+        return results
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        small = queryset.order_by().values('pk')[:EXACT_SCAN_MAX_ROWS + 1].count() <= EXACT_SCAN_MAX_ROWS
+        if not small:
+            for ef_search in sorted({min(max(settings.SEMANTIC_SEARCH_EF_SEARCH, limit), HNSW_MAX_EF_SEARCH),
+                                     HNSW_MAX_EF_SEARCH}):
+                # ef_search caps how many rows an HNSW scan can return
+                cursor.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+                for index, rows in zip(pending, _nearest_batch(cursor, queryset, [vectors[i] for i in pending],
+                                                               limit, fields)):
+                    results[index] = rows
+                pending = [index for index in pending if len(results[index]) < limit]
+                if not pending:
+                    break
+        if pending:
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            for index, rows in zip(pending, _nearest_batch(cursor, queryset, [vectors[i] for i in pending],
+                                                           limit, fields)):
+                results[index] = rows
+            cursor.execute("SET LOCAL enable_indexscan = on")
+    return results
+
+
+def _nearest_batch(cursor, queryset, vectors: Sequence, limit: int, fields: Sequence[str]) -> List[List[dict]]:
+    """Run the nearest-neighbour query for every vector in one ``LATERAL`` join."""
+    from django.db.models.expressions import RawSQL
+    from pgvector.django import CosineDistance
+    from pgvector.utils import to_db
+
+    nearest = queryset.annotate(distance=CosineDistance('embedding', RawSQL('q.vector', ()))) \
+        .order_by('distance').values(*fields, 'distance')[:limit]
+    sql, params = nearest.query.sql_with_params()
+    cursor.execute(
+        f"SELECT q.position, n.* FROM (VALUES {', '.join(['(%s, %s::vector)'] * len(vectors))}) "
+        f"AS q(position, vector) CROSS JOIN LATERAL ({sql}) AS n ORDER BY q.position, n.distance",
+        [value for position, vector in enumerate(vectors) for value in (position, to_db(vector))] + list(params)
+    )
+
+    # Raw rows skip the ORM's conversions (e.g. JSON decoding)
+    converters = [getattr(queryset.model._meta.get_field(name), 'from_db_value', None) for name in fields]
+    results = [[] for _ in vectors]
+    for position, *values, distance in cursor.fetchall():
+        row = {
+            name: converter(value, None, connection) if converter else value
+            for name, converter, value in zip(fields, converters, values)
+        }
+        row['distance'] = distance
+        results[position].append(row)
+    return results
+
+
+def schedule_embedding_update(protocol_ids: Iterable):
+    """Queue a background embedding refresh once the current transaction commits."""
+    from .tasks import embed_protocols_task
+
+    protocol_ids = [str(protocol_id) for protocol_id in protocol_ids]
+
+    def enqueue():
+        try:
+            embed_protocols_task.delay(protocol_ids)
+        except Exception as e:
+            # Semantic search degrades gracefully; never fail the write over it
+            logger.warning(f"Failed to queue embedding update for {protocol_ids}: {str(e)}")
+
+    transaction.on_commit(enqueue)
+
+
+class SemanticPromptIndex:
+    """
+    Cosine-similarity index over ``Protocol.original_prompt``, shared by all
+    processes through the ``llm`` Django cache.
+
+    Each prompt vector is stored under its own slot number, handed out by an
+    atomic ``incr``, so a prompt indexed by one process is visible to every
+    other one. A process keeps the vectors it has already read and fetches
+    only the newer slots on each search. The index is built from the database
+    when the cache has none, under a new generation so a rebuild never mixes
+    with the slots of an older one. It only stores protocol ids; callers
+    re-check existence and visibility against the database before using a hit.
+    """
+
+    KEY_PREFIX = 'semantic-prompt-index'
+
+    def __init__(self, alias: str = 'llm'):
+        self.cache = caches[alias]
+        self._lock = threading.Lock()
+        self._generation = None
+        self._loaded = 0
+        self._missing = set()
+        self._vectors = None
+        self._ids: List[str] = []
+
+    def rebuild(self) -> int:
+        """Re-embed every generated protocol prompt into a new generation and return it."""
+        from .models import Protocol
+
+        rows = list(
+            Protocol.objects.exclude(original_prompt='')
+            .order_by('generation_timestamp')
+            .values_list('id', 'original_prompt')
+        )
+        vectors = embed_texts([prompt for _, prompt in rows]) if rows else []
+
+        generation = time.time_ns()
+        self.cache.set_many({
+            self._slot_key(generation, slot): (str(protocol_id), vector)
+            for slot, ((protocol_id, _), vector) in enumerate(zip(rows, vectors), start=1)
+        }, None)
+        self.cache.set(self._count_key(generation), len(rows), None)
+        self.cache.set(self._generation_key(), generation, None)
+        logger.info(f"Rebuilt semantic prompt index with {len(rows)} prompts")
+        return generation
+
+    def add(self, protocol_id, prompt: str):
+        """Index a newly generated protocol's prompt."""
+        generation = self._current_generation()
+        vector = embed_texts([prompt])[0]
+        try:
+            slot = self.cache.incr(self._count_key(generation))
+        except ValueError:
+            # The counter was evicted; the database already has this prompt
+            self.rebuild()
+            return
+        self.cache.set(self._slot_key(generation, slot), (str(protocol_id), vector), None)
+
+    def search(self, prompt: str, threshold: float, limit: int = 5) -> List[str]:
+        """Return ids of indexed prompts with cosine similarity >= ``threshold``, best first."""
+        vectors, ids = self._sync()
+        if vectors is None:
+            return []
+
+        scores = vectors @ embed_texts([prompt])[0]
+        candidates = np.flatnonzero(scores >= threshold)
+        ranked = candidates[np.argsort(-scores[candidates])][:limit]
+        return [ids[i] for i in ranked]
+
+    def _current_generation(self) -> int:
+        generation = self.cache.get(self._generation_key())
+        return generation if generation is not None else self.rebuild()
+
+    def _sync(self):
+        """Read the slots added since the last search and return (vectors, ids)."""
+        generation = self._current_generation()
+        with self._lock:
+            if generation != self._generation:
+                self._generation, self._loaded, self._missing = generation, 0, set()
+                self._vectors, self._ids = None, []
+
+            count = self.cache.get(self._count_key(generation)) or 0
+            # Slots that were claimed but not yet written last time are retried
+            slots = sorted(self._missing | set(range(self._loaded + 1, count + 1)))
+            self._loaded = max(self._loaded, count)
+            entries = self.cache.get_many([self._slot_key(generation, slot) for slot in slots])
+
+            self._missing = set()
+            added = []
+            for slot in slots:
+                entry = entries.get(self._slot_key(generation, slot))
+                if entry is None:
+                    self._missing.add(slot)
+                else:
+                    self._ids.append(entry[0])
+                    added.append(entry[1])
+            if added:
+                rows = np.vstack(added)
+                self._vectors = rows if self._vectors is None else np.vstack([self._vectors, rows])
+            return self._vectors, list(self._ids)
+
+    def _generation_key(self) -> str:
+        return f"{self.KEY_PREFIX}:generation"
+
+    def _count_key(self, generation: int) -> str:
+        return f"{self.KEY_PREFIX}:{generation}:count"
+
+    def _slot_key(self, generation: int, slot: int) -> str:
+        return f"{self.KEY_PREFIX}:{generation}:{slot}"
+
+
+_prompt_index: Optional[SemanticPromptIndex] = None
+_prompt_index_lock = threading.Lock()
+
+
+def get_prompt_index() -> SemanticPromptIndex:
+    """Return this process's handle on the shared semantic prompt index."""
+    global _prompt_index
+    with _prompt_index_lock:
+        if _prompt_index is None:
+            _prompt_index = SemanticPromptIndex()
+        return _prompt_index
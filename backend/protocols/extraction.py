@@ -0,0 +1,260 @@
+"""
+Rule-based extraction of experimental parameters from protocol text.
+
+A single precompiled pattern finds every quantity (a number or range plus
+a unit) in one pass; the unit decides whether it is a temperature, time,
+concentration, volume or centrifugation speed, and converts it to SI:
+
+    temperatures    K        (°C, °F)
+    times           s        (ms, s, min, h, d)
+    concentrations  mol/m³   (M, mM, µM, nM, pM)
+                    kg/m³    (g/L, mg/mL, µg/mL, ...)
+                    1        (%, % (w/v), ...; stored as a fraction)
+    volumes         m³       (L, mL, µL, nL)
+    speeds          Hz       (rpm)
+                    m/s²     (×g)
+
+Reagents are found by name (a gazetteer of common reagents) and as the
+word following a concentration, e.g. "150 mM NaCl". Extraction is pure
+Python regex work, so batches run at thousands of texts per second; results
+are cached by text hash.
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .cache import ParameterExtractionCache
+
+CATEGORIES = ('temperatures', 'times', 'concentrations', 'volumes', 'speeds')
+
+_MICRO = '[µμu]'
+
+# (pattern, category, unit, SI unit, factor, offset): si = value * factor + offset
+UNITS: Tuple[Tuple[str, str, str, str, float, float], ...] = (
+    # A "C" without a degree sign only when attached to the number ("37C"):
+    # "Fig. 2 C" or "the 10 C-terminal residues" are not temperatures, and
+    # would show up as conflicts in cross-referencing
+    (r'°\s?C|º\s?C|˚\s?C|(?i:degrees?\s+(?:C|Celsius|centigrade))|(?i:deg\.?\s?C)|(?i:Celsius)'
+     r'|(?<=\d)C(?![\w\-])',
+     'temperatures', '°C', 'K', 1.0, 273.15),
+    (r'°\s?F|(?i:degrees?\s+(?:F|Fahrenheit))',
+     'temperatures', '°F', 'K', 5 / 9, 273.15 - 32 * 5 / 9),
+    # Abbreviations are lowercase only: "16S rRNA", "2 D gel", "2 H2O" and
+    # "5 MS runs" are not times
+    (r'ms|(?i:msecs?|milliseconds?)', 'times', 'ms', 's', 0.001, 0.0),
+    (r's|(?i:secs?|seconds?)', 'times', 's', 's', 1.0, 0.0),
+    (r'(?i:min|mins|minutes?)', 'times', 'min', 's', 60.0, 0.0),
+    (r'h|(?i:hrs?|hours?)', 'times', 'h', 's', 3600.0, 0.0),
+    (r'd|(?i:days?)', 'times', 'd', 's', 86400.0, 0.0),
+    # A bare "M" must follow the number directly or after one space and end
+    # the token: not "5\nM", "3M-tape" or "2 M's"
+    (r"mol/[Ll]|(?:(?<=\d)|(?<=\d ))M(?![\w\-'’/])", 'concentrations', 'M', 'mol/m³', 1000.0, 0.0),
+    (r'mmol/[Ll]|mM', 'concentrations', 'mM', 'mol/m³', 1.0, 0.0),
+    (_MICRO + r'mol/[Ll]|' + _MICRO + 'M', 'concentrations', 'µM', 'mol/m³', 1e-3, 0.0),
+    (r'nM', 'concentrations', 'nM', 'mol/m³', 1e-6, 0.0),
+    (r'pM', 'concentrations', 'pM', 'mol/m³', 1e-9, 0.0),
+    (r'g/[Ll]', 'concentrations', 'g/L', 'kg/m³', 1.0, 0.0),
+    (r'mg/m[Ll]', 'concentrations', 'mg/mL', 'kg/m³', 1.0, 0.0),
+    (r'mg/[Ll]', 'concentrations', 'mg/L', 'kg/m³', 1e-3, 0.0),
+    (_MICRO + r'g/m[Ll]', 'concentrations', 'µg/mL', 'kg/m³', 1e-3, 0.0),
+    (_MICRO + r'g/' + _MICRO + '[Ll]', 'concentrations', 'µg/µL', 'kg/m³', 1.0, 0.0),
+    (r'ng/m[Ll]', 'concentrations', 'ng/mL', 'kg/m³', 1e-6, 0.0),
+    (r'ng/' + _MICRO + '[Ll]', 'concentrations', 'ng/µL', 'kg/m³', 1e-3, 0.0),
+    (r'%\s*\(?\s*w/v\s*\)?', 'concentrations', '% (w/v)', '1', 0.01, 0.0),
+    (r'%\s*\(?\s*v/v\s*\)?', 'concentrations', '% (v/v)', '1', 0.01, 0.0),
+    (r'%\s*\(?\s*w/w\s*\)?', 'concentrations', '% (w/w)', '1', 0.01, 0.0),
+    (r'%', 'concentrations', '%', '1', 0.01, 0.0),
+    (r'[Ll]|(?i:lit(?:er|re)s?)', 'volumes', 'L', 'm³', 1e-3, 0.0),
+    (r'm[Ll]|(?i:millilit(?:er|re)s?)', 'volumes', 'mL', 'm³', 1e-6, 0.0),
+    (_MICRO + r'[Ll]|(?i:microlit(?:er|re)s?)', 'volumes', 'µL', 'm³', 1e-9, 0.0),
+    (r'n[Ll]', 'volumes', 'nL', 'm³', 1e-12, 0.0),
+    (r'(?i:rpm)', 'speeds', 'rpm', 'Hz', 1 / 60, 0.0),
+    (r'[x×]\s?g|(?i:rcf)', 'speeds', '×g', 'm/s²', 9.80665, 0.0),
+)
+
+_NUMBER = r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+'
+
+QUANTITY_PATTERN = re.compile(
+    r'(?<![\w.])(?P<sign>[-−])?(?P<value>' + _NUMBER + r')'
+    r'(?:\s*(?:-|–|—|to)\s*(?P<max_sign>[-−])?(?P<max_value>' + _NUMBER + r'))?'
+    r'\s*(?:' + '|'.join(f'(?P<u{i}>{unit[0]})' for i, unit in enumerate(UNITS)) + r')'
+    r'(?![A-Za-z])'
+)
+
+# The reagent a concentration applies to, e.g. "150 mM NaCl" or "0.1% Triton X-100"
+REAGENT_AFTER_PATTERN = re.compile(
+    r'[ \t]+(?:of[ \t]+)?(?P<name>[A-Za-z][\w+\-/]*(?:\([\w+\-/]*\))?(?:[ \t][A-Z]-?\d+)?)'
+)
+REAGENT_STOPWORDS = frozenset({
+    'a', 'an', 'and', 'at', 'each', 'final', 'for', 'from', 'gel', 'in', 'into',
+    'of', 'on', 'or', 'per', 'solution', 'stock', 'the', 'to', 'total',
+    'volume', 'volumes', 'with',
+})
+
+COMMON_REAGENTS = (
+    'NaCl', 'KCl', 'MgCl2', 'MgSO4', 'CaCl2', 'NaOH', 'HCl', 'Tris', 'Tris-HCl',
+    'HEPES', 'MOPS', 'EDTA', 'EGTA', 'DTT', 'PMSF', 'PBS', 'TBS', 'TBST', 'TAE',
+    'TBE', 'SDS', 'BSA', 'FBS', 'DMSO', 'DMEM', 'IPTG', 'DAPI', 'Triton X-100',
+    'Tween 20', 'Tween-20', 'NP-40', 'glycerol', 'ethanol', 'methanol',
+    'isopropanol', 'glucose', 'sucrose', 'agarose', 'paraformaldehyde', 'PFA',
+    'formaldehyde', 'glutaraldehyde', 'trypsin', 'Proteinase K', 'RNase A',
+    'DNase I', 'imidazole', 'sodium acetate', 'ammonium sulfate', 'acetic acid',
+    'β-mercaptoethanol', '2-mercaptoethanol', 'ampicillin', 'kanamycin',
+    'chloramphenicol', 'penicillin', 'streptomycin', 'phenol', 'chloroform',
+    'ethidium bromide', 'dNTPs', 'Taq polymerase', 'LB',
+)
+
+
+def _number(raw: str, sign: Optional[str]) -> float:
+    value = float(raw.replace(',', ''))
+    return -value if sign else value
+
+
+def _si(value: Optional[float], factor: float, offset: float) -> Optional[float]:
+    if value is None:
+        return None
+    # Drop float noise from the conversion (e.g. 0.30000000000000004)
+    return float(f'{value * factor + offset:.12g}')
+
+
+class ParameterExtractor:
+    """
+    Extract quantities and reagent mentions from free text.
+
+    Instances are immutable and thread-safe; build one per reagent
+    vocabulary and reuse it.
+    """
+
+    def __init__(self, reagent_names: Iterable[str] = COMMON_REAGENTS):
+        names = sorted(set(reagent_names), key=lambda name: (-len(name), name))
+        self.reagent_pattern = re.compile(
+            r'(?<![\w-])(?:' + '|'.join(re.escape(name) for name in names) + r')(?![\w-])',
+            re.IGNORECASE
+        ) if names else None
+        self.canonical_names = {name.lower(): name for name in names}
+        # Part of the cache key: a different vocabulary gives different results
+        self.fingerprint = hashlib.sha256('\n'.join(names).encode('utf-8')).hexdigest()[:16]
+
+    def extract(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Extract parameters from one text.
+
+        Returns:
+            Dict with a list per category in ``CATEGORIES`` plus ``reagents``.
+            Quantities carry the matched ``text`` and ``span``, ``value`` and
+            ``max_value`` (for ranges such as "5-10 min") in the written
+            ``unit``, and the same in ``si_unit``. Reagents carry ``name``,
+            ``span`` and, when given right before the name, ``concentration``.
+        """
+        result = {category: [] for category in CATEGORIES}
+        reagents: Dict[str, Dict[str, Any]] = {}
+
+        for match in QUANTITY_PATTERN.finditer(text):
+            _, category, unit, si_unit, factor, offset = UNITS[int(match.lastgroup[1:])]
+            start = match.start()
+            signed = category == 'temperatures'
+            if match.group('sign') and not signed:
+                # A hyphen, not a minus: "step-5 min"
+                start = match.start('value')
+            value = _number(match.group('value'), match.group('sign') if signed else None)
+            max_value = None
+            if match.group('max_value') is not None:
+                max_value = _number(match.group('max_value'), match.group('max_sign') if signed else None)
+
+            quantity = {
+                'text': text[start:match.end()],
+                'span': [start, match.end()],
+                'value': value,
+                'max_value': max_value,
+                'unit': unit,
+                'si_value': _si(value, factor, offset),
+                'si_max_value': _si(max_value, factor, offset),
+                'si_unit': si_unit,
+            }
+            result[category].append(quantity)
+
+            if category == 'concentrations':
+                following = REAGENT_AFTER_PATTERN.match(text, match.end())
+                if following:
+                    # Prefer a known multi-word name ("sodium acetate") to its first word
+                    known = self.reagent_pattern and self.reagent_pattern.match(text, following.start('name'))
+                    if known:
+                        name, span = self.canonical_names[known.group().lower()], known.span()
+                    else:
+                        name, span = following.group('name').rstrip('-/'), following.span('name')
+                    if name.lower() not in REAGENT_STOPWORDS:
+                        self._add_reagent(reagents, name, span, quantity)
+
+        if self.reagent_pattern is not None:
+            for match in self.reagent_pattern.finditer(text):
+                name = self.canonical_names.get(match.group().lower(), match.group())
+                self._add_reagent(reagents, name, list(match.span()), None)
+
+        result['reagents'] = sorted(reagents.values(), key=lambda reagent: reagent['span'][0])
+        return result
+
+    def extract_batch(self, texts: Iterable[str]) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """Extract parameters from each of ``texts``, without caching."""
+        extract = self.extract
+        return [extract(text) for text in texts]
+
+    @staticmethod
+    def _add_reagent(reagents: Dict[str, Dict[str, Any]], name: str, span, concentration):
+        key = name.lower()
+        existing = reagents.get(key)
+        if existing is None:
+            reagents[key] = {'name': name, 'span': list(span), 'concentration': concentration}
+        elif existing['concentration'] is None and concentration is not None:
+            existing['concentration'] = concentration
+
+
+_extractor = None
+
+
+def get_extractor() -> ParameterExtractor:
+    """Get the shared extractor for the built-in reagent vocabulary."""
+    global _extractor
+    if _extractor is None:
+        _extractor = ParameterExtractor()
+    return _extractor
+
+
+def extract_parameters_batch(texts: List[str], extractor: ParameterExtractor = None,
+                             use_cache: bool = True) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Extract parameters from many texts, e.g. every step of a protocol.
+
+    Repeated texts are extracted once, and with ``use_cache`` results are
+    read from and written to the extraction cache in one round trip each.
+    Results for identical texts are the same object; copy before mutating.
+
+    Args:
+        texts: Texts to extract from
+        extractor: Extractor to use; defaults to ``get_extractor()``
+        use_cache: Whether to use the extraction cache
+
+    Returns:
+        One result per text, in order (see ``ParameterExtractor.extract``)
+    """
+    extractor = extractor or get_extractor()
+    if not use_cache:
+        return extractor.extract_batch(texts)
+
+    cache = ParameterExtractionCache()
+    keys = {text: cache.make_key(text, extractor.fingerprint) for text in texts}
+    cached = cache.get_many(list(keys.values()))
+
+    results, computed = {}, {}
+    for text, key in keys.items():
+        if key in cached:
+            results[text] = cached[key]
+        else:
+            results[text] = computed[key] = extractor.extract(text)
+    if computed:
+        cache.set_many(computed)
+    return [results[text] for text in texts]
+
+
+def extract_parameters(text: str, use_cache: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+    """Extract parameters from one text (see ``extract_parameters_batch``)."""
+    return extract_parameters_batch([text], use_cache=use_cache)[0]
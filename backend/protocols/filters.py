@@ -0,0 +1,19 @@
+"""
+Filter sets for the protocols API.
+"""
+
+import django_filters
+from .models import Protocol
+
+
+class ProtocolFilter(django_filters.FilterSet):
+    """Filters for the protocol list; ``?tags=a,b`` matches protocols tagged with all of them."""
+    tags = django_filters.CharFilter(method='filter_tags')
+
+    class Meta:
+        model = Protocol
+        fields = ['is_public', 'author', 'tags']
+
+    def filter_tags(self, queryset, name, value):
+        tags = [tag.strip() for tag in value.split(',') if tag.strip()]
+        return queryset.filter(tags__contains=tags) if tags else queryset
\ No newline at end of file
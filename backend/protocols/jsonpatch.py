@@ -0,0 +1,143 @@
+"""
+Minimal JSON Patch (RFC 6902) support for editing serialized resources.
+"""
+
+import copy
+from typing import Any, Dict, List
+
+
+class JSONPatchError(ValueError):
+    """Raised when a patch document is malformed or cannot be applied."""
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JSONPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit():
+        raise JSONPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JSONPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(doc: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise JSONPatchError(f"Path not found: /{'/'.join(tokens)}")
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_list_index(doc, token)]
+        else:
+            raise JSONPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return doc
+
+
+def _add(doc: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _resolve(doc, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise JSONPatchError(f"Cannot add to a scalar at /{'/'.join(tokens)}")
+    return doc
+
+
+def _remove(doc: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        raise JSONPatchError("Cannot remove the whole document")
+    parent = _resolve(doc, tokens[:-1])
+    value = _resolve(parent, tokens[-1:])
+    if isinstance(parent, dict):
+        del parent[tokens[-1]]
+    else:
+        del parent[_list_index(parent, tokens[-1])]
+    return value
+
+
+def apply_patch(doc: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply JSON Patch ``operations`` to a copy of ``doc``.
+
+    Supports ``add``, ``remove``, ``replace``, ``move``, ``copy`` and ``test``.
+    The patch is atomic: ``doc`` is never modified, and any failing
+    operation raises ``JSONPatchError``.
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("A JSON Patch document must be a list of operations")
+
+    result = copy.deepcopy(doc)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JSONPatchError(f"Invalid operation: {operation!r}")
+        op, tokens = operation['op'], _parse_pointer(operation['path'])
+
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f"'{op}' operation requires a value")
+
+        if op == 'add':
+            result = _add(result, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(result, tokens)
+        elif op == 'replace':
+            if tokens:
+                _remove(result, tokens)
+            result = _add(result, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = _parse_pointer(operation.get('from', ''))
+            if op == 'move':
+                if tokens[:len(source)] == source and tokens != source:
+                    raise JSONPatchError("Cannot move a value into one of its children")
+                value = _remove(result, source)
+            else:
+                value = copy.deepcopy(_resolve(result, source))
+            result = _add(result, tokens, value)
+        elif op == 'test':
+            if _resolve(result, tokens) != operation['value']:
+                raise JSONPatchError(f"Test failed at {operation['path']}")
+        else:
+            raise JSONPatchError(f"Unsupported operation: {op!r}")
+
+    return result
+
+
+def _escape(token: str) -> str:
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def make_patch(source: Any, target: Any, path: str = '') -> List[Dict[str, Any]]:
+    """
+    Return JSON Patch operations that turn ``source`` into ``target``.
+
+    Objects are diffed key by key, so documents that key their collections
+    by id produce one operation per changed member. Any other differing
+    value (including lists) is replaced whole.
+    """
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = [
+            {'op': 'remove', 'path': f"{path}/{_escape(key)}"}
+            for key in source if key not in target
+        ]
+        for key, value in target.items():
+            member = f"{path}/{_escape(key)}"
+            if key not in source:
+                operations.append({'op': 'add', 'path': member, 'value': copy.deepcopy(value)})
+            else:
+                operations.extend(make_patch(source[key], value, member))
+        return operations
+
+    if source != target:
+        return [{'op': 'replace', 'path': path, 'value': copy.deepcopy(target)}]
+    return []
@@ -0,0 +1,269 @@
+"""
+Corpus-level TF-IDF keywords for research papers and protocols.
+
+A document's text is reduced to the counts of its
+``KEYWORD_TERMS_PER_DOCUMENT`` most frequent terms (words and two-word
+phrases without stopwords), stored on the document as ``keyword_terms``.
+``KeywordDocumentFrequency`` counts the documents each term is indexed
+for. Whenever a document is indexed or deleted, those counts change by the
+difference between its old and new terms, in one statement, so corpus
+statistics are never recomputed from scratch.
+
+Keywords are the ``KEYWORDS_PER_DOCUMENT`` terms with the highest TF-IDF
+against the statistics at the time they were scored. ``rescore_keywords``
+re-ranks any batch of documents against the current statistics in one
+vectorized pass over their stored term counts.
+
+Keywords are derived data: saving them doesn't touch ``updated_at``, so
+they never invalidate a protocol's ETag and a cached representation may
+show keywords from before the last re-index.
+"""
+
+import logging
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from .models import KeywordDocumentFrequency, Protocol, ProtocolStep, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z][a-z0-9]*(?:-[a-z0-9]+)*')
+MIN_WORD_LENGTH = 3
+MAX_TERM_LENGTH = 100
+
+# KeywordDocumentFrequency row counting every indexed document
+CORPUS_TERM = ''
+
+STOPWORDS = frozenset('''
+    about above after again against all also among and any are because been before being below between
+    both but can could did does doing done down during each either few for from further had has have
+    having her here hers herself him himself his how however into its itself just may might more most
+    much must near nor not now off once only other our ours ourselves out over own same see she should
+    since some such than that the their theirs them themselves then there these they this those
+    through thus too under until upon use used using very was were what when where whether which while
+    who whom whose why will with within without would yet you your yours yourself yourselves
+    fig figure figures table tables et al respectively
+'''.split())
+
+DOCUMENT_MODELS = {'paper': ResearchPaper, 'protocol': Protocol}
+
+
+def term_counts(text: str, limit: int = None) -> Dict[str, int]:
+    """
+    Count the terms of ``text``: words of three or more letters that are
+    not stopwords, and pairs of such words with only whitespace between.
+
+    Returns:
+        The ``limit`` (default ``KEYWORD_TERMS_PER_DOCUMENT``) most frequent
+        terms and their counts
+    """
+    limit = limit or settings.KEYWORD_TERMS_PER_DOCUMENT
+    text = text.lower()
+    counts = Counter()
+    previous, previous_end = None, 0
+    for match in TOKEN_PATTERN.finditer(text):
+        word = match.group()
+        if len(word) < MIN_WORD_LENGTH or word in STOPWORDS or len(word) > MAX_TERM_LENGTH:
+            previous = None
+            continue
+        counts[word] += 1
+        if previous is not None and not text[previous_end:match.start()].strip():
+            phrase = f"{previous} {word}"
+            if len(phrase) <= MAX_TERM_LENGTH:
+                counts[phrase] += 1
+        previous, previous_end = word, match.end()
+    return dict(counts.most_common(limit))
+
+
+def _documents(kind: str, ids: Iterable) -> List[Tuple[object, str]]:
+    """Lock the given documents and return each with its text."""
+    if kind == 'paper':
+        papers = ResearchPaper.objects.select_for_update().filter(id__in=list(ids)) \
+            .only('id', 'title', 'abstract', 'extracted_text', 'keyword_terms', 'keywords')
+        return [
+            (paper, '\n'.join(part for part in (paper.title, paper.abstract, paper.extracted_text) if part))
+            for paper in papers
+        ]
+
+    protocols = Protocol.objects.select_for_update().filter(id__in=list(ids)) \
+        .only('id', 'title', 'description', 'keyword_terms', 'keywords') \
+        .prefetch_related(Prefetch('steps', queryset=ProtocolStep.objects.only('protocol_id', 'title', 'content')))
+    return [
+        (protocol, '\n'.join([protocol.title, protocol.description] + [
+            f"{step.title}\n{step.content}" for step in protocol.steps.all()
+        ]))
+        for protocol in protocols
+    ]
+
+
+def _apply_deltas(deltas: Dict[str, int]):
+    """Add ``deltas`` to the document frequencies with one upsert."""
+    deltas = {term: delta for term, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # A consistent row order keeps concurrent updates from deadlocking
+    terms = sorted(deltas)
+    table = connection.ops.quote_name(KeywordDocumentFrequency._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (term, documents)
+            SELECT * FROM unnest(%s::varchar[], %s::integer[])
+            ON CONFLICT (term) DO UPDATE SET documents = {table}.documents + EXCLUDED.documents
+            """,
+            [terms, [deltas[term] for term in terms]]
+        )
+        removed = [term for term in terms if deltas[term] < 0 and term != CORPUS_TERM]
+        if removed:
+            cursor.execute(f"DELETE FROM {table} WHERE term = ANY(%s) AND documents <= 0", [removed])
+
+
+def document_frequencies(terms: List[str]) -> Tuple[int, Dict[str, int]]:
+    """
+    Returns:
+        The number of indexed documents, and the document frequency of
+        each of ``terms`` that has one
+    """
+    table = connection.ops.quote_name(KeywordDocumentFrequency._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT term, documents FROM {table} WHERE term = ANY(%s)", [[CORPUS_TERM, *terms]])
+        frequencies = dict(cursor.fetchall())
+    return frequencies.pop(CORPUS_TERM, 0), frequencies
+
+
+def score_keywords(documents: List[Dict[str, int]], limit: int = None) -> List[List[str]]:
+    """
+    Rank the terms of many documents by TF-IDF at once.
+
+    Term counts for the whole batch are laid out as one sparse matrix
+    (row, column and count arrays), scored with sublinear term frequency
+    and smoothed inverse document frequency, and the top terms of every
+    row are selected with a single sort.
+
+    Args:
+        documents: Term counts per document (see ``term_counts``)
+        limit: Keywords per document; defaults to ``KEYWORDS_PER_DOCUMENT``
+
+    Returns:
+        Keywords per document, best first
+    """
+    limit = limit or settings.KEYWORDS_PER_DOCUMENT
+    vocabulary: Dict[str, int] = {}
+    rows, columns, counts = [], [], []
+    for row, terms in enumerate(documents):
+        for term, count in terms.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    if not counts:
+        return [[] for _ in documents]
+
+    terms = list(vocabulary)
+    total, frequencies = document_frequencies(terms)
+    document_frequency = np.fromiter((frequencies.get(term, 0) for term in terms), dtype=np.float64, count=len(terms))
+    idf = np.log((1 + total) / (1 + document_frequency)) + 1
+
+    rows, columns = np.asarray(rows), np.asarray(columns)
+    scores = (1 + np.log(np.asarray(counts, dtype=np.float64))) * idf[columns]
+
+    # By document, best score first; keep each document's first ``limit`` entries
+    order = np.lexsort((-scores, rows))
+    sorted_rows = rows[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows, side='left')
+    keywords = [[] for _ in documents]
+    for index in order[rank < limit]:
+        keywords[rows[index]].append(terms[columns[index]])
+    return keywords
+
+
+@transaction.atomic
+def update_keywords(kind: str, ids: Iterable) -> int:
+    """
+    Index the current text of some papers or protocols and assign their keywords.
+
+    Document frequencies are adjusted by the terms each document gained
+    and lost since it was last indexed.
+
+    Args:
+        kind: ``'paper'`` or ``'protocol'``
+        ids: Documents to index; missing ids are ignored
+
+    Returns:
+        Number of documents indexed
+    """
+    model = DOCUMENT_MODELS[kind]
+    documents = _documents(kind, ids)
+
+    deltas = Counter()
+    for document, text in documents:
+        old, new = document.keyword_terms or {}, term_counts(text)
+        for term in new.keys() - old.keys():
+            deltas[term] += 1
+        for term in old.keys() - new.keys():
+            deltas[term] -= 1
+        deltas[CORPUS_TERM] += bool(new) - bool(old)
+        document.keyword_terms = new
+    _apply_deltas(deltas)
+
+    documents = [document for document, _ in documents]
+    for document, keywords in zip(documents, score_keywords([document.keyword_terms for document in documents])):
+        document.keywords = keywords
+    model.objects.bulk_update(documents, ['keyword_terms', 'keywords'])
+
+    logger.info(f"Indexed keywords of {len(documents)} {kind}s")
+    return len(documents)
+
+
+def forget_terms(keyword_terms: Iterable[Dict[str, int]]):
+    """Remove deleted documents' terms from the document frequencies."""
+    deltas = Counter()
+    for terms in keyword_terms:
+        if terms:
+            deltas.subtract(dict.fromkeys(terms, 1))
+            deltas[CORPUS_TERM] -= 1
+    _apply_deltas(deltas)
+
+
+@transaction.atomic
+def rescore_keywords(kind: str, ids: Iterable) -> List:
+    """
+    Re-rank the keywords of some papers or protocols against the current
+    document frequencies, without re-reading their text.
+
+    Args:
+        kind: ``'paper'`` or ``'protocol'``
+        ids: Document ids, or a queryset of them (used as a subquery)
+
+    Returns:
+        The documents, with ``id`` and updated ``keywords``
+    """
+    model = DOCUMENT_MODELS[kind]
+    documents = list(model.objects.filter(id__in=ids).only('id', 'keyword_terms', 'keywords'))
+    changed = []
+    for document, keywords in zip(documents, score_keywords([document.keyword_terms for document in documents])):
+        if keywords != document.keywords:
+            document.keywords = keywords
+            changed.append(document)
+    if changed:
+        model.objects.bulk_update(changed, ['keywords'])
+    return documents
+
+
+def schedule_keyword_update(kind: str, ids: Iterable):
+    """Queue a background keyword update once the current transaction commits."""
+    from .tasks import update_keywords_task
+
+    ids = [str(document_id) for document_id in ids]
+
+    def enqueue():
+        try:
+            update_keywords_task.delay(kind, ids)
+        except Exception as e:
+            # Keywords only feed search; never fail the write over them
+            logger.warning(f"Failed to queue keyword update for {kind}s {ids}: {str(e)}")
+
+    transaction.on_commit(enqueue)
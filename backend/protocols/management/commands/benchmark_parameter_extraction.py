@@ -0,0 +1,57 @@
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from protocols.extraction import CATEGORIES, get_extractor
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / 'benchmarks' / 'parameter_corpus.jsonl'
+
+
+class Command(BaseCommand):
+    help = 'Measure parameter extraction accuracy and throughput on an annotated corpus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS),
+                            help='JSON Lines file of {"text", "expected"} records')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Times the corpus is extracted for the throughput run')
+
+    def handle(self, *args, **options):
+        with open(options['corpus'], encoding='utf-8') as corpus:
+            records = [json.loads(line) for line in corpus if line.strip()]
+        extractor = get_extractor()
+
+        scores = {category: Counter() for category in (*CATEGORIES, 'reagents')}
+        for record, result in zip(records, extractor.extract_batch(r['text'] for r in records)):
+            for category, counts in scores.items():
+                expected = Counter(self._keys(category, record['expected'].get(category, [])))
+                found = Counter(self._keys(category, result[category]))
+                counts['tp'] += sum((expected & found).values())
+                counts['fp'] += sum((found - expected).values())
+                counts['fn'] += sum((expected - found).values())
+
+        for category, counts in scores.items():
+            precision = counts['tp'] / ((counts['tp'] + counts['fp']) or 1)
+            recall = counts['tp'] / ((counts['tp'] + counts['fn']) or 1)
+            self.stdout.write(f'{category:15} precision {precision:.3f}  recall {recall:.3f}  '
+                              f'({counts["tp"]} tp, {counts["fp"]} fp, {counts["fn"]} fn)')
+
+        texts = [record['text'] for record in records] * options['repeat']
+        started = time.perf_counter()
+        extractor.extract_batch(texts)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Extracted {len(texts)} texts in {elapsed:.2f}s ({len(texts) / elapsed:,.0f} texts/s, uncached)'
+        ))
+
+    @staticmethod
+    def _keys(category, items):
+        if category == 'reagents':
+            return [(item if isinstance(item, str) else item['name']).lower() for item in items]
+        return [
+            tuple(item) if isinstance(item, list) else (item['value'], item['max_value'], item['unit'])
+            for item in items
+        ]
\ No newline at end of file
@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from protocols.versioning import compact_all_versions, compact_versions
+
+
+class Command(BaseCommand):
+    help = 'Thin out old protocol version history and re-encode it as keyframes and deltas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--protocol', help='Only compact this protocol id')
+        parser.add_argument('--days', type=int, default=settings.PROTOCOL_VERSION_RETENTION_DAYS,
+                            help='Keep every version newer than this many days')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        if options['protocol']:
+            removed = compact_versions(options['protocol'], before)
+        else:
+            removed = compact_all_versions(before)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} protocol versions'))
\ No newline at end of file
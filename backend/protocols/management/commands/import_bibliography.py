@@ -0,0 +1,45 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from protocols.bibliography import PARSERS, detect_format, import_bibliography
+
+
+class Command(BaseCommand):
+    help = 'Import a BibTeX, RIS or PubMed XML bibliography as research papers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Bibliography file')
+        parser.add_argument('--user', required=True, help='Username the papers are uploaded by')
+        parser.add_argument('--format', choices=list(PARSERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, help='Records inserted per batch')
+        parser.add_argument('--report', help='Write one JSON line per record to this file')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+        bibliography_format = options['format'] or detect_format(options['path'])
+        if bibliography_format is None:
+            raise CommandError('Cannot tell the bibliography format from the file name; pass --format')
+
+        counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+        report = open(options['report'], 'w', encoding='utf-8') if options['report'] else None
+        try:
+            with open(options['path'], 'rb') as stream:
+                for record in import_bibliography(stream, bibliography_format, user, options['batch_size']):
+                    counts[record['status']] += 1
+                    if report is not None:
+                        report.write(json.dumps(record) + '\n')
+                    if record['status'] == 'invalid':
+                        self.stderr.write(f"Record {record['index']} ({record['key']}): {record['error']}")
+        finally:
+            if report is not None:
+                report.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['created']} papers, skipped {counts['duplicate']} duplicates "
+            f"and {counts['invalid']} invalid records"
+        ))
\ No newline at end of file
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from protocols.models import ResearchPaper
+from protocols.passages import index_paper_passages
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the passage index used to cross-reference protocols against research papers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paper', help='Only index this paper id')
+
+    def handle(self, *args, **options):
+        papers = ResearchPaper.objects.exclude(extracted_text='')
+        if options['paper']:
+            papers = papers.filter(id=options['paper'])
+        paper_ids = list(papers.values_list('id', flat=True))
+        passages = sum(index_paper_passages(paper_id) for paper_id in paper_ids)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {passages} passages of {len(paper_ids)} papers'))
\ No newline at end of file
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from protocols.embeddings import update_protocol_embeddings
+from protocols.models import Protocol
+
+
+class Command(BaseCommand):
+    help = 'Compute missing or stale semantic search embeddings for every protocol.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Protocols embedded per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        protocol_ids = list(Protocol.objects.order_by('created_at').values_list('id', flat=True))
+        embedded = 0
+        for start in range(0, len(protocol_ids), batch_size):
+            embedded += update_protocol_embeddings(protocol_ids[start:start + batch_size])
+            self.stdout.write(f'Processed {min(start + batch_size, len(protocol_ids))}/{len(protocol_ids)} protocols')
+        self.stdout.write(self.style.SUCCESS(f'Embedded {embedded} protocol and step texts'))
\ No newline at end of file
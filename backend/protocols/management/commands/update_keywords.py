@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from protocols.keywords import DOCUMENT_MODELS, rescore_keywords, update_keywords
+
+
+class Command(BaseCommand):
+    help = 'Index the TF-IDF keywords of research papers and protocols, or re-rank them against current corpus statistics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(DOCUMENT_MODELS), help='Only papers or only protocols')
+        parser.add_argument('--batch-size', type=int, default=500, help='Documents per transaction')
+        parser.add_argument('--rescore', action='store_true',
+                            help='Re-rank stored term counts instead of re-reading document text')
+
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else list(DOCUMENT_MODELS)
+        batch_size = options['batch_size']
+        for kind in kinds:
+            ids = list(DOCUMENT_MODELS[kind].objects.order_by('id').values_list('id', flat=True))
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                if options['rescore']:
+                    rescore_keywords(kind, batch)
+                else:
+                    update_keywords(kind, batch)
+            action = 'Rescored' if options['rescore'] else 'Indexed'
+            self.stdout.write(self.style.SUCCESS(f'{action} keywords of {len(ids)} {kind}s'))
\ No newline at end of file
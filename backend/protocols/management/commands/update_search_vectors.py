@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from protocols.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search document for every protocol.'
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors()
+        self.stdout.write(self.style.SUCCESS(f'Updated search vectors for {updated} protocols'))
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
+from pgvector.django import HnswIndex, VectorField
+from prtcltech.uploads import ContentAddressedUploadTo
 import uuid
 
 
@@ -21,8 +26,31 @@ class Protocol(models.Model):
     llm_model_used = models.CharField(max_length=100, blank=True)
     generation_timestamp = models.DateTimeField(null=True, blank=True)
     
+    # Lineage: the protocol this one was duplicated from (indexed below)
+    forked_from = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='forks', db_index=False
+    )
+    
+    # Full-text search document (title, description, prompt and step content),
+    # maintained by protocols.search.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # TF-IDF keywords and the term counts behind them (see protocols.keywords)
+    keywords = models.JSONField(default=list, blank=True)
+    keyword_terms = models.JSONField(default=dict, blank=True, editable=False)
+    
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Keyset pagination: visible-to-all and per-author listings
+            models.Index(fields=['-updated_at', '-id'], name='protocol_updated_id_idx'),
+            models.Index(fields=['author', '-updated_at', '-id'], name='protocol_author_updated_idx'),
+            # Forks of a protocol, newest first
+            models.Index(fields=['forked_from', '-updated_at', '-id'], name='protocol_forked_from_idx'),
+            GinIndex(fields=['search_vector'], name='protocol_search_vector_idx'),
+            GinIndex(fields=['title'], name='protocol_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
     
     def __str__(self):
         return self.title
@@ -75,6 +103,10 @@ class Reagent(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Fuzzy name lookup (protocols.search.fuzzy_reagent_search)
+            GinIndex(fields=['name'], name='reagent_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.concentration} {self.unit})"
@@ -92,25 +124,88 @@ class ResearchPaper(models.Model):
     publication_date = models.DateField(null=True, blank=True)
     journal = models.CharField(max_length=200, blank=True)
     
-    # File storage
-    pdf_file = models.FileField(upload_to='papers/', null=True, blank=True)
+    # File storage; PDFs are stored by content hash and shared by identical uploads
+    pdf_file = models.FileField(upload_to=ContentAddressedUploadTo('papers'), null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of pdf_file
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_papers')
     uploaded_at = models.DateTimeField(default=timezone.now)
     
-    # Content extraction
+    EXTRACTION_STATUSES = [
+        ('', 'Not started'),
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Content extraction (protocols.pdf_extraction). page_offsets[i] is where
+    # page i + 1 starts in extracted_text; it grows as pages are extracted.
     extracted_text = models.TextField(blank=True)
+    # TF-IDF keywords and the term counts behind them (see protocols.keywords)
     keywords = models.JSONField(default=list, blank=True)
+    keyword_terms = models.JSONField(default=dict, blank=True, editable=False)
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_STATUSES, blank=True)
+    extraction_task_id = models.CharField(max_length=255, blank=True)
+    extraction_error = models.TextField(blank=True)
+    # Last claim or progress of a pending/running extraction; a claim that goes
+    # quiet for PDF_EXTRACTION_STALE_AFTER seconds (e.g. a killed worker) can be retaken
+    extraction_updated_at = models.DateTimeField(null=True, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    page_offsets = models.JSONField(default=list, blank=True)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Second deduplication key after the content hash (see protocols.dedup)
+            models.Index(fields=['doi'], name='researchpaper_doi_idx'),
+            models.Index(fields=['pmid'], name='researchpaper_pmid_idx'),
+        ]
     
     def __str__(self):
         return self.title
 
 
+class PaperPassage(models.Model):
+    """An overlapping window of a paper's extracted text, embedded for cross-referencing."""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    paper = models.ForeignKey(ResearchPaper, on_delete=models.CASCADE, related_name='passages')
+    position = models.PositiveIntegerField()  # Order within the paper
+    page_number = models.PositiveIntegerField(null=True, blank=True)
+    start_offset = models.PositiveIntegerField()  # Into the paper's extracted_text
+    text = models.TextField()
+    # Summary of the extracted parameters (see protocols.passages.parameter_summary)
+    parameters = models.JSONField(default=dict, blank=True)
+    embedding = VectorField(dimensions=settings.EMBEDDING_DIMENSIONS)
+    
+    class Meta:
+        ordering = ['paper', 'position']
+        indexes = [
+            HnswIndex(
+                name='paper_passage_hnsw_idx',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_cosine_ops'],
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['paper', 'position'], name='unique_paper_passage_position'),
+        ]
+    
+    def __str__(self):
+        return f"{self.paper.title} passage {self.position}"
+
+
 class ProtocolReference(models.Model):
     """Model for linking protocols to research papers and other sources."""
     
+    # Set on references found by automatic cross-referencing
+    RELATIONS = [
+        ('supports', 'Supports'),
+        ('conflicts', 'Conflicts'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     protocol = models.ForeignKey(Protocol, on_delete=models.CASCADE, related_name='references')
     research_paper = models.ForeignKey(ResearchPaper, on_delete=models.CASCADE, related_name='protocol_references', null=True, blank=True)
@@ -118,6 +213,14 @@ class ProtocolReference(models.Model):
     reference_text = models.TextField()
     page_number = models.PositiveIntegerField(null=True, blank=True)
     
+    # Cross-referencing results: the step and passage matched, how well, and
+    # any parameters the paper disagrees on
+    step = models.ForeignKey(ProtocolStep, on_delete=models.CASCADE, related_name='references', null=True, blank=True)
+    passage = models.ForeignKey(PaperPassage, on_delete=models.SET_NULL, related_name='references', null=True, blank=True)
+    relation = models.CharField(max_length=20, choices=RELATIONS, blank=True)
+    score = models.FloatField(null=True, blank=True)
+    conflicts = models.JSONField(default=list, blank=True)
+    
     class Meta:
         ordering = ['research_paper__title']
     
@@ -137,12 +240,65 @@ class ProtocolVersion(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     changes_summary = models.TextField(blank=True)
     
-    # Store the complete protocol state at this version
-    protocol_data = models.JSONField()  # Serialized protocol and steps data
+    # Keyframes store the complete protocol snapshot; other versions store a
+    # JSON Patch against the previous version (see protocols.versioning)
+    protocol_data = models.JSONField()
+    is_keyframe = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['-version_number']
         unique_together = ['protocol', 'version_number']
     
     def __str__(self):
-        return f"{self.protocol.title} v{self.version_number}" 
\ No newline at end of file
+        return f"{self.protocol.title} v{self.version_number}" 
+
+
+class KeywordDocumentFrequency(models.Model):
+    """
+    Number of documents (papers and protocols) among whose indexed terms
+    ``term`` is, maintained incrementally by protocols.keywords. The row for
+    the empty term counts all indexed documents.
+    """
+    
+    term = models.CharField(max_length=100, primary_key=True)
+    documents = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.term or '(all documents)'}: {self.documents}"
+
+
+class ProtocolEmbedding(models.Model):
+    """Sentence embedding of a protocol (``step`` is null) or one of its steps."""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    protocol = models.ForeignKey(Protocol, on_delete=models.CASCADE, related_name='embeddings')
+    step = models.ForeignKey(ProtocolStep, on_delete=models.CASCADE, related_name='embeddings', null=True, blank=True)
+    embedding = VectorField(dimensions=settings.EMBEDDING_DIMENSIONS)
+    
+    # Hash of the embedded text and model, so unchanged content is never re-embedded
+    content_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name='protocol_embedding_hnsw_idx',
+                fields=['embedding'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_cosine_ops'],
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['protocol'],
+                condition=models.Q(step__isnull=True),
+                name='unique_protocol_level_embedding',
+            ),
+            models.UniqueConstraint(fields=['step'], name='unique_step_embedding'),
+        ]
+    
+    def __str__(self):
+        if self.step_id:
+            return f"Embedding of {self.step}"
+        return f"Embedding of {self.protocol.title}"
\ No newline at end of file
@@ -0,0 +1,7 @@
+from rest_framework.parsers import JSONParser
+
+
+class JSONPatchParser(JSONParser):
+    """Parser for RFC 6902 ``application/json-patch+json`` request bodies."""
+
+    media_type = 'application/json-patch+json'
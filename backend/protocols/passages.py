@@ -0,0 +1,283 @@
+"""
+Passage index over research paper text, and cross-referencing protocol
+steps against it.
+
+A paper's extracted text is split into overlapping windows of
+``PASSAGE_WORDS`` words. Each passage is stored with its page number, its
+embedding (HNSW-indexed like step embeddings) and a summary of the
+parameters extracted from it, so cross-referencing never re-reads or
+re-parses paper text: it is one nearest-neighbour query per step and an
+in-memory comparison of parameter summaries.
+"""
+
+import logging
+import re
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from .embeddings import embed_texts, nearest_neighbours, step_vectors
+from .extraction import extract_parameters_batch
+from .models import PaperPassage, Protocol, ProtocolReference, ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r'\S+')
+
+# Passages embedded and saved per batch while indexing a paper
+INDEX_BATCH_SIZE = 256
+
+# Nearest passages fetched per supporting passage wanted, leaving room for
+# conflicts and for passages below the similarity threshold
+CANDIDATES_PER_RESULT = 4
+
+# Values closer than this are the same setting: absolute for temperatures
+# (kelvin), relative for times and concentrations
+TEMPERATURE_TOLERANCE = 2.0
+RELATIVE_TOLERANCE = 0.1
+
+Summary = Dict[str, Any]
+
+
+def split_passages(text: str, page_offsets: List[int], size: int = None,
+                   overlap: int = None) -> Iterator[Tuple[int, Optional[int], str]]:
+    """
+    Split ``text`` into windows of ``size`` words, each sharing ``overlap``
+    words with the one before.
+
+    Args:
+        text: A paper's extracted text
+        page_offsets: Where each page starts in ``text`` (see ``ResearchPaper``)
+        size: Words per passage; defaults to ``PASSAGE_WORDS``
+        overlap: Words shared by consecutive passages; defaults to
+            ``PASSAGE_OVERLAP_WORDS``
+
+    Yields:
+        ``(start_offset, page_number, passage_text)`` in order; the page is
+        the one the passage starts on, or None without page offsets
+    """
+    size = size or settings.PASSAGE_WORDS
+    overlap = settings.PASSAGE_OVERLAP_WORDS if overlap is None else overlap
+    stride = max(size - overlap, 1)
+
+    words = [match.span() for match in WORD_PATTERN.finditer(text)]
+    for first in range(0, len(words), stride):
+        last = min(first + size, len(words)) - 1
+        start = words[first][0]
+        page_number = bisect_right(page_offsets, start) if page_offsets else None
+        yield start, page_number, text[start:words[last][1]]
+        if last == len(words) - 1:
+            break
+
+
+def _si_range(quantity: Dict[str, Any]) -> List[float]:
+    low, high = quantity['si_value'], quantity['si_max_value']
+    if high is None:
+        return [low, low]
+    return [min(low, high), max(low, high)]
+
+
+def parameter_summary(extracted: Dict[str, List[Dict[str, Any]]]) -> Summary:
+    """
+    Reduce extracted parameters (see ``ParameterExtractor.extract``) to what
+    cross-referencing compares: SI ranges of temperatures and times, and
+    the concentrations given for each reagent keyed by lowercased name.
+    """
+    summary = {
+        category: [{'text': quantity['text'], 'si': _si_range(quantity)} for quantity in extracted[category]]
+        for category in ('temperatures', 'times')
+    }
+    summary['concentrations'] = {}
+    for reagent in extracted['reagents']:
+        concentration = reagent['concentration']
+        if concentration is not None:
+            summary['concentrations'].setdefault(reagent['name'].lower(), []).append({
+                'text': concentration['text'],
+                'si': _si_range(concentration),
+                'unit': concentration['si_unit'],
+            })
+    return summary
+
+
+def step_summary(step, extracted: Dict[str, List[Dict[str, Any]]]) -> Summary:
+    """Parameter summary of a step's text plus its structured duration and temperature."""
+    summary = parameter_summary(extracted)
+    if step.temperature_celsius is not None:
+        kelvin = float(step.temperature_celsius) + 273.15
+        summary['temperatures'].append({'text': f"{step.temperature_celsius} °C", 'si': [kelvin, kelvin]})
+    if step.duration_minutes is not None:
+        seconds = step.duration_minutes * 60.0
+        summary['times'].append({'text': f"{step.duration_minutes} min", 'si': [seconds, seconds]})
+    return summary
+
+
+def _overlaps(a: List[float], b: List[float], absolute: Optional[float]) -> bool:
+    tolerance = absolute if absolute is not None else RELATIVE_TOLERANCE * max(abs(a[1]), abs(b[1]))
+    return a[0] - tolerance <= b[1] and b[0] - tolerance <= a[1]
+
+
+def _disagree(ours: List[Dict], theirs: List[Dict], absolute: Optional[float] = None) -> bool:
+    # Several values on either side (e.g. two incubations) only conflict if none match
+    return bool(ours and theirs) and not any(
+        _overlaps(a['si'], b['si'], absolute) for a in ours for b in theirs
+    )
+
+
+def find_conflicts(step: Summary, passage: Summary) -> List[Dict[str, Any]]:
+    """
+    Parameters a passage describing the same operation sets differently.
+
+    Temperatures and times conflict when both sides give values and none of
+    them agree; concentrations likewise, per reagent and comparing only
+    values in the same SI unit.
+
+    Returns:
+        One entry per conflicting parameter, with the values as written on
+        each side
+    """
+    conflicts = []
+    for category, parameter, absolute in (
+        ('temperatures', 'temperature', TEMPERATURE_TOLERANCE),
+        ('times', 'time', None),
+    ):
+        if _disagree(step[category], passage[category], absolute):
+            conflicts.append({
+                'parameter': parameter,
+                'protocol': [value['text'] for value in step[category]],
+                'paper': [value['text'] for value in passage[category]],
+            })
+
+    theirs = passage['concentrations']
+    for reagent, ours in step['concentrations'].items():
+        units = {value['unit'] for value in ours}
+        other = [value for value in theirs.get(reagent, []) if value['unit'] in units]
+        if _disagree(ours, other):
+            conflicts.append({
+                'parameter': 'concentration',
+                'reagent': reagent,
+                'protocol': [value['text'] for value in ours],
+                'paper': [value['text'] for value in other],
+            })
+    return conflicts
+
+
+def _save_passages(paper_id, batch: List[Tuple[int, Optional[int], str]], position: int):
+    texts = [text for _, _, text in batch]
+    vectors = embed_texts(texts)
+    extracted = extract_parameters_batch(texts, use_cache=False)
+    PaperPassage.objects.bulk_create([
+        PaperPassage(
+            paper_id=paper_id,
+            position=position + index,
+            page_number=page_number,
+            start_offset=start,
+            text=text,
+            parameters=parameter_summary(parameters),
+            embedding=vector,
+        )
+        for index, ((start, page_number, text), vector, parameters) in enumerate(zip(batch, vectors, extracted))
+    ])
+
+
+@transaction.atomic
+def index_paper_passages(paper_id) -> int:
+    """
+    Rebuild the passage index of a paper from its extracted text.
+
+    Passages are embedded and saved ``INDEX_BATCH_SIZE`` at a time, so
+    only one batch of vectors is held in memory however long the paper is.
+
+    Returns:
+        Number of passages indexed
+    """
+    paper = ResearchPaper.objects.only('extracted_text', 'page_offsets').get(id=paper_id)
+    PaperPassage.objects.filter(paper_id=paper_id).delete()
+
+    batch, position = [], 0
+    for passage in split_passages(paper.extracted_text, paper.page_offsets):
+        batch.append(passage)
+        if len(batch) == INDEX_BATCH_SIZE:
+            _save_passages(paper_id, batch, position)
+            position += len(batch)
+            batch = []
+    if batch:
+        _save_passages(paper_id, batch, position)
+        position += len(batch)
+
+    logger.info(f"Indexed {position} passages of paper {paper_id}")
+    return position
+
+
+def cross_reference_protocol(protocol: Protocol, papers=None, top_k: int = None) -> List[ProtocolReference]:
+    """
+    Find supporting and conflicting paper passages for each step of a protocol.
+
+    For each step, the nearest passages at least ``CROSS_REFERENCE_MIN_SIMILARITY``
+    similar are compared on parameters: a passage that disagrees becomes a
+    ``conflicts`` reference (at most one per paper per step), and up to
+    ``top_k`` others become ``supports`` references. The protocol's
+    previous automatic references are replaced; manually added ones are
+    kept.
+
+    Args:
+        protocol: The protocol to cross-reference
+        papers: ResearchPaper queryset to search; defaults to the papers
+            uploaded by the protocol's author
+        top_k: Supporting passages per step; defaults to ``CROSS_REFERENCE_TOP_K``
+
+    Returns:
+        The saved references, in step order
+    """
+    top_k = top_k or settings.CROSS_REFERENCE_TOP_K
+    if papers is None:
+        papers = ResearchPaper.objects.filter(uploaded_by_id=protocol.author_id)
+    passages = PaperPassage.objects.filter(paper__in=papers.values('id'))
+    steps = list(protocol.steps.order_by('step_number'))
+
+    references = []
+    if steps and passages.exists():
+        vectors = step_vectors(steps)
+        extracted = extract_parameters_batch([step.content for step in steps])
+        # One query for all steps, restricted to the given papers inside the
+        # vector query (an exact scan when they have few passages)
+        hits = nearest_neighbours(
+            passages, vectors, top_k * CANDIDATES_PER_RESULT,
+            ['id', 'paper_id', 'page_number', 'text', 'parameters']
+        )
+
+        for step, parameters, rows in zip(steps, extracted, hits):
+            summary = step_summary(step, parameters)
+            supports, conflicting_papers = 0, set()
+            for row in rows:
+                similarity = 1 - row['distance']
+                if similarity < settings.CROSS_REFERENCE_MIN_SIMILARITY:
+                    break
+                conflicts = find_conflicts(summary, row['parameters'])
+                if conflicts:
+                    if row['paper_id'] in conflicting_papers:
+                        continue
+                    conflicting_papers.add(row['paper_id'])
+                    relation = 'conflicts'
+                elif supports < top_k:
+                    supports += 1
+                    relation = 'supports'
+                else:
+                    continue
+                references.append(ProtocolReference(
+                    protocol=protocol,
+                    step=step,
+                    passage_id=row['id'],
+                    research_paper_id=row['paper_id'],
+                    reference_text=row['text'],
+                    page_number=row['page_number'],
+                    relation=relation,
+                    score=similarity,
+                    conflicts=conflicts,
+                ))
+
+    with transaction.atomic():
+        protocol.references.exclude(relation='').delete()
+        ProtocolReference.objects.bulk_create(references)
+
+    logger.info(f"Cross-referenced protocol {protocol.id}: {len(references)} references")
+    return references
@@ -0,0 +1,202 @@
+"""
+Page-by-page text extraction from research paper PDFs.
+
+The PDF is staged to a local file and extracted in chunks of
+``PDF_EXTRACTION_CHUNK_PAGES`` pages with pdfminer (PyPDF2 counts pages and
+is the fallback for pages pdfminer cannot parse). Each chunk is appended to
+``ResearchPaper.extracted_text`` as soon as it is done, together with the
+page offsets, so memory use is bounded by one chunk rather than by the
+document and progress is visible while extraction runs.
+
+Documents of ``PDF_EXTRACTION_PARALLEL_MIN_PAGES`` pages or more are split
+across a pool of ``PDF_EXTRACTION_PROCESSES`` processes. Pool processes
+handle one chunk each and are then replaced, and are limited to
+``PDF_EXTRACTION_MAX_PROCESS_MEMORY_MB`` of address space, so a pathological
+page fails its chunk instead of exhausting the worker's memory.
+"""
+
+import io
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from .models import ResearchPaper
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def count_pages(path: str) -> int:
+    """Number of pages in the PDF at ``path``."""
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _pdfminer_pages(path: str, first: int, last: int) -> List[str]:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    texts = []
+    manager = PDFResourceManager()
+    with open(path, 'rb') as pdf:
+        for page in PDFPage.get_pages(pdf, pagenos=set(range(first, last)), maxpages=last, caching=False):
+            output = io.StringIO()
+            device = TextConverter(manager, output, laparams=LAParams())
+            try:
+                PDFPageInterpreter(manager, device).process_page(page)
+            finally:
+                device.close()
+            texts.append(output.getvalue())
+    return texts
+
+
+def _pypdf2_pages(path: str, first: int, last: int) -> List[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    # Keep pdfminer's convention of ending every page with a form feed
+    return [(reader.pages[number].extract_text() or '') + '\f' for number in range(first, last)]
+
+
+def extract_page_range(path: str, first: int, last: int) -> List[str]:
+    """
+    Extract the text of pages ``first`` to ``last - 1`` (zero-based).
+
+    Returns:
+        One string per page, each ending with a form feed
+    """
+    try:
+        texts = _pdfminer_pages(path, first, last)
+    except MemoryError:
+        raise
+    except Exception as e:
+        logger.warning(f"pdfminer failed on pages {first + 1}-{last} of {path}, using PyPDF2: {str(e)}")
+        texts = _pypdf2_pages(path, first, last)
+    # PostgreSQL text cannot hold NUL characters
+    return [text.replace('\x00', '') for text in texts]
+
+
+def _extract_chunk(chunk: Tuple[str, int, int]) -> List[str]:
+    return extract_page_range(*chunk)
+
+
+def _limit_memory():
+    """Pool initializer: cap this process's address space."""
+    limit_mb = settings.PDF_EXTRACTION_MAX_PROCESS_MEMORY_MB
+    if not limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    limit = limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def iter_page_chunks(path: str, page_count: int) -> Iterator[List[str]]:
+    """
+    Yield the text of every page in order, one chunk of pages at a time.
+
+    Large documents are extracted by a process pool; chunks are still
+    yielded in page order, as soon as every earlier chunk is done.
+    """
+    size = settings.PDF_EXTRACTION_CHUNK_PAGES
+    chunks = [(path, first, min(first + size, page_count)) for first in range(0, page_count, size)]
+    processes = min(settings.PDF_EXTRACTION_PROCESSES, len(chunks))
+
+    if page_count < settings.PDF_EXTRACTION_PARALLEL_MIN_PAGES or processes < 2:
+        for chunk in chunks:
+            yield _extract_chunk(chunk)
+        return
+
+    # billiard (Celery's multiprocessing fork) can start processes from a
+    # daemonic prefork worker, which the standard library refuses to do
+    from billiard import Pool
+
+    # Forked children must not share (and later close) this process's connections
+    connections.close_all()
+    pool = Pool(processes=processes, initializer=_limit_memory, maxtasksperchild=1)
+    try:
+        yield from pool.imap(_extract_chunk, chunks)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@contextmanager
+def staged_pdf(paper: ResearchPaper) -> Iterator[str]:
+    """
+    Yield a local path to ``paper``'s PDF.
+
+    Files on remote storage (e.g. S3) are streamed to a temporary file,
+    which is removed afterwards.
+    """
+    try:
+        local_path = paper.pdf_file.path
+    except NotImplementedError:
+        local_path = None
+    if local_path is not None:
+        yield local_path
+        return
+
+    handle, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(handle, 'wb') as staged, paper.pdf_file.open('rb') as source:
+            shutil.copyfileobj(source, staged, length=1024 * 1024)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def extract_paper_text(paper_id, progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Extract the text of a paper's PDF into ``extracted_text``.
+
+    Any previous text is replaced. Each chunk of pages is appended in one
+    UPDATE together with the page offsets so far, and ``progress`` (if
+    given) is called with the pages done and the page count.
+
+    Returns:
+        Number of pages extracted
+    """
+    paper = ResearchPaper.objects.defer('extracted_text').get(id=paper_id)
+    papers = ResearchPaper.objects.filter(id=paper_id)
+
+    try:
+        with staged_pdf(paper) as path:
+            page_count = count_pages(path)
+            papers.update(
+                extraction_status='running', extraction_error='', page_count=page_count,
+                extracted_text='', page_offsets=[], extraction_updated_at=timezone.now()
+            )
+
+            offsets, length = [], 0
+            for texts in iter_page_chunks(path, page_count):
+                for text in texts:
+                    offsets.append(length)
+                    length += len(text)
+                papers.update(
+                    extracted_text=Concat(F('extracted_text'), Value(''.join(texts)), output_field=TextField()),
+                    page_offsets=offsets, extraction_updated_at=timezone.now()
+                )
+                if progress is not None:
+                    progress(len(offsets), page_count)
+    except Exception as e:
+        logger.error(f"Text extraction failed for paper {paper_id}: {str(e)}")
+        papers.update(extraction_status='failed', extraction_error=str(e))
+        raise
+
+    papers.update(extraction_status='completed')
+    logger.info(f"Extracted {len(offsets)} pages of paper {paper_id}")
+    return len(offsets)
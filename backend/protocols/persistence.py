@@ -0,0 +1,315 @@
+"""
+Bulk, transactional persistence for protocols and their steps and reagents.
+
+Every function here writes a whole protocol in a single ``atomic`` block with
+a constant number of statements (one INSERT per table via ``bulk_create``),
+so a failure never leaves a partially saved protocol behind.
+"""
+
+from typing import Any, Dict, Iterable, List
+from django.db import connection, models, transaction
+from django.utils import timezone
+from .models import Protocol, ProtocolStep, Reagent
+
+STEP_FIELDS = (
+    'step_number', 'step_type', 'title', 'content', 'duration_minutes',
+    'temperature_celsius', 'reasoning', 'alternatives', 'is_customized',
+    'custom_notes',
+)
+REAGENT_FIELDS = ('name', 'concentration', 'unit')
+
+
+def step_fields(step_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the ``ProtocolStep`` model fields out of a step dict."""
+    return {field: step_data[field] for field in STEP_FIELDS if field in step_data}
+
+
+def reagent_fields(reagent_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick the ``Reagent`` model fields out of a reagent dict."""
+    return {field: reagent_data[field] for field in REAGENT_FIELDS if field in reagent_data}
+
+
+def number_steps(steps_data: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Return copies of ``steps_data`` with unique step numbers.
+
+    Missing or repeated numbers (common in LLM output) are replaced with the
+    next free number so the ``(protocol, step_number)`` constraint holds.
+    """
+    numbered, used = [], set()
+    for step_data in steps_data:
+        step_number = step_data.get('step_number')
+        if not step_number or step_number in used:
+            step_number = max(used, default=0) + 1
+        used.add(step_number)
+        numbered.append({**step_data, 'step_number': step_number})
+    return numbered
+
+
+def bulk_create_steps(protocol: Protocol, steps_data: Iterable[Dict[str, Any]]) -> List[ProtocolStep]:
+    """Insert all ``steps_data`` for ``protocol`` in one statement."""
+    return ProtocolStep.objects.bulk_create([
+        ProtocolStep(protocol=protocol, **step_fields(step_data))
+        for step_data in steps_data
+    ])
+
+
+def bulk_create_reagents(protocol: Protocol, reagents_data: Iterable[Dict[str, Any]],
+                         steps: Iterable[ProtocolStep] = ()) -> List[Reagent]:
+    """
+    Insert all ``reagents_data`` for ``protocol`` in one statement.
+
+    A reagent dict may carry a ``step_number`` to link it to one of ``steps``.
+    """
+    steps_by_number = {step.step_number: step for step in steps}
+    return Reagent.objects.bulk_create([
+        Reagent(
+            protocol=protocol,
+            step=steps_by_number.get(reagent_data.get('step_number')),
+            **reagent_fields(reagent_data)
+        )
+        for reagent_data in reagents_data
+    ])
+
+
+def touch_protocol(protocol_id):
+    """
+    Advance a protocol's version (and ETag) after its steps or reagents
+    change on their own; they render inside the protocol. Paths that save
+    the protocol row itself already do this through ``auto_now``.
+    """
+    Protocol.objects.filter(id=protocol_id).update(updated_at=timezone.now())
+
+
+@transaction.atomic
+def create_protocol(steps: Iterable[Dict[str, Any]] = (),
+                    reagents: Iterable[Dict[str, Any]] = (), **fields) -> Protocol:
+    """
+    Create a protocol together with its steps and reagents.
+
+    Args:
+        steps: Step dicts (see ``STEP_FIELDS``)
+        reagents: Reagent dicts (see ``REAGENT_FIELDS``), optionally with a
+            ``step_number`` linking them to a step
+        **fields: ``Protocol`` field values
+
+    Returns:
+        The created Protocol instance
+    """
+    protocol = Protocol.objects.create(**fields)
+    created_steps = bulk_create_steps(protocol, steps)
+    bulk_create_reagents(protocol, reagents, created_steps)
+    # Creating the protocol queued its refresh for commit, after the steps exist
+    return protocol
+
+
+@transaction.atomic
+def update_protocol(protocol: Protocol, steps: Iterable[Dict[str, Any]] = None, **fields) -> Protocol:
+    """
+    Update protocol fields and, if ``steps`` is given, sync its steps to them.
+
+    Returns:
+        The updated Protocol instance
+    """
+    if steps is not None:
+        sync_steps(protocol, steps)
+
+    # Saved after the steps, so the post_save signal re-indexes the new content on commit
+    for attr, value in fields.items():
+        setattr(protocol, attr, value)
+    protocol.save()
+    return protocol
+
+
+def sync_steps(protocol: Protocol, steps_data: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Make ``protocol``'s steps match ``steps_data`` with the fewest writes.
+
+    Incoming steps are matched to existing ones by ``id`` first; the rest
+    then fall back to ``step_number``, among steps no id claimed, so a step
+    inserted at the top never takes over the row of a step named by id
+    further down. Matched steps are updated only if a field changed,
+    unmatched incoming steps are inserted and unmatched existing steps are
+    deleted, each as a single bulk statement. Step ids (and the reagents
+    linked to them) survive edits.
+
+    Returns:
+        Counts of created, updated and deleted steps
+    """
+    existing = {step.id: step for step in protocol.steps.all()}
+    by_number = {step.step_number: step for step in existing.values()}
+
+    matched, unmatched = {}, []
+    for step_data in steps_data:
+        step = existing.get(step_data.get('id'))
+        if step is None or step.id in matched:
+            unmatched.append(step_data)
+        else:
+            matched[step.id] = step_data
+
+    to_create = []
+    for step_data in unmatched:
+        step = by_number.get(step_data.get('step_number'))
+        if step is None or step.id in matched:
+            to_create.append(step_data)
+        else:
+            matched[step.id] = step_data
+
+    original_numbers = {step_id: step.step_number for step_id, step in existing.items()}
+    to_update, changed_fields = [], set()
+    for step_id, step_data in matched.items():
+        step = existing[step_id]
+        changes = {
+            field: value for field, value in step_fields(step_data).items()
+            if getattr(step, field) != value
+        }
+        if changes:
+            for field, value in changes.items():
+                setattr(step, field, value)
+            to_update.append(step)
+            changed_fields.update(changes)
+
+    to_delete = [step_id for step_id in existing if step_id not in matched]
+    renumbered = [step.id for step in to_update if step.step_number != original_numbers[step.id]]
+    _clear_steps(to_delete, renumbered, max(original_numbers.values(), default=0))
+    if to_update:
+        ProtocolStep.objects.bulk_update(to_update, sorted(changed_fields))
+
+    bulk_create_steps(protocol, to_create)
+
+    return {'created': len(to_create), 'updated': len(to_update), 'deleted': len(to_delete)}
+
+
+def _clear_steps(delete_ids: List, park_ids: List, top: int):
+    """
+    Delete steps (and the rows that cascade from them) and park renumbered
+    steps on unused numbers, together in one statement.
+
+    ``QuerySet.delete()`` would first read the steps back and then issue one
+    DELETE per related table; no delete signals are sent here, as callers
+    save the protocol, whose signals re-index it. If a relation to a step
+    needs more than a plain cascade, the steps are deleted through the ORM
+    instead so its ``on_delete`` rules apply. Parking is needed because
+    ``(protocol, step_number)`` is checked row by row, so swapping two
+    steps' numbers in one bulk update would collide on the first row.
+
+    Args:
+        delete_ids: Steps to delete
+        park_ids: Steps about to get new numbers
+        top: The highest step number the protocol has
+    """
+    qn = connection.ops.quote_name
+    step_table = qn(ProtocolStep._meta.db_table)
+    statements, params = [], []
+    if delete_ids and not _steps_cascade_plainly():
+        ProtocolStep.objects.filter(id__in=delete_ids).delete()
+        delete_ids = []
+    if delete_ids:
+        for relation in ProtocolStep._meta.related_objects:
+            statements.append(
+                f"DELETE FROM {qn(relation.related_model._meta.db_table)} WHERE {qn(relation.field.column)} = ANY(%s)"
+            )
+            params.append(list(delete_ids))
+        statements.append(f"DELETE FROM {step_table} WHERE id = ANY(%s)")
+        params.append(list(delete_ids))
+    if park_ids:
+        # Above every current number, so parked numbers collide with nothing
+        statements.append(f"UPDATE {step_table} SET step_number = step_number + %s WHERE id = ANY(%s)")
+        params.extend([top + 1, list(park_ids)])
+    if not statements:
+        return
+
+    *ctes, last = statements
+    sql = f"WITH {', '.join(f'clear_{i} AS ({cte})' for i, cte in enumerate(ctes))} {last}" if ctes else last
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _steps_cascade_plainly() -> bool:
+    """Whether deleting steps only cascades to rows that nothing else references."""
+    return all(
+        relation.on_delete is models.CASCADE and not relation.related_model._meta.related_objects
+        for relation in ProtocolStep._meta.related_objects
+    )
+
+
+@transaction.atomic
+def duplicate_protocol(source: Protocol, **overrides) -> Protocol:
+    """
+    Copy ``source`` with its steps and reagents, keeping reagent-to-step links.
+
+    The copy records ``source`` as its ``forked_from`` parent.
+
+    Args:
+        source: The protocol to copy
+        **overrides: ``Protocol`` field values for the copy (e.g. author)
+
+    Returns:
+        The new Protocol instance
+    """
+    fields = {
+        'title': f"{source.title} (Copy)",
+        'description': source.description,
+        'is_public': False,
+        'tags': source.tags,
+        'forked_from': source,
+        **overrides,
+    }
+    protocol = Protocol.objects.create(**fields)
+    copy_steps_and_reagents(source, protocol)
+    return protocol
+
+
+# Step fields a copy starts over on instead of inheriting
+STEP_COPY_RESET = {'is_customized': False, 'custom_notes': ''}
+
+
+def copy_steps_and_reagents(source: Protocol, target: Protocol) -> Dict[str, int]:
+    """
+    Copy every step and reagent of ``source`` into ``target``.
+
+    Runs as a single ``INSERT ... SELECT`` statement: a CTE assigns each
+    source step a new id, steps are inserted from it, and reagents are
+    inserted joined to it so they link to the copies of their steps. No rows
+    are read into Python.
+
+    Returns:
+        Counts of copied steps and reagents
+    """
+    qn = connection.ops.quote_name
+
+    def columns(model, exclude):
+        return [
+            qn(field.column) for field in model._meta.concrete_fields
+            if field.name not in exclude
+        ]
+
+    step_columns = columns(ProtocolStep, {'id', 'protocol', *STEP_COPY_RESET})
+    reset_columns = [qn(ProtocolStep._meta.get_field(name).column) for name in STEP_COPY_RESET]
+    reagent_columns = columns(Reagent, {'id', 'protocol', 'step'})
+    step_table, reagent_table = qn(ProtocolStep._meta.db_table), qn(Reagent._meta.db_table)
+
+    sql = f"""
+        WITH step_map AS (
+            SELECT id AS source_id, gen_random_uuid() AS id
+            FROM {step_table} WHERE protocol_id = %s
+        ), new_steps AS (
+            INSERT INTO {step_table} (id, protocol_id, {', '.join(step_columns + reset_columns)})
+            SELECT step_map.id, %s, {', '.join(f's.{column}' for column in step_columns)},
+                   {', '.join(['%s'] * len(reset_columns))}
+            FROM {step_table} s JOIN step_map ON step_map.source_id = s.id
+            RETURNING 1
+        ), new_reagents AS (
+            INSERT INTO {reagent_table} (id, protocol_id, step_id, {', '.join(reagent_columns)})
+            SELECT gen_random_uuid(), %s, step_map.id, {', '.join(f'r.{column}' for column in reagent_columns)}
+            FROM {reagent_table} r LEFT JOIN step_map ON step_map.source_id = r.step_id
+            WHERE r.protocol_id = %s
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM new_steps), (SELECT COUNT(*) FROM new_reagents)
+    """
+    params = [source.id, target.id, *STEP_COPY_RESET.values(), target.id, source.id]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        steps, reagents = cursor.fetchone()
+    return {'steps': steps, 'reagents': reagents}
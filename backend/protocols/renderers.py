@@ -0,0 +1,24 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+def format_sse(event: str, data) -> str:
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer for ``text/event-stream`` endpoints.
+
+    Streaming views return a ``StreamingHttpResponse`` directly; this renderer
+    only lets content negotiation accept SSE clients and formats any regular
+    response (such as validation errors) as a single ``error`` event.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse('error', data).encode(self.charset)
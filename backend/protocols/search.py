@@ -0,0 +1,198 @@
+"""
+PostgreSQL full-text, pg_trgm fuzzy, pgvector semantic and hybrid search
+over protocols and reagents.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+)
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max, OuterRef, QuerySet, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from .embeddings import embed_texts, nearest_neighbours
+from .models import Protocol, ProtocolEmbedding, ProtocolStep
+
+SEARCH_CONFIG = 'english'
+
+# Nearest embeddings fetched per requested result; a protocol can match
+# through several of its steps
+SEMANTIC_CANDIDATES_PER_RESULT = 5
+
+# Reciprocal rank fusion damping constant (Cormack et al.); larger values
+# flatten the advantage of top-ranked hits
+RRF_K = 60
+
+
+def _search_document():
+    """Weighted tsvector over a protocol's own fields and all of its step content."""
+    steps_text = Subquery(
+        ProtocolStep.objects.filter(protocol=OuterRef('pk'))
+        .values('protocol')
+        .annotate(text=StringAgg('content', delimiter=' '))
+        .values('text')
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('description', 'original_prompt', weight='B', config=SEARCH_CONFIG) +
+        SearchVector(Coalesce(steps_text, Value(''), output_field=TextField()), weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(protocol_ids: Iterable = None):
+    """
+    Recompute the stored search document for the given protocols.
+
+    One UPDATE statement regardless of how many protocols are refreshed;
+    pass ``None`` to rebuild every protocol.
+    """
+    queryset = Protocol.objects.all()
+    if protocol_ids is not None:
+        protocol_ids = list(protocol_ids)
+        if not protocol_ids:
+            return 0
+        queryset = queryset.filter(id__in=protocol_ids)
+    return queryset.update(search_vector=_search_document())
+
+
+def keyword_search(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Filter ``queryset`` to protocols matching ``query``, best matches first.
+
+    Uses the GIN-indexed ``search_vector``; each result is annotated with
+    ``rank`` and a ``headline`` snippet with matches wrapped in ``<mark>``.
+    """
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    return (
+        queryset.filter(search_vector=search_query)
+        .annotate(
+            rank=SearchRank('search_vector', search_query),
+            headline=SearchHeadline(
+                Concat('description', Value(' '), 'original_prompt', output_field=TextField()),
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel='<mark>',
+                stop_sel='</mark>',
+                max_fragments=2,
+            ),
+        )
+        .order_by('-rank', '-updated_at')
+    )
+
+
+def _set_trigram_threshold(threshold: float = None):
+    """Set the ``%>`` match threshold for the current transaction."""
+    if threshold is None:
+        threshold = settings.TRIGRAM_SIMILARITY_THRESHOLD
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL pg_trgm.word_similarity_threshold = {float(threshold)}")
+
+
+def fuzzy_search(queryset: QuerySet, query: str, limit: int = 20, threshold: float = None) -> List[Protocol]:
+    """
+    Return protocols whose title contains a close match for ``query``.
+
+    Matching uses trigram word similarity, which tolerates misspellings and
+    scores ``query`` against the best-matching part of the title, through
+    the GIN trigram index. Each result is annotated with its similarity as
+    ``rank``.
+    """
+    with transaction.atomic():
+        _set_trigram_threshold(threshold)
+        return list(
+            queryset.filter(title__trigram_word_similar=query)
+            .annotate(rank=TrigramWordSimilarity(query, 'title'))
+            .order_by('-rank', '-updated_at')[:limit]
+        )
+
+
+def fuzzy_reagent_search(queryset: QuerySet, query: str, limit: int = 20,
+                         threshold: float = None) -> List[Dict[str, Any]]:
+    """
+    Look up distinct reagent names in ``queryset`` that closely match ``query``.
+
+    Returns:
+        Dicts with the reagent ``name``, its ``similarity`` to ``query`` and
+        the number of protocols using it, best match first
+    """
+    with transaction.atomic():
+        _set_trigram_threshold(threshold)
+        return list(
+            queryset.filter(name__trigram_word_similar=query)
+            .values('name')
+            .annotate(
+                similarity=Max(TrigramWordSimilarity(query, 'name')),
+                protocol_count=Count('protocol', distinct=True),
+            )
+            .order_by('-similarity', 'name')[:limit]
+        )
+
+
+def semantic_search(queryset: QuerySet, query: str, limit: int = 20) -> List[Protocol]:
+    """
+    Return up to ``limit`` protocols from ``queryset`` closest in meaning to ``query``.
+
+    Nearest neighbours come from the HNSW index over protocol and step
+    embeddings, restricted to the protocols in ``queryset`` within the
+    vector query (see ``nearest_neighbours``); a protocol scores as its
+    best-matching embedding. Each result is annotated with its cosine
+    similarity as ``rank``.
+    """
+    vector = embed_texts([query])[0]
+    embeddings = ProtocolEmbedding.objects.filter(protocol__in=queryset.order_by().values('id'))
+    hits = nearest_neighbours(embeddings, [vector], limit * SEMANTIC_CANDIDATES_PER_RESULT, ['protocol_id'])[0]
+
+    similarity = {}
+    for hit in hits:
+        similarity.setdefault(hit['protocol_id'], 1 - hit['distance'])
+
+    protocols = list(queryset.filter(id__in=list(similarity)))
+    for protocol in protocols:
+        protocol.rank = similarity[protocol.id]
+        protocol.headline = None
+    protocols.sort(key=lambda protocol: protocol.rank, reverse=True)
+    return protocols[:limit]
+
+
+
+def _in_thread(search, *args):
+    """Run ``search`` on a worker thread, closing that thread's DB connection after."""
+    try:
+        return search(*args)
+    finally:
+        connections.close_all()
+
+
+def hybrid_search(queryset: QuerySet, query: str, limit: int = 20) -> List[Protocol]:
+    """
+    Fuse keyword and semantic results for ``query`` with reciprocal rank fusion.
+
+    Both retrievers run concurrently, so latency is that of the slower one.
+    Each result's ``rank`` is its fused score, and ``scores`` breaks it down
+    into the rank and score each retriever gave it (``None`` if it missed).
+    """
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='hybrid-search') as executor:
+        keyword_future = executor.submit(_in_thread, lambda: list(keyword_search(queryset, query)[:limit]))
+        semantic_future = executor.submit(_in_thread, semantic_search, queryset, query, limit)
+        retrievers = {'keyword': keyword_future.result(), 'semantic': semantic_future.result()}
+
+    fused = {}
+    for name, hits in retrievers.items():
+        for position, hit in enumerate(hits, start=1):
+            # Keep the keyword instance when both matched; it carries the headline
+            protocol = fused.setdefault(hit.id, hit)
+            if not hasattr(protocol, 'scores'):
+                protocol.scores = {retriever: None for retriever in retrievers}
+            protocol.scores[name] = {'rank': position, 'score': hit.rank}
+
+    results = list(fused.values())
+    for protocol in results:
+        protocol.rank = sum(
+            1 / (RRF_K + breakdown['rank'])
+            for breakdown in protocol.scores.values() if breakdown is not None
+        )
+    results.sort(key=lambda protocol: protocol.rank, reverse=True)
+    return results[:limit]
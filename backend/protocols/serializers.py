@@ -1,4 +1,9 @@
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from prtcltech.fields import SparseFieldsSerializerMixin
+from . import persistence
+from .dedup import normalize_doi, normalize_pmid
 from .models import Protocol, ProtocolStep, Reagent, ResearchPaper, ProtocolReference, ProtocolVersion
 
 
@@ -20,6 +25,11 @@ class ProtocolStepSerializer(serializers.ModelSerializer):
         ]
 
 
+class ProtocolStepUpdateSerializer(ProtocolStepSerializer):
+    """Nested step serializer for protocol updates; ``id`` identifies existing steps."""
+    id = serializers.UUIDField(required=False)
+
+
 class ProtocolStepCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProtocolStep
@@ -29,7 +39,27 @@ class ProtocolStepCreateSerializer(serializers.ModelSerializer):
         ]
 
 
-class ProtocolSerializer(serializers.ModelSerializer):
+def protocol_detail_prefetches():
+    """Prefetches that let protocol serializers render steps and their reagents in two queries."""
+    return [Prefetch('steps', queryset=ProtocolStep.objects.prefetch_related('reagents'))]
+
+
+class ProtocolSummarySerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """Compact protocol for list pages; steps are included only with ``?expand=steps``."""
+    steps = ProtocolStepSerializer(many=True, read_only=True)
+    author = serializers.ReadOnlyField(source='author.username')
+    
+    class Meta:
+        model = Protocol
+        fields = [
+            'id', 'title', 'description', 'author', 'created_at',
+            'updated_at', 'is_public', 'tags', 'llm_model_used', 'forked_from',
+            'steps'
+        ]
+        expandable_fields = ['steps']
+
+
+class ProtocolSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     steps = ProtocolStepSerializer(many=True, read_only=True)
     author = serializers.ReadOnlyField(source='author.username')
     
@@ -38,9 +68,25 @@ class ProtocolSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'author', 'created_at',
             'updated_at', 'is_public', 'tags', 'original_prompt',
-            'llm_model_used', 'generation_timestamp', 'steps'
+            'llm_model_used', 'generation_timestamp', 'forked_from', 'keywords', 'steps'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'author']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'author', 'forked_from', 'keywords']
+    
+    def to_representation(self, instance):
+        # No-op for querysets planned with protocol_detail_prefetches()
+        if 'steps' in self.fields:
+            prefetch_related_objects([instance], *protocol_detail_prefetches())
+        return super().to_representation(instance)
+
+
+class ProtocolSearchResultSerializer(ProtocolSerializer):
+    """Protocol with its search rank, highlighted snippet and score breakdown."""
+    rank = serializers.FloatField(read_only=True, default=None)
+    headline = serializers.CharField(read_only=True, default=None)
+    scores = serializers.DictField(read_only=True, default=None)
+    
+    class Meta(ProtocolSerializer.Meta):
+        fields = ProtocolSerializer.Meta.fields + ['rank', 'headline', 'scores']
 
 
 class ProtocolCreateSerializer(serializers.ModelSerializer):
@@ -55,16 +101,11 @@ class ProtocolCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         steps_data = validated_data.pop('steps', [])
-        protocol = Protocol.objects.create(**validated_data)
-        
-        for step_data in steps_data:
-            ProtocolStep.objects.create(protocol=protocol, **step_data)
-        
-        return protocol
+        return persistence.create_protocol(steps=steps_data, **validated_data)
 
 
 class ProtocolUpdateSerializer(serializers.ModelSerializer):
-    steps = ProtocolStepSerializer(many=True, required=False)
+    steps = ProtocolStepUpdateSerializer(many=True, required=False)
     
     class Meta:
         model = Protocol
@@ -72,37 +113,60 @@ class ProtocolUpdateSerializer(serializers.ModelSerializer):
             'title', 'description', 'is_public', 'tags', 'steps'
         ]
     
-    def update(self, instance, validated_data):
-        steps_data = validated_data.pop('steps', [])
+    def validate_steps(self, value):
+        existing = {}
+        if self.instance is not None:
+            # persistence.sync_steps reads the same prefetched steps
+            prefetch_related_objects([self.instance], 'steps')
+            existing = {step.id: step.step_number for step in self.instance.steps.all()}
         
-        # Update protocol fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update steps if provided
-        if steps_data:
-            # Clear existing steps
-            instance.steps.all().delete()
-            
-            # Create new steps
-            for step_data in steps_data:
-                ProtocolStep.objects.create(protocol=instance, **step_data)
-        
-        return instance
+        # A partial update may omit the number of a step it identifies by id
+        step_numbers = []
+        for step in value:
+            step_number = step.get('step_number', existing.get(step.get('id')))
+            if step_number is None:
+                raise serializers.ValidationError("New steps must have a step_number.")
+            step_numbers.append(step_number)
+        if len(step_numbers) != len(set(step_numbers)):
+            raise serializers.ValidationError("Step numbers must be unique.")
+        return value
+    
+    def update(self, instance, validated_data):
+        # Steps are only synced when provided (and non-empty)
+        steps_data = validated_data.pop('steps', None) or None
+        return persistence.update_protocol(instance, steps=steps_data, **validated_data)
+    
+    def to_representation(self, instance):
+        # Steps were just rewritten, so any earlier prefetch is gone
+        prefetch_related_objects([instance], *protocol_detail_prefetches())
+        return super().to_representation(instance)
 
 
 class ResearchPaperSerializer(serializers.ModelSerializer):
     uploaded_by = serializers.ReadOnlyField(source='uploaded_by.username')
+    pages_extracted = serializers.SerializerMethodField()
     
     class Meta:
         model = ResearchPaper
         fields = [
             'id', 'title', 'authors', 'abstract', 'doi', 'pmid',
             'publication_date', 'journal', 'pdf_file', 'uploaded_by',
-            'uploaded_at', 'keywords'
+            'uploaded_at', 'keywords', 'extraction_status', 'extraction_error',
+            'page_count', 'pages_extracted', 'content_hash'
+        ]
+        read_only_fields = [
+            'id', 'uploaded_by', 'uploaded_at', 'keywords', 'extraction_status',
+            'extraction_error', 'page_count', 'content_hash'
         ]
-        read_only_fields = ['id', 'uploaded_by', 'uploaded_at']
+    
+    def get_pages_extracted(self, obj) -> int:
+        return len(obj.page_offsets)
+    
+    def validate_doi(self, value):
+        return normalize_doi(value)
+    
+    def validate_pmid(self, value):
+        return normalize_pmid(value)
 
 
 class ProtocolReferenceSerializer(serializers.ModelSerializer):
@@ -112,8 +176,9 @@ class ProtocolReferenceSerializer(serializers.ModelSerializer):
         model = ProtocolReference
         fields = [
             'id', 'research_paper', 'external_url', 'reference_text',
-            'page_number'
+            'page_number', 'step', 'relation', 'score', 'conflicts'
         ]
+        read_only_fields = ['id', 'step', 'relation', 'score', 'conflicts']
 
 
 class ProtocolVersionSerializer(serializers.ModelSerializer):
@@ -123,9 +188,16 @@ class ProtocolVersionSerializer(serializers.ModelSerializer):
         model = ProtocolVersion
         fields = [
             'id', 'version_number', 'created_at', 'created_by',
-            'changes_summary', 'protocol_data'
+            'changes_summary', 'is_keyframe'
         ]
-        read_only_fields = ['id', 'created_at', 'created_by']
+        read_only_fields = ['id', 'created_at', 'created_by', 'is_keyframe']
+
+
+class ProtocolVersionDetailSerializer(ProtocolVersionSerializer):
+    """A version with its full protocol snapshot, rebuilt from the stored delta."""
+    
+    class Meta(ProtocolVersionSerializer.Meta):
+        fields = ProtocolVersionSerializer.Meta.fields + ['protocol_data']
 
 
 class ProtocolGenerationRequestSerializer(serializers.Serializer):
@@ -135,6 +207,7 @@ class ProtocolGenerationRequestSerializer(serializers.Serializer):
     include_reasoning = serializers.BooleanField(default=True)
     cross_reference_papers = serializers.BooleanField(default=True)
     max_steps = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    use_cache = serializers.BooleanField(default=True)
     
     def validate_prompt(self, value):
         if len(value.strip()) < 10:
@@ -146,8 +219,30 @@ class ProtocolSearchSerializer(serializers.Serializer):
     """Serializer for protocol search requests."""
     query = serializers.CharField(max_length=500)
     search_type = serializers.ChoiceField(
-        choices=['keyword', 'semantic', 'both'],
+        choices=['keyword', 'semantic', 'both', 'fuzzy'],
         default='keyword'
     )
     filters = serializers.JSONField(required=False, default=dict)
-    limit = serializers.IntegerField(min_value=1, max_value=100, default=20) 
\ No newline at end of file
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)  # Total results, across pages
+
+
+class KeywordRescoreSerializer(serializers.Serializer):
+    """Serializer for keyword re-scoring requests."""
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        min_length=1,
+        max_length=settings.KEYWORD_RESCORE_MAX_BATCH
+    )
+
+
+class ReagentLookupSerializer(serializers.Serializer):
+    """Serializer for fuzzy reagent lookup requests."""
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class ReagentMatchSerializer(serializers.Serializer):
+    """A reagent name matching a fuzzy lookup."""
+    name = serializers.CharField()
+    similarity = serializers.FloatField()
+    protocol_count = serializers.IntegerField()
\ No newline at end of file
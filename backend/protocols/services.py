@@ -1,23 +1,128 @@
 import json
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from django.conf import settings
+from django.db import models
 from django.utils import timezone
+from . import persistence
+from .cache import ProtocolGenerationCache, SingleFlight
+from .embeddings import get_prompt_index
+from .extraction import extract_parameters
 from .models import Protocol, ProtocolStep, Reagent, ResearchPaper
+from .passages import cross_reference_protocol
+from .search import fuzzy_search, hybrid_search, keyword_search, semantic_search
+from .versioning import record_version
 import google.generativeai as genai
 
 logger = logging.getLogger(__name__)
 
 
+class StreamingProtocolParser:
+    """
+    Incremental parser for the protocol JSON emitted by the LLM.
+
+    Text is fed in arbitrary chunks. The parser tracks string/escape state
+    and the container stack, so each reagent or step object is decoded the
+    moment its closing brace arrives instead of after the whole response.
+    """
+
+    ITEM_KINDS = {'steps': 'step', 'reagents': 'reagent'}
+    FIELD_KEYS = ('title', 'description')
+
+    def __init__(self):
+        self.content = ''
+        self._pos = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        # Each entry is [container_char, key_in_parent, start_index]
+        self._stack = []
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text and return any events it completed."""
+        self.content += text
+        events = []
+
+        while self._pos < len(self.content):
+            i = self._pos
+            char = self.content[i]
+            self._pos += 1
+
+            if not self._started:
+                # Skip any preamble (e.g. markdown fences) before the document
+                if char == '{':
+                    self._started = True
+                    self._stack.append(['{', None, i])
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._on_string(self.content[self._string_start:i + 1], events)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ':':
+                self._key = self._last_string
+            elif char == ',':
+                self._key = None
+            elif char in '{[':
+                parent = self._stack[-1] if self._stack else None
+                key = self._key if parent and parent[0] == '{' else (parent[1] if parent else None)
+                self._stack.append([char, key, i])
+                self._key = None
+            elif char in '}]' and self._stack:
+                container, key, start = self._stack.pop()
+                if container == '{' and len(self._stack) == 2:
+                    parent, grandparent = self._stack[-1], self._stack[0]
+                    if parent[0] == '[' and grandparent[0] == '{' and key in self.ITEM_KINDS:
+                        self._emit(self.ITEM_KINDS[key], self.content[start:i + 1], events)
+
+        return events
+
+    def _on_string(self, literal: str, events: List[Tuple[str, Any]]):
+        """Handle a completed string literal (either a key or a value)."""
+        if len(self._stack) == 1 and self._key in self.FIELD_KEYS:
+            self._emit(self._key, literal, events)
+            self._key = None
+        self._last_string = literal[1:-1]
+
+    def _emit(self, kind: str, raw: str, events: List[Tuple[str, Any]]):
+        try:
+            events.append((kind, json.loads(raw)))
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed streamed {kind}: {raw[:100]}")
+
+
 class LLMService:
-    """Service for interacting with LLM APIs."""
+    """
+    Service for interacting with LLM APIs.
+
+    Use ``get_llm_service()`` rather than instantiating this directly: one
+    long-lived instance is shared by every request and thread in a process,
+    so identical in-flight generations can be coalesced.
+    """
     
     def __init__(self):
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name = settings.GEMINI_MODEL
+        self.model = genai.GenerativeModel(self.model_name)
+        self.cache = ProtocolGenerationCache()
+        self.inflight = SingleFlight()
     
     def generate_protocol(self, prompt: str, include_reagents: bool = True, 
-                         include_reasoning: bool = True, max_steps: int = 20) -> Dict[str, Any]:
+                         include_reasoning: bool = True, max_steps: int = 20,
+                         use_cache: bool = True, user=None) -> Dict[str, Any]:
         """
         Generate a protocol using the LLM.
         
@@ -26,10 +131,50 @@ class LLMService:
             include_reagents: Whether to include reagent information
             include_reasoning: Whether to include reasoning for each step
             max_steps: Maximum number of steps to generate
+            use_cache: Whether to serve/store the result from the generation cache
+            user: Requesting user; near-duplicate prompts are only matched
+                against protocols this user can see
             
         Returns:
             Dictionary containing generated protocol data
         """
+        cache_key = self.cache.make_key(
+            prompt, self.model_name, include_reagents=include_reagents,
+            include_reasoning=include_reasoning, max_steps=max_steps
+        )
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is None:
+                cached = self.find_similar_protocol(
+                    prompt, user, max_steps, include_reagents, include_reasoning
+                )
+            if cached is not None:
+                return cached
+
+        # Identical concurrent requests share a single Gemini call
+        return self.inflight.do(cache_key, lambda: self._generate_uncached(
+            prompt, cache_key, include_reagents, include_reasoning, max_steps,
+            coordinate=use_cache
+        ))
+
+    def _generate_uncached(self, prompt: str, cache_key: str, include_reagents: bool,
+                           include_reasoning: bool, max_steps: int,
+                           coordinate: bool = True) -> Dict[str, Any]:
+        """
+        Call the LLM and cache the parsed result.
+
+        With ``coordinate``, a process that finds the same request already
+        being generated elsewhere waits for that result instead of calling
+        the LLM again.
+        """
+        claimed = coordinate and self.cache.acquire_inflight(cache_key)
+        if coordinate and not claimed:
+            protocol_data = self.cache.wait_for(cache_key)
+            if protocol_data is not None:
+                return protocol_data
+            # The owner gave up without a result; only release a claim we hold
+            claimed = self.cache.acquire_inflight(cache_key)
+
         try:
             # Construct the system prompt
             system_prompt = self._build_system_prompt(include_reagents, include_reasoning, max_steps)
@@ -41,13 +186,154 @@ class LLMService:
             # Parse the response
             content = response.text
             protocol_data = self._parse_llm_response(content)
+
+            # Don't cache the fallback structure from an unparseable response
+            if protocol_data.get('steps'):
+                self.cache.set(cache_key, protocol_data)
             
             return protocol_data
             
         except Exception as e:
             logger.error(f"Error generating protocol: {str(e)}")
             raise
-    
+
+        finally:
+            if claimed:
+                self.cache.release_inflight(cache_key)
+
+    def stream_protocol(self, prompt: str, include_reagents: bool = True,
+                        include_reasoning: bool = True, max_steps: int = 20,
+                        use_cache: bool = True, user=None) -> Iterator[Tuple[str, Any]]:
+        """
+        Generate a protocol using the LLM's streaming API.
+
+        Yields ``(kind, data)`` events as soon as each piece of the JSON
+        document is complete: ``('title', str)``, ``('description', str)``,
+        ``('reagent', dict)`` and ``('step', dict)``. The last event is
+        ``('protocol', dict)`` with the fully parsed protocol data.
+        A cache hit replays the same events without calling the LLM.
+        """
+        cache_key = self.cache.make_key(
+            prompt, self.model_name, include_reagents=include_reagents,
+            include_reasoning=include_reasoning, max_steps=max_steps
+        )
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is None:
+                cached = self.find_similar_protocol(
+                    prompt, user, max_steps, include_reagents, include_reasoning
+                )
+            if cached is not None:
+                yield from self._replay_protocol(cached)
+                return
+
+        try:
+            system_prompt = self._build_system_prompt(include_reagents, include_reasoning, max_steps)
+            full_prompt = f"{system_prompt}\n\nUser Request: {prompt}"
+            response = self.model.generate_content(full_prompt, stream=True)
+
+            parser = StreamingProtocolParser()
+            for chunk in response:
+                yield from parser.feed(chunk.text)
+
+            protocol_data = self._parse_llm_response(parser.content)
+            if protocol_data.get('steps'):
+                self.cache.set(cache_key, protocol_data)
+
+            yield 'protocol', protocol_data
+
+        except Exception as e:
+            logger.error(f"Error streaming protocol: {str(e)}")
+            raise
+
+    def find_similar_protocol(self, prompt: str, user=None, max_steps: int = 20,
+                              include_reagents: bool = True,
+                              include_reasoning: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Look up a previously generated protocol for a near-duplicate prompt.
+
+        Prompts are compared by embedding cosine similarity against
+        ``SEMANTIC_CACHE_THRESHOLD``. Only protocols visible to ``user`` that
+        fit within ``max_steps`` are considered. A hit must have reagents if
+        ``include_reagents`` is set and step reasoning if ``include_reasoning``
+        is set; whichever was not requested is left out of the returned data.
+
+        Returns:
+            Protocol data in the same shape as ``generate_protocol``, or None
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return None
+
+        try:
+            candidate_ids = get_prompt_index().search(prompt, settings.SEMANTIC_CACHE_THRESHOLD)
+        except Exception as e:
+            logger.warning(f"Semantic prompt lookup failed: {str(e)}")
+            return None
+        if not candidate_ids:
+            return None
+
+        visible = Protocol.objects.filter(id__in=candidate_ids)
+        visible = visible.filter(is_public=True) if user is None else visible.filter(
+            models.Q(author=user) | models.Q(is_public=True)
+        )
+        protocols = {str(p.id): p for p in visible.prefetch_related('steps', 'reagents')}
+
+        for protocol_id in candidate_ids:
+            protocol = protocols.get(protocol_id)
+            if protocol is None or not 0 < len(protocol.steps.all()) <= max_steps:
+                continue
+            protocol_data = self._protocol_data(protocol)
+            if include_reagents and not protocol_data['reagents']:
+                continue
+            if include_reasoning and not any(step['reasoning'] for step in protocol_data['steps']):
+                continue
+
+            if not include_reagents:
+                protocol_data['reagents'] = []
+            if not include_reasoning:
+                for step in protocol_data['steps']:
+                    step['reasoning'] = ''
+            logger.info(f"Semantic cache hit: reusing protocol {protocol_id}")
+            return protocol_data
+        return None
+
+    def _protocol_data(self, protocol: Protocol) -> Dict[str, Any]:
+        """Convert a saved protocol back into the LLM output structure."""
+        return {
+            'title': protocol.title,
+            'description': protocol.description,
+            'reagents': [
+                {'name': r.name, 'concentration': r.concentration, 'unit': r.unit}
+                for r in protocol.reagents.all()
+            ],
+            'steps': [
+                {
+                    'step_number': step.step_number,
+                    'title': step.title,
+                    'content': step.content,
+                    'duration_minutes': step.duration_minutes,
+                    'temperature_celsius': (
+                        float(step.temperature_celsius)
+                        if step.temperature_celsius is not None else None
+                    ),
+                    'reasoning': step.reasoning,
+                    'alternatives': step.alternatives,
+                }
+                for step in protocol.steps.all()
+            ],
+        }
+
+    def _replay_protocol(self, protocol_data: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        """Yield stream events for already-parsed protocol data."""
+        for field in StreamingProtocolParser.FIELD_KEYS:
+            if field in protocol_data:
+                yield field, protocol_data[field]
+        for reagent_data in protocol_data.get('reagents', []):
+            yield 'reagent', reagent_data
+        for step_data in protocol_data.get('steps', []):
+            yield 'step', step_data
+        yield 'protocol', protocol_data
+
     def _build_system_prompt(self, include_reagents: bool, include_reasoning: bool, max_steps: int) -> str:
         """Build the system prompt for protocol generation."""
         prompt = f"""You are an expert in biological research protocols. Generate a detailed protocol based on the user's request.
@@ -131,11 +417,24 @@ Guidelines:
             }
 
 
+_llm_service: Optional[LLMService] = None
+_llm_service_lock = threading.Lock()
+
+
+def get_llm_service() -> LLMService:
+    """Return the process-wide LLM client, creating it on first use."""
+    global _llm_service
+    with _llm_service_lock:
+        if _llm_service is None:
+            _llm_service = LLMService()
+        return _llm_service
+
+
 class ProtocolService:
     """Service for protocol-related operations."""
     
     def __init__(self):
-        self.llm_service = LLMService()
+        self.llm_service = get_llm_service()
     
     def create_protocol_from_prompt(self, user, prompt: str, **kwargs) -> Protocol:
         """
@@ -149,58 +448,121 @@ class ProtocolService:
         Returns:
             The created Protocol instance
         """
+        cross_reference = kwargs.pop('cross_reference_papers', False)
+
         # Generate protocol using LLM
-        protocol_data = self.llm_service.generate_protocol(prompt, **kwargs)
+        protocol_data = self.llm_service.generate_protocol(prompt, user=user, **kwargs)
         
-        # Create protocol in database
-        protocol = Protocol.objects.create(
+        # Create protocol, reagents and steps in one transaction
+        protocol = persistence.create_protocol(
+            steps=persistence.number_steps(protocol_data.get('steps', [])),
+            reagents=protocol_data.get('reagents', []),
             author=user,
             title=protocol_data.get('title', 'Generated Protocol'),
             description=protocol_data.get('description', ''),
             original_prompt=prompt,
-            llm_model_used='gemini-1.5-flash',
+            llm_model_used=self.llm_service.model_name,
             generation_timestamp=timezone.now()
         )
-        
-        # Create reagents
-        for reagent_data in protocol_data.get('reagents', []):
-            Reagent.objects.create(
-                protocol=protocol,
-                name=reagent_data.get('name', ''),
-                concentration=reagent_data.get('concentration', ''),
-                unit=reagent_data.get('unit', '')
-            )
-        
-        # Create steps
-        for step_data in protocol_data.get('steps', []):
-            step = ProtocolStep.objects.create(
-                protocol=protocol,
-                step_number=step_data.get('step_number', 1),
-                title=step_data.get('title', ''),
-                content=step_data.get('content', ''),
-                duration_minutes=step_data.get('duration_minutes'),
-                temperature_celsius=step_data.get('temperature_celsius'),
-                reasoning=step_data.get('reasoning', ''),
-                alternatives=step_data.get('alternatives', [])
-            )
-        
+        record_version(protocol.id, user)
+
+        self._index_prompt(protocol)
+
+        if cross_reference:
+            self.cross_reference_papers(protocol)
+
         return protocol
+
+    def stream_protocol_from_prompt(self, user, prompt: str, **kwargs) -> Iterator[Tuple[str, Any]]:
+        """
+        Create a new protocol from a user prompt, persisting it while it streams.
+
+        The protocol row is created up front, then each reagent and step is
+        saved as soon as the LLM finishes emitting it.
+
+        Yields:
+            ``(event, data)`` pairs: ``protocol`` once with the new id,
+            then ``reagent``/``step`` for every saved row and ``complete``
+            with the final title and description.
+        """
+        cross_reference = kwargs.pop('cross_reference_papers', False)
+
+        protocol = Protocol.objects.create(
+            author=user,
+            title='Generated Protocol',
+            original_prompt=prompt,
+            llm_model_used=self.llm_service.model_name,
+            generation_timestamp=timezone.now()
+        )
+        yield 'protocol', {'id': str(protocol.id)}
+
+        step_numbers = set()
+        for kind, data in self.llm_service.stream_protocol(prompt, user=user, **kwargs):
+            if kind in ('title', 'description'):
+                setattr(protocol, kind, data)
+            elif kind == 'reagent':
+                # Saved one at a time on purpose: each row is visible as soon as it streams
+                reagent = Reagent.objects.create(protocol=protocol, **persistence.reagent_fields(data))
+                yield 'reagent', {'id': str(reagent.id), **data}
+            elif kind == 'step':
+                step_number = data.get('step_number') or len(step_numbers) + 1
+                if step_number in step_numbers:
+                    step_number = max(step_numbers) + 1
+                step_numbers.add(step_number)
+                # bulk_create skips the per-step refresh; saving the protocol
+                # below refreshes its search document and embeddings once
+                step, = ProtocolStep.objects.bulk_create([ProtocolStep(
+                    protocol=protocol,
+                    **persistence.step_fields({**data, 'step_number': step_number})
+                )])
+                yield 'step', {'id': str(step.id), **data, 'step_number': step_number}
+            elif kind == 'protocol':
+                protocol.title = data.get('title') or protocol.title
+                protocol.description = data.get('description', protocol.description)
+
+        protocol.save(update_fields=['title', 'description', 'updated_at'])
+        record_version(protocol.id, user)
+        self._index_prompt(protocol)
+
+        if cross_reference:
+            self.cross_reference_papers(protocol)
+
+        yield 'complete', {
+            'id': str(protocol.id),
+            'title': protocol.title,
+            'description': protocol.description
+        }
+
+    def _index_prompt(self, protocol: Protocol):
+        """Make a new protocol available to the semantic prompt cache."""
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return
+        try:
+            get_prompt_index().add(protocol.id, protocol.original_prompt)
+        except Exception as e:
+            logger.warning(f"Failed to index prompt for protocol {protocol.id}: {str(e)}")
     
     def search_protocols(self, query: str, search_type: str = 'keyword', 
-                        filters: Dict[str, Any] = None, limit: int = 20) -> List[Protocol]:
+                        filters: Dict[str, Any] = None, limit: int = 20,
+                        queryset=None) -> List[Protocol]:
         """
         Search for protocols based on query and filters.
         
         Args:
             query: Search query
-            search_type: Type of search ('keyword', 'semantic', 'both')
+            search_type: Type of search ('keyword', 'semantic', 'both', or
+                'fuzzy' for misspelling-tolerant title matching)
             filters: Additional filters
             limit: Maximum number of results
+            queryset: Protocols the caller may see (defaults to all)
             
         Returns:
-            List of matching protocols
+            List of matching protocols, best first, annotated with ``rank``
+            (plus ``headline`` for keyword matches and a per-retriever
+            ``scores`` breakdown for hybrid search)
         """
-        queryset = Protocol.objects.all()
+        if queryset is None:
+            queryset = Protocol.objects.all()
         
         # Apply filters
         if filters:
@@ -212,58 +574,65 @@ class ProtocolService:
                 queryset = queryset.filter(is_public=filters['is_public'])
         
         # Apply search
-        if search_type in ['keyword', 'both']:
-            from django.db import models
-            queryset = queryset.filter(
-                models.Q(title__icontains=query) |
-                models.Q(description__icontains=query) |
-                models.Q(original_prompt__icontains=query) |
-                models.Q(steps__content__icontains=query)
-            ).distinct()
+        if search_type == 'semantic':
+            return semantic_search(queryset, query, limit)
+        
+        if search_type == 'both':
+            return hybrid_search(queryset, query, limit)
         
-        # TODO: Implement semantic search when needed
-        if search_type in ['semantic', 'both']:
-            # Placeholder for semantic search implementation
-            pass
+        if search_type == 'fuzzy':
+            return fuzzy_search(queryset, query, limit)
         
-        return queryset[:limit]
+        return keyword_search(queryset, query)[:limit]
     
-    def cross_reference_papers(self, protocol: Protocol) -> List[Dict[str, Any]]:
+    def cross_reference_papers(self, protocol: Protocol, papers=None) -> List[Dict[str, Any]]:
         """
         Cross-reference protocol with research papers.
         
+        Each step is matched against the indexed passages of the papers and
+        the matches are saved as ``ProtocolReference`` rows (see
+        ``protocols.passages.cross_reference_protocol``).
+        
         Args:
             protocol: The protocol to cross-reference
+            papers: Papers to search; defaults to the author's uploads
             
         Returns:
-            List of relevant papers and their references
+            List of supporting and conflicting passages, in step order
         """
-        # TODO: Implement paper cross-referencing logic
-        # This would involve:
-        # 1. Searching papers database for relevant protocols
-        # 2. Comparing parameters and steps
-        # 3. Identifying conflicts and alternatives
+        references = cross_reference_protocol(protocol, papers)
+        titles = dict(
+            ResearchPaper.objects.filter(id__in={reference.research_paper_id for reference in references})
+            .values_list('id', 'title')
+        )
         
-        return []
+        return [
+            {
+                'id': str(reference.id),
+                'step_id': str(reference.step_id),
+                'step_number': reference.step.step_number,
+                'research_paper': {
+                    'id': str(reference.research_paper_id),
+                    'title': titles.get(reference.research_paper_id),
+                },
+                'page_number': reference.page_number,
+                'relation': reference.relation,
+                'score': reference.score,
+                'reference_text': reference.reference_text,
+                'conflicts': reference.conflicts,
+            }
+            for reference in references
+        ]
     
     def extract_protocol_parameters(self, text: str) -> Dict[str, Any]:
         """
-        Extract protocol parameters from text using NLP.
+        Extract protocol parameters from text.
         
         Args:
             text: Text to extract parameters from
             
         Returns:
-            Dictionary of extracted parameters
+            Dictionary of extracted temperatures, times, concentrations,
+            volumes, speeds and reagents (see ``protocols.extraction``)
         """
-        # TODO: Implement parameter extraction using regex/NLP
-        # This would extract temperatures, times, concentrations, etc.
-        
-        parameters = {
-            'temperatures': [],
-            'times': [],
-            'concentrations': [],
-            'reagents': []
-        }
-        
-        return parameters 
\ No newline at end of file
+        return extract_parameters(text)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Signal handlers for the protocols app.
+
+Saving or deleting a protocol, step or paper refreshes derived data: the
+search document, embeddings, keywords and the search cache generation. The
+changes of one transaction are collected and refreshed once it commits, so
+saving N steps or cascading a protocol delete over them costs one UPDATE
+and one task of each kind, not N.
+"""
+
+import threading
+from typing import Optional
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_migrate
+from django.dispatch import receiver
+
+from .cache import SearchResultCache
+from .embeddings import schedule_embedding_update
+from .keywords import forget_terms, schedule_keyword_update
+from .models import Protocol, ProtocolStep, ResearchPaper
+from .search import update_search_vectors
+
+
+@receiver(pre_migrate)
+def create_search_extensions(sender, using, **kwargs):
+    """
+    Install the extensions the protocols tables rely on before they are created:
+    pgvector for ProtocolEmbedding and pg_trgm for the trigram name indexes.
+    """
+    if sender.name != 'protocols':
+        return
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS vector')
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+class PendingRefresh:
+    """Documents changed in one transaction."""
+
+    def __init__(self):
+        self.protocol_ids = set()
+        self.paper_ids = set()
+        self.deleted_protocol_ids = set()
+        self.search_changed = False
+        self.flushed = False
+
+    def flush(self):
+        """Refresh everything collected, once."""
+        self.flushed = True
+        protocol_ids = list(self.protocol_ids - self.deleted_protocol_ids)
+        if protocol_ids:
+            update_search_vectors(protocol_ids)
+            schedule_embedding_update(protocol_ids)
+            schedule_keyword_update('protocol', protocol_ids)
+        if self.paper_ids:
+            schedule_keyword_update('paper', self.paper_ids)
+        if self.search_changed:
+            # After the search documents above, so no search caches the old ones
+            transaction.on_commit(SearchResultCache().bump_generation)
+
+
+_local = threading.local()
+
+
+def _registered(connection, refresh: PendingRefresh) -> bool:
+    # A rolled-back transaction drops its on_commit callbacks, and its batch with them
+    return any(callback[1] == refresh.flush for callback in connection.run_on_commit)
+
+
+def _pending(using: str) -> Optional[PendingRefresh]:
+    """The batch of the current transaction on ``using``; None in autocommit."""
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return None
+    batches = _local.__dict__.setdefault('batches', {})
+    refresh = batches.get(using)
+    if refresh is None or refresh.flushed or not _registered(connection, refresh):
+        refresh = batches[using] = PendingRefresh()
+        transaction.on_commit(refresh.flush, using=using)
+    return refresh
+
+
+def _refresh(using: str, protocol_ids=(), paper_ids=(), search_changed=False):
+    """Add changes to the pending batch, or refresh them right away in autocommit."""
+    refresh = _pending(using)
+    immediate = refresh is None
+    if immediate:
+        refresh = PendingRefresh()
+    refresh.protocol_ids.update(protocol_ids)
+    refresh.paper_ids.update(paper_ids)
+    refresh.search_changed |= search_changed
+    if immediate:
+        refresh.flush()
+
+
+@receiver(post_save, sender=Protocol)
+def refresh_protocol(sender, instance, using, **kwargs):
+    """Keep the search document, embeddings and keywords in sync with protocol edits."""
+    _refresh(using, protocol_ids=[instance.pk], search_changed=True)
+
+
+@receiver(post_save, sender=ProtocolStep)
+@receiver(post_delete, sender=ProtocolStep)
+def refresh_step_protocol(sender, instance, using, **kwargs):
+    """Step content is part of its protocol's search document, embeddings and keywords."""
+    refresh = _pending(using)
+    if refresh is not None and instance.protocol_id in refresh.deleted_protocol_ids:
+        # Cascaded from deleting the protocol: nothing left to refresh
+        return
+    _refresh(using, protocol_ids=[instance.protocol_id], search_changed=True)
+
+
+@receiver(post_save, sender=ResearchPaper)
+def refresh_paper_keywords(sender, instance, using, **kwargs):
+    """Re-index the keywords of saved papers."""
+    _refresh(using, paper_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Protocol)
+@receiver(pre_delete, sender=ResearchPaper)
+def forget_keyword_terms(sender, instance, using, **kwargs):
+    """Take a deleted document out of the keyword document frequencies, in the deleting transaction."""
+    forget_terms([instance.keyword_terms])
+    refresh = _pending(using)
+    if sender is Protocol and refresh is not None:
+        refresh.deleted_protocol_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Protocol)
+def invalidate_search_cache(sender, using, **kwargs):
+    """Start a new search generation once the deletion is visible to other requests."""
+    _refresh(using, search_changed=True)
\ No newline at end of file
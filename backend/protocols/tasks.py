@@ -0,0 +1,88 @@
+"""
+Celery tasks for the protocols app.
+"""
+
+import logging
+from celery import shared_task
+from django.contrib.auth.models import User
+
+from .cache import ProtocolGenerationCache
+from .embeddings import update_protocol_embeddings
+from .keywords import update_keywords
+from .passages import index_paper_passages
+from .pdf_extraction import extract_paper_text
+from .services import ProtocolService
+from .versioning import compact_all_versions
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def generate_protocol_task(self, user_id, prompt: str, job_key: str = None, **options):
+    """
+    Generate a protocol with the LLM and persist it for the given user.
+
+    Runs on a Celery worker so the web tier never waits on the LLM round-trip.
+    The task result is a small dict pointing at the saved protocol; clients
+    fetch it through the generation status endpoint. ``job_key`` is the
+    de-duplication key the view registered this job under, released once
+    the job finishes.
+    """
+    user = User.objects.get(pk=user_id)
+    logger.info(f"Generating protocol for user {user_id} (job {self.request.id})")
+
+    try:
+        service = ProtocolService()
+        protocol = service.create_protocol_from_prompt(user=user, prompt=prompt, **options)
+    finally:
+        if job_key:
+            ProtocolGenerationCache().release_job(job_key)
+
+    return {'protocol_id': str(protocol.id)}
+
+
+@shared_task
+def embed_protocols_task(protocol_ids):
+    """Refresh the semantic search embeddings of the given protocols and their steps."""
+    return update_protocol_embeddings(protocol_ids)
+
+
+@shared_task
+def update_keywords_task(kind, ids):
+    """Re-index the TF-IDF keywords of the given papers or protocols."""
+    return update_keywords(kind, ids)
+
+
+@shared_task
+def compact_protocol_versions_task():
+    """Thin out and re-encode protocol version history past the retention window."""
+    removed = compact_all_versions()
+    logger.info(f"Protocol version compaction removed {removed} versions")
+    return removed
+
+
+@shared_task(bind=True)
+def extract_paper_text_task(self, paper_id):
+    """
+    Extract the text of a research paper's PDF on a worker.
+
+    Progress is published as a ``PROGRESS`` task state with the pages done
+    and the page count, and is also visible on the paper itself. The
+    extracted text is then indexed as passages for cross-referencing and
+    for keywords.
+    """
+    def report(pages_extracted, page_count):
+        try:
+            self.update_state(state='PROGRESS', meta={
+                'paper_id': str(paper_id),
+                'pages_extracted': pages_extracted,
+                'page_count': page_count,
+            })
+        except Exception as e:
+            # Progress is also recorded on the paper; keep extracting
+            logger.warning(f"Could not report extraction progress for paper {paper_id}: {str(e)}")
+
+    pages = extract_paper_text(paper_id, progress=report)
+    passages = index_paper_passages(paper_id)
+    update_keywords('paper', [paper_id])
+    return {'paper_id': str(paper_id), 'page_count': pages, 'passage_count': passages}
@@ -0,0 +1,75 @@
+"""
+Statement counts of the bulk protocol persistence layer.
+
+Writing a protocol must cost the same number of queries whatever its
+number of steps and reagents.
+"""
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from protocols import persistence
+from protocols.models import Protocol, Reagent
+
+STEP_COUNTS = (3, 10, 50)
+
+
+def steps_data(count, start=1):
+    return [
+        {'step_number': number, 'title': f"Step {number}", 'content': f"Incubate sample {number} at 37 C"}
+        for number in range(start, start + count)
+    ]
+
+
+def reagents_data(count):
+    return [{'name': f"Reagent {number}", 'unit': 'mM', 'step_number': number} for number in range(1, count + 1)]
+
+
+class ProtocolPersistenceQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author')
+
+    def create(self, count):
+        # Run its on-commit refresh now, so the next write starts a batch of its own
+        with self.captureOnCommitCallbacks(execute=True):
+            return persistence.create_protocol(
+                steps=steps_data(count), reagents=reagents_data(count),
+                title=f"Protocol with {count} steps", author=self.user
+            )
+
+    def test_create_is_constant(self):
+        for count in STEP_COUNTS:
+            with self.subTest(steps=count), self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+                protocol = self.create(count)
+            self.assertEqual(protocol.steps.count(), count)
+            self.assertEqual(Reagent.objects.filter(protocol=protocol, step__isnull=False).count(), count)
+
+    def test_update_is_constant(self):
+        for count in STEP_COUNTS:
+            protocol = self.create(count)
+            steps = list(protocol.steps.order_by('step_number'))
+            # Move the last step to the front, rename the first one, drop the
+            # ones in between and append two new steps
+            update = [
+                {'id': steps[-1].id, 'step_number': 1},
+                {'id': steps[0].id, 'step_number': 2, 'title': 'Renamed'},
+                *steps_data(2, start=count + 1),
+            ]
+            with self.subTest(steps=count), self.assertNumQueries(9), self.captureOnCommitCallbacks(execute=True):
+                persistence.update_protocol(
+                    Protocol.objects.get(id=protocol.id), steps=update, title='Updated'
+                )
+            self.assertEqual(
+                list(protocol.steps.order_by('step_number').values_list('title', flat=True)),
+                [f"Step {count}", 'Renamed', f"Step {count + 1}", f"Step {count + 2}"]
+            )
+
+    def test_duplicate_is_constant(self):
+        for count in STEP_COUNTS:
+            source = self.create(count)
+            with self.subTest(steps=count), self.assertNumQueries(5), self.captureOnCommitCallbacks(execute=True):
+                copy = persistence.duplicate_protocol(source, author=self.user)
+            self.assertEqual(copy.steps.count(), count)
+            self.assertEqual(Reagent.objects.filter(protocol=copy, step__protocol=copy).count(), count)
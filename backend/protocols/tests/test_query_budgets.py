@@ -0,0 +1,112 @@
+"""
+Every budgeted viewset action must stay within its query budget.
+
+Runs under ``QUERY_BUDGET_STRICT`` so an overrun raises ``QueryBudgetExceeded``
+instead of only being logged.
+"""
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from prtcltech.query_budgets import QueryBudgetExceeded
+from protocols import persistence
+from protocols.tests.test_persistence import reagents_data, steps_data
+from protocols.versioning import record_version
+from protocols.views import ProtocolStepViewSet, ProtocolViewSet
+
+STEP_COUNT = 25
+
+PROTOCOLS_URL = '/api/v1/protocols/protocols/'
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author')
+        cls.protocol = persistence.create_protocol(
+            steps=steps_data(STEP_COUNT), reagents=reagents_data(STEP_COUNT),
+            title='PCR amplification', author=cls.user, is_public=True
+        )
+        record_version(cls.protocol.id, cls.user)
+        persistence.update_protocol(cls.protocol, steps=steps_data(STEP_COUNT + 1), title='PCR amplification v2')
+        record_version(cls.protocol.id, cls.user)
+        for number in range(3):
+            persistence.duplicate_protocol(cls.protocol, author=cls.user, title=f"PCR fork {number}")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def detail_url(self, suffix=''):
+        return f"{PROTOCOLS_URL}{self.protocol.id}/{suffix}"
+
+    def test_budgeted_actions_are_covered(self):
+        self.assertEqual(set(ProtocolViewSet.query_budgets), {
+            'list', 'retrieve', 'search', 'update', 'partial_update', 'duplicate', 'forks',
+            'parameters', 'versions', 'version', 'version_diff', 'rescore_keywords',
+        })
+        self.assertEqual(set(ProtocolStepViewSet.query_budgets), {'list', 'retrieve'})
+
+    def test_list(self):
+        self.assertEqual(self.client.get(PROTOCOLS_URL).status_code, 200)
+
+    def test_retrieve(self):
+        self.assertEqual(self.client.get(self.detail_url()).status_code, 200)
+
+    def test_search(self):
+        response = self.client.post(f"{PROTOCOLS_URL}search/", {'query': 'PCR', 'search_type': 'keyword'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update(self):
+        steps = [{'step_number': number, 'title': f"Step {number}", 'content': 'Mix gently'}
+                 for number in range(1, STEP_COUNT + 1)]
+        response = self.client.put(self.detail_url(), {'title': 'Updated', 'steps': steps}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_partial_update(self):
+        step = self.protocol.steps.order_by('step_number').first()
+        response = self.client.patch(
+            self.detail_url(), {'steps': [{'id': str(step.id), 'title': 'Renamed'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_duplicate(self):
+        self.assertEqual(self.client.post(self.detail_url('duplicate/')).status_code, 201)
+
+    def test_forks(self):
+        self.assertEqual(self.client.get(self.detail_url('forks/')).status_code, 200)
+
+    def test_parameters(self):
+        self.assertEqual(self.client.get(self.detail_url('parameters/')).status_code, 200)
+
+    def test_versions(self):
+        self.assertEqual(self.client.get(self.detail_url('versions/')).status_code, 200)
+
+    def test_version(self):
+        self.assertEqual(self.client.get(self.detail_url('versions/1/')).status_code, 200)
+
+    def test_version_diff(self):
+        self.assertEqual(self.client.get(self.detail_url('versions/1/diff/2/')).status_code, 200)
+
+    def test_rescore_keywords(self):
+        response = self.client.post(
+            f"{PROTOCOLS_URL}keywords/rescore/", {'ids': [str(self.protocol.id)]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_step_list(self):
+        self.assertEqual(self.client.get(self.detail_url('steps/')).status_code, 200)
+
+    def test_step_retrieve(self):
+        step = self.protocol.steps.first()
+        self.assertEqual(self.client.get(self.detail_url(f"steps/{step.id}/")).status_code, 200)
+
+    def test_overrun_raises(self):
+        with mock.patch.dict(ProtocolViewSet.query_budgets, {'retrieve': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.detail_url())
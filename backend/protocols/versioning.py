@@ -0,0 +1,211 @@
+"""
+Delta-compressed protocol version history.
+
+Each ``ProtocolVersion`` stores either a full snapshot of the protocol (a
+keyframe) or a JSON Patch against the version before it. A keyframe is
+written every ``PROTOCOL_VERSION_KEYFRAME_INTERVAL`` versions, so any
+version is rebuilt from one keyframe and fewer than that many patches.
+Snapshots key steps and reagents by id, so editing one step stores a patch
+for that step only.
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Subquery
+from django.utils import timezone
+from .cache import ProtocolDiffCache
+from .jsonpatch import apply_patch, make_patch
+from .models import Protocol, ProtocolStep, ProtocolVersion, Reagent
+from .persistence import REAGENT_FIELDS, STEP_FIELDS
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_FIELDS = ('title', 'description', 'is_public', 'tags', 'original_prompt', 'llm_model_used')
+
+
+def _json_value(value: Any) -> Any:
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def protocol_snapshot(protocol: Protocol) -> Dict[str, Any]:
+    """
+    Return the versioned content of ``protocol`` as a JSON-serializable dict.
+
+    Steps and reagents are read from the database rather than from any
+    prefetched relations, which may predate the change being recorded.
+    """
+    steps = ProtocolStep.objects.filter(protocol=protocol).order_by('step_number')
+    reagents = Reagent.objects.filter(protocol=protocol).order_by('name', 'id')
+    return {
+        **{field: getattr(protocol, field) for field in PROTOCOL_FIELDS},
+        'steps': {
+            str(step.id): {field: _json_value(getattr(step, field)) for field in STEP_FIELDS}
+            for step in steps
+        },
+        'reagents': {
+            str(reagent.id): {
+                **{field: getattr(reagent, field) for field in REAGENT_FIELDS},
+                'step': str(reagent.step_id) if reagent.step_id else None,
+            }
+            for reagent in reagents
+        },
+    }
+
+
+def _chain(protocol_id, version_number: Optional[int] = None) -> List[ProtocolVersion]:
+    """The latest keyframe at or before ``version_number`` and the deltas after it."""
+    versions = ProtocolVersion.objects.filter(protocol_id=protocol_id)
+    if version_number is not None:
+        versions = versions.filter(version_number__lte=version_number)
+    keyframe = versions.filter(is_keyframe=True).order_by('-version_number').values('version_number')[:1]
+    # No rows without a keyframe (the subquery is NULL)
+    return list(versions.filter(version_number__gte=Subquery(keyframe)).order_by('version_number'))
+
+
+def _replay(chain: List[ProtocolVersion]) -> Dict[str, Any]:
+    data = chain[0].protocol_data
+    for version in chain[1:]:
+        data = apply_patch(data, version.protocol_data)
+    return data
+
+
+def reconstruct_version(protocol_id, version_number: int) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild the full snapshot of one version of a protocol.
+
+    Returns:
+        The snapshot (see ``protocol_snapshot``), or None if the version
+        does not exist
+    """
+    chain = _chain(protocol_id, version_number)
+    if not chain or chain[-1].version_number != version_number:
+        return None
+    return _replay(chain)
+
+
+def _summarize(delta: Optional[List[Dict[str, Any]]]) -> str:
+    if delta is None:
+        return 'Initial version'
+    fields, members = set(), {'steps': set(), 'reagents': set()}
+    for op in delta:
+        tokens = op['path'].split('/')[1:]
+        if tokens and tokens[0] in members and len(tokens) > 1:
+            members[tokens[0]].add(tokens[1])
+        elif tokens:
+            fields.add(tokens[0])
+    parts = sorted(fields)
+    for name, ids in members.items():
+        if ids:
+            parts.append(f"{len(ids)} {name[:-1] if len(ids) == 1 else name}")
+    return f"Changed {', '.join(parts)}"
+
+
+@transaction.atomic
+def record_version(protocol_id, user, changes_summary: str = '') -> Optional[ProtocolVersion]:
+    """
+    Record the current state of a protocol as its next version.
+
+    The protocol row is locked so concurrent edits get consecutive version
+    numbers. Nothing is recorded if the content is unchanged since the
+    latest version.
+
+    Args:
+        protocol_id: The protocol to snapshot
+        user: The user responsible for the change
+        changes_summary: Description of the change; summarized from the
+            delta if empty
+
+    Returns:
+        The new ProtocolVersion, or None if nothing changed
+    """
+    protocol = Protocol.objects.select_for_update().get(id=protocol_id)
+    snapshot = protocol_snapshot(protocol)
+
+    chain = _chain(protocol.id)
+    if not chain:
+        delta, is_keyframe, version_number = None, True, 1
+    else:
+        delta = make_patch(_replay(chain), snapshot)
+        if not delta:
+            return None
+        is_keyframe = len(chain) >= settings.PROTOCOL_VERSION_KEYFRAME_INTERVAL
+        version_number = chain[-1].version_number + 1
+
+    return ProtocolVersion.objects.create(
+        protocol=protocol,
+        version_number=version_number,
+        created_by=user,
+        changes_summary=changes_summary or _summarize(delta),
+        protocol_data=snapshot if is_keyframe else delta,
+        is_keyframe=is_keyframe
+    )
+
+
+@transaction.atomic
+def compact_versions(protocol_id, before=None) -> int:
+    """
+    Thin out old history and re-encode what is left.
+
+    Versions created before ``before`` (default: ``PROTOCOL_VERSION_RETENTION_DAYS``
+    ago) are reduced to the last version of each day; newer versions are all
+    kept. Survivors keep their version numbers and are re-encoded against
+    each other with a keyframe every ``PROTOCOL_VERSION_KEYFRAME_INTERVAL``
+    versions. The protocol's cached diffs are invalidated once versions are
+    deleted.
+
+    Returns:
+        Number of versions deleted
+    """
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.PROTOCOL_VERSION_RETENTION_DAYS)
+
+    Protocol.objects.select_for_update().filter(id=protocol_id).first()
+    versions = list(ProtocolVersion.objects.filter(protocol_id=protocol_id).order_by('version_number'))
+    if not versions or versions[0].created_at >= before:
+        return 0
+
+    last_of_day = {}
+    for version in versions:
+        if version.created_at < before:
+            last_of_day[timezone.localdate(version.created_at)] = version.id
+    keep = set(last_of_day.values())
+
+    survivors, removed, data = [], [], None
+    for version in versions:
+        data = version.protocol_data if version.is_keyframe else apply_patch(data, version.protocol_data)
+        if version.created_at >= before or version.id in keep:
+            survivors.append((version, data))
+        else:
+            removed.append(version.id)
+
+    previous, chain_length = None, 0
+    for version, data in survivors:
+        if chain_length == 0 or chain_length >= settings.PROTOCOL_VERSION_KEYFRAME_INTERVAL:
+            version.protocol_data, version.is_keyframe, chain_length = data, True, 1
+        else:
+            version.protocol_data, version.is_keyframe = make_patch(previous, data), False
+            chain_length += 1
+        previous = data
+
+    if removed:
+        ProtocolVersion.objects.filter(id__in=removed).delete()
+        # Cached diffs may be from or to a deleted version
+        transaction.on_commit(lambda: ProtocolDiffCache().invalidate(protocol_id))
+    ProtocolVersion.objects.bulk_update(
+        [version for version, _ in survivors], ['protocol_data', 'is_keyframe']
+    )
+    logger.info(f"Compacted protocol {protocol_id} history: removed {len(removed)} versions")
+    return len(removed)
+
+
+def compact_all_versions(before=None) -> int:
+    """Compact the history of every protocol with versions older than ``before``."""
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.PROTOCOL_VERSION_RETENTION_DAYS)
+    protocol_ids = ProtocolVersion.objects.filter(created_at__lt=before) \
+        .order_by().values_list('protocol_id', flat=True).distinct()
+    return sum(compact_versions(protocol_id, before) for protocol_id in list(protocol_ids))
@@ -1,36 +1,92 @@
+import logging
+import uuid
+from datetime import timedelta
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.db import models
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from celery.result import AsyncResult
+from prtcltech.conditional import ConditionalGetMixin
+from prtcltech.fields import SparseFieldsetMixin
+from prtcltech.pagination import KeysetOrPageNumberPagination
+from prtcltech.query_budgets import QueryBudgetMixin
+from prtcltech.uploads import deduplicate_upload
 
+from . import persistence
+from .bibliography import PARSERS, detect_format, import_bibliography
+from .cache import ProtocolGenerationCache, SearchResultCache
+from .dedup import reuse_extracted_content
+from .diff import diff_versions
+from .extraction import extract_parameters_batch
+from .filters import ProtocolFilter
+from .keywords import rescore_keywords
 from .models import Protocol, ProtocolStep, Reagent, ResearchPaper, ProtocolReference
 from .serializers import (
-    ProtocolSerializer, ProtocolCreateSerializer, ProtocolUpdateSerializer,
+    ProtocolSerializer, ProtocolSummarySerializer, ProtocolCreateSerializer, ProtocolUpdateSerializer,
     ProtocolStepSerializer, ReagentSerializer, ResearchPaperSerializer,
     ProtocolReferenceSerializer, ProtocolGenerationRequestSerializer,
-    ProtocolSearchSerializer
+    ProtocolSearchSerializer, ProtocolSearchResultSerializer, KeywordRescoreSerializer,
+    ReagentLookupSerializer, ReagentMatchSerializer, ProtocolVersionSerializer,
+    ProtocolVersionDetailSerializer, protocol_detail_prefetches
 )
+from .jsonpatch import JSONPatchError, apply_patch
+from .parsers import JSONPatchParser
+from .renderers import EventStreamRenderer, format_sse
+from .search import fuzzy_reagent_search
 from .services import ProtocolService
+from .tasks import extract_paper_text_task, generate_protocol_task
+from .versioning import reconstruct_version, record_version
 
+logger = logging.getLogger(__name__)
 
-class ProtocolViewSet(viewsets.ModelViewSet):
+
+class ProtocolViewSet(QueryBudgetMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for Protocol CRUD operations."""
     
     queryset = Protocol.objects.all()
     serializer_class = ProtocolSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['is_public', 'author', 'tags']
+    filterset_class = ProtocolFilter
     search_fields = ['title', 'description', 'original_prompt']
     ordering_fields = ['created_at', 'updated_at', 'title']
-    ordering = ['-updated_at']
+    ordering = ['-updated_at', '-id']
+    pagination_class = KeysetOrPageNumberPagination
+    
+    # Actions that serialize the protocols they look up with their author,
+    # steps and reagents (writes serialize the protocol they just saved)
+    DETAIL_ACTIONS = {'list', 'retrieve', 'search', 'forks'}
+    
+    # Constant regardless of page size or step count
+    query_budgets = {
+        'list': 6,
+        'retrieve': 5,
+        'search': 6,
+        'update': 14,
+        'partial_update': 14,
+        'duplicate': 12,
+        'forks': 5,
+        'parameters': 3,
+        'versions': 4,
+        'version': 5,
+        'version_diff': 6,
+        'rescore_keywords': 5,
+    }
     
     def get_serializer_class(self):
+        if self.action in ['list', 'forks']:
+            return ProtocolSummarySerializer
         if self.action == 'create':
             return ProtocolCreateSerializer
         elif self.action in ['update', 'partial_update']:
@@ -41,128 +97,367 @@ class ProtocolViewSet(viewsets.ModelViewSet):
         """Filter protocols based on user permissions."""
         user = self.request.user
         if user.is_staff:
-            return Protocol.objects.all()
-        return Protocol.objects.filter(
-            models.Q(author=user) | models.Q(is_public=True)
-        )
+            queryset = Protocol.objects.all()
+        else:
+            queryset = Protocol.objects.filter(
+                models.Q(author=user) | models.Q(is_public=True)
+            )
+        
+        # The tsvector is only ever read inside the database, keyword term counts only for indexing
+        queryset = queryset.defer('search_vector', 'keyword_terms')
+        if self.action in self.DETAIL_ACTIONS:
+            # Skip joins and prefetches for fields a sparse fieldset leaves out
+            if self.field_requested('author'):
+                queryset = queryset.select_related('author')
+            if self.field_requested('steps'):
+                queryset = queryset.prefetch_related(*protocol_detail_prefetches())
+        return queryset
     
     def perform_create(self, serializer):
         """Set the author when creating a protocol."""
-        serializer.save(author=self.request.user)
+        protocol = serializer.save(author=self.request.user)
+        record_version(protocol.id, self.request.user)
+    
+    def perform_update(self, serializer):
+        """Save the protocol and record the change in its version history."""
+        protocol = serializer.save()
+        record_version(protocol.id, self.request.user)
     
     @swagger_auto_schema(
         request_body=ProtocolGenerationRequestSerializer,
-        responses={201: ProtocolSerializer}
+        responses={202: 'Generation job accepted'}
     )
     @action(detail=False, methods=['post'])
     def generate(self, request):
-        """Generate a protocol using LLM."""
+        """Queue protocol generation on a Celery worker."""
         serializer = ProtocolGenerationRequestSerializer(data=request.data)
         if serializer.is_valid():
+            options = dict(serializer.validated_data)
+            prompt = options.pop('prompt')
+
+            # Repeated submissions (e.g. a double-click) join the job already queued
+            cache = ProtocolGenerationCache()
+            request_key = cache.make_key(prompt, settings.GEMINI_MODEL, user=request.user.id, **options)
+            job_id = str(uuid.uuid4())
+            owner_id = cache.claim_job(request_key, job_id)
+            if owner_id != job_id:
+                return Response(
+                    {'job_id': owner_id, 'status': 'pending'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+
             try:
-                service = ProtocolService()
-                protocol = service.create_protocol_from_prompt(
-                    user=request.user,
-                    **serializer.validated_data
+                generate_protocol_task.apply_async(
+                    args=[request.user.id, prompt],
+                    kwargs={'job_key': request_key, **options},
+                    task_id=job_id
                 )
-                
-                response_serializer = ProtocolSerializer(protocol)
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-                
             except Exception as e:
+                cache.release_job(request_key)
                 return Response(
-                    {'error': f'Failed to generate protocol: {str(e)}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                    {'error': f'Failed to queue protocol generation: {str(e)}'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
-        
+
+            return Response(
+                {'job_id': job_id, 'status': 'pending'},
+                status=status.HTTP_202_ACCEPTED
+            )
+
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(
+        request_body=ProtocolGenerationRequestSerializer,
+        responses={200: 'text/event-stream of protocol, reagent, step and complete events'}
+    )
+    @action(detail=False, methods=['post'], url_path='generate/stream',
+            renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def generate_stream(self, request):
+        """Generate a protocol, streaming each step over Server-Sent Events as it is saved."""
+        serializer = ProtocolGenerationRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        service = ProtocolService()
+        events = service.stream_protocol_from_prompt(
+            user=request.user,
+            **serializer.validated_data
+        )
+
+        def event_stream():
+            try:
+                for event, data in events:
+                    yield format_sse(event, data)
+            except Exception:
+                logger.exception("Streaming protocol generation failed")
+                yield format_sse('error', {'error': 'Failed to generate protocol'})
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+        return response
+
+    @swagger_auto_schema(responses={200: 'Generation job status'})
+    @action(detail=False, methods=['get'], url_path=r'generate/(?P<job_id>[^/.]+)')
+    def generation_status(self, request, job_id=None):
+        """Get the status of a generation job, with the protocol once it is ready."""
+        job = AsyncResult(job_id, app=generate_protocol_task.app)
+
+        if job.failed():
+            # The exception can carry internal details; only the log gets them
+            logger.error(f"Protocol generation job {job_id} failed: {job.result!r}\n{job.traceback or ''}")
+            return Response({
+                'job_id': job_id,
+                'status': 'failed',
+                'error': 'Failed to generate protocol'
+            })
+
+        if not job.successful():
+            job_status = 'running' if job.state == 'STARTED' else 'pending'
+            return Response({'job_id': job_id, 'status': job_status})
+
+        protocol = get_object_or_404(self.get_queryset(), id=job.result['protocol_id'])
+        return Response({
+            'job_id': job_id,
+            'status': 'completed',
+            'protocol': ProtocolSerializer(protocol).data
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def generation_cache(self, request):
+        """Get hit/miss counters for the LLM generation cache."""
+        return Response(ProtocolGenerationCache().stats())
     
     @swagger_auto_schema(
         request_body=ProtocolSearchSerializer,
-        responses={200: ProtocolSerializer(many=True)}
+        responses={200: ProtocolSearchResultSerializer(many=True)}
     )
     @action(detail=False, methods=['post'])
     def search(self, request):
-        """Search for protocols."""
+        """Search for protocols; results are paginated with ``?page=``."""
         serializer = ProtocolSearchSerializer(data=request.data)
         if serializer.is_valid():
-            service = ProtocolService()
-            protocols = service.search_protocols(**serializer.validated_data)
+            queryset = self.get_queryset()
+            scope = 'all' if request.user.is_staff else f"user:{request.user.pk}"
+            cache = SearchResultCache()
+            cache_key = cache.make_key(scope=scope, **serializer.validated_data)
+            
+            protocols = cache.get(cache_key, queryset)
+            if protocols is None:
+                service = ProtocolService()
+                protocols = list(service.search_protocols(
+                    queryset=queryset,
+                    **serializer.validated_data
+                ))
+                cache.set(cache_key, protocols)
+            
+            page = self.paginate_queryset(protocols)
+            if page is not None:
+                response_serializer = ProtocolSearchResultSerializer(page, many=True)
+                return self.get_paginated_response(response_serializer.data)
             
-            response_serializer = ProtocolSerializer(protocols, many=True)
+            response_serializer = ProtocolSearchResultSerializer(protocols, many=True)
             return Response(response_serializer.data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @swagger_auto_schema(
+        query_serializer=ReagentLookupSerializer,
+        responses={200: ReagentMatchSerializer(many=True)}
+    )
+    @action(detail=False, methods=['get'], url_path='reagents/lookup')
+    def reagent_lookup(self, request):
+        """Fuzzy-match reagent names used in the protocols visible to the user."""
+        serializer = ReagentLookupSerializer(data=request.query_params)
+        if serializer.is_valid():
+            reagents = Reagent.objects.filter(protocol__in=self.get_queryset())
+            matches = fuzzy_reagent_search(
+                reagents,
+                serializer.validated_data['q'],
+                limit=serializer.validated_data['limit']
+            )
+            return Response(ReagentMatchSerializer(matches, many=True).data)
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @swagger_auto_schema(
+        request_body=KeywordRescoreSerializer,
+        responses={200: 'Keywords per protocol id'}
+    )
+    @action(detail=False, methods=['post'], url_path='keywords/rescore')
+    def rescore_keywords(self, request):
+        """
+        Re-rank the keywords of a batch of protocols against current corpus statistics.
+        
+        Scored in one pass over the stored term counts. Only your own
+        protocols are rescored; other ids are left out of the response.
+        """
+        serializer = KeywordRescoreSerializer(data=request.data)
+        if serializer.is_valid():
+            protocols = Protocol.objects.filter(id__in=serializer.validated_data['ids'])
+            if not request.user.is_staff:
+                protocols = protocols.filter(author=request.user)
+            documents = rescore_keywords('protocol', protocols.values('id'))
+            return Response({'keywords': {str(document.id): document.keywords for document in documents}})
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
     @action(detail=True, methods=['post'])
     def duplicate(self, request, pk=None):
         """Duplicate an existing protocol."""
         protocol = self.get_object()
-        
-        # Create a copy
-        new_protocol = Protocol.objects.create(
-            title=f"{protocol.title} (Copy)",
-            description=protocol.description,
-            author=request.user,
-            is_public=False,
-            tags=protocol.tags
-        )
-        
-        # Copy steps
-        for step in protocol.steps.all():
-            ProtocolStep.objects.create(
-                protocol=new_protocol,
-                step_number=step.step_number,
-                step_type=step.step_type,
-                title=step.title,
-                content=step.content,
-                duration_minutes=step.duration_minutes,
-                temperature_celsius=step.temperature_celsius,
-                reasoning=step.reasoning,
-                alternatives=step.alternatives
-            )
-        
-        # Copy reagents
-        for reagent in protocol.reagents.all():
-            Reagent.objects.create(
-                protocol=new_protocol,
-                name=reagent.name,
-                concentration=reagent.concentration,
-                unit=reagent.unit
-            )
+        new_protocol = persistence.duplicate_protocol(protocol, author=request.user)
+        record_version(new_protocol.id, request.user, f"Duplicated from {protocol.title}")
         
         response_serializer = ProtocolSerializer(new_protocol)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['get'])
+    def forks(self, request, pk=None):
+        """List the visible protocols duplicated from this one."""
+        protocol = self.get_object()
+        queryset = self.filter_queryset(self.get_queryset().filter(forked_from=protocol))
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def parameters(self, request, pk=None):
+        """Extract temperatures, times, concentrations, volumes, speeds and reagents from each step."""
+        protocol = self.get_object()
+        steps = list(protocol.steps.values('id', 'step_number', 'title', 'content'))
+        extracted = extract_parameters_batch([step['content'] for step in steps])
+        
+        return Response({
+            'steps': [
+                {'id': step['id'], 'step_number': step['step_number'], 'title': step['title'], 'parameters': parameters}
+                for step, parameters in zip(steps, extracted)
+            ]
+        })
+    
+    @action(detail=True, methods=['post'])
     def cross_reference(self, request, pk=None):
-        """Get cross-references for a protocol."""
+        """
+        Match each step against your indexed paper passages and save the references.
+        
+        Only the protocol's author (or staff) may replace its references.
+        """
         protocol = self.get_object()
+        if protocol.author_id != request.user.id and not request.user.is_staff:
+            return Response(
+                {'error': 'Only the author can cross-reference this protocol'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
         service = ProtocolService()
-        references = service.cross_reference_papers(protocol)
+        references = service.cross_reference_papers(
+            protocol, papers=ResearchPaper.objects.filter(uploaded_by=request.user)
+        )
         
         return Response({'references': references})
+    
+    @swagger_auto_schema(responses={200: ProtocolVersionSerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """List a protocol's versions, newest first, without their content."""
+        protocol = self.get_object()
+        versions = protocol.versions.select_related('created_by').defer('protocol_data')
+        
+        # Numbered pages: versions are not ordered like protocols
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(versions, request, view=self)
+        return paginator.get_paginated_response(ProtocolVersionSerializer(page, many=True).data)
+    
+    @swagger_auto_schema(responses={200: ProtocolVersionDetailSerializer})
+    @action(detail=True, methods=['get'], url_path=r'versions/(?P<version_number>\d+)')
+    def version(self, request, pk=None, version_number=None):
+        """Get the full content of one version of a protocol."""
+        protocol = self.get_object()
+        version = get_object_or_404(
+            protocol.versions.select_related('created_by').defer('protocol_data'),
+            version_number=version_number
+        )
+        version.protocol_data = reconstruct_version(protocol.id, version.version_number)
+        return Response(ProtocolVersionDetailSerializer(version).data)
+    
+    @action(detail=True, methods=['get'],
+            url_path=r'versions/(?P<from_version>\d+)/diff/(?P<to_version>\d+)')
+    def version_diff(self, request, pk=None, from_version=None, to_version=None):
+        """
+        Get the step-level changes between two versions of a protocol.
+        
+        Reports changed protocol fields; added, removed, moved and modified
+        steps, with parameter changes (duration, temperature, alternatives)
+        broken out; and reagent changes.
+        """
+        protocol = self.get_object()
+        diff = diff_versions(protocol.id, int(from_version), int(to_version))
+        if diff is None:
+            return Response({'error': 'Version not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(diff)
 
 
-class ProtocolStepViewSet(viewsets.ModelViewSet):
+class ProtocolStepViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     """ViewSet for ProtocolStep CRUD operations."""
     
     queryset = ProtocolStep.objects.all()
     serializer_class = ProtocolStepSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 3, 'retrieve': 2}
     
     def get_queryset(self):
         """Filter steps by protocol."""
         protocol_id = self.kwargs.get('protocol_pk')
         if protocol_id:
-            return ProtocolStep.objects.filter(protocol_id=protocol_id)
+            return ProtocolStep.objects.filter(protocol_id=protocol_id).prefetch_related('reagents')
         return ProtocolStep.objects.none()
     
+    parser_classes = [JSONParser, JSONPatchParser, FormParser, MultiPartParser]
+    
     def perform_create(self, serializer):
         """Set the protocol when creating a step."""
         protocol_id = self.kwargs.get('protocol_pk')
         protocol = get_object_or_404(Protocol, id=protocol_id)
         serializer.save(protocol=protocol)
+        persistence.touch_protocol(protocol.id)
+        record_version(protocol.id, self.request.user)
+    
+    def perform_update(self, serializer):
+        """Save the step and record the change in its protocol's history."""
+        step = serializer.save()
+        persistence.touch_protocol(step.protocol_id)
+        record_version(step.protocol_id, self.request.user)
+    
+    def partial_update(self, request, *args, **kwargs):
+        """
+        Partially update a step.
+        
+        Accepts either a regular partial JSON body or, with
+        ``Content-Type: application/json-patch+json``, a JSON Patch document
+        applied to the step's current representation.
+        """
+        if request.content_type.split(';')[0].strip() != JSONPatchParser.media_type:
+            return super().partial_update(request, *args, **kwargs)
+        
+        step = self.get_object()
+        try:
+            patched = apply_patch(self.get_serializer(step).data, request.data)
+        except JSONPatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = self.get_serializer(step, data=patched)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
+    
+    def perform_destroy(self, instance):
+        """Delete the step; its post_delete signal re-indexes the protocol on commit."""
+        protocol_id = instance.protocol_id
+        instance.delete()
+        persistence.touch_protocol(protocol_id)
+        record_version(protocol_id, self.request.user)
 
 
 class ReagentViewSet(viewsets.ModelViewSet):
@@ -184,6 +479,21 @@ class ReagentViewSet(viewsets.ModelViewSet):
         protocol_id = self.kwargs.get('protocol_pk')
         protocol = get_object_or_404(Protocol, id=protocol_id)
         serializer.save(protocol=protocol)
+        persistence.touch_protocol(protocol.id)
+        record_version(protocol.id, self.request.user)
+    
+    def perform_update(self, serializer):
+        """Save the reagent and record the change in its protocol's history."""
+        reagent = serializer.save()
+        persistence.touch_protocol(reagent.protocol_id)
+        record_version(reagent.protocol_id, self.request.user)
+    
+    def perform_destroy(self, instance):
+        """Delete the reagent and record the change in its protocol's history."""
+        protocol_id = instance.protocol_id
+        instance.delete()
+        persistence.touch_protocol(protocol_id)
+        record_version(protocol_id, self.request.user)
 
 
 class ResearchPaperViewSet(viewsets.ModelViewSet):
@@ -201,23 +511,130 @@ class ResearchPaperViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter papers based on user permissions."""
         user = self.request.user
+        # Extracted text can run to megabytes; it is read only inside the database
+        queryset = ResearchPaper.objects.select_related('uploaded_by').defer('extracted_text', 'keyword_terms')
         if user.is_staff:
-            return ResearchPaper.objects.all()
-        return ResearchPaper.objects.filter(uploaded_by=user)
+            return queryset
+        return queryset.filter(uploaded_by=user)
     
     def perform_create(self, serializer):
-        """Set the uploader when creating a paper."""
-        serializer.save(uploaded_by=self.request.user)
+        """Set the uploader when creating a paper, sharing the PDF and text of any copy already stored."""
+        paper = serializer.save(
+            uploaded_by=self.request.user,
+            **deduplicate_upload(ResearchPaper, 'pdf_file', serializer.validated_data.get('pdf_file'))
+        )
+        if reuse_extracted_content(paper):
+            paper.refresh_from_db()
+    
+    def perform_update(self, serializer):
+        """Store a replacement PDF by content hash like a new upload."""
+        serializer.save(
+            **deduplicate_upload(ResearchPaper, 'pdf_file', serializer.validated_data.get('pdf_file'))
+        )
+    
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+            openapi.Parameter('format', openapi.IN_FORM, type=openapi.TYPE_STRING, enum=list(PARSERS),
+                              description='Defaults to the file extension (.bib, .ris, .xml)'),
+        ],
+        responses={201: 'Import report'}
+    )
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def bulk_import(self, request):
+        """
+        Import a BibTeX, RIS or PubMed XML bibliography as papers.
+        
+        Records whose DOI or PMID you already have are skipped. The report
+        has the counts per status and one entry per record.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+        bibliography_format = request.data.get('format') or detect_format(upload.name)
+        if bibliography_format not in PARSERS:
+            return Response(
+                {'error': f"Unknown bibliography format; use one of: {', '.join(PARSERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        counts = {'created': 0, 'duplicate': 0, 'invalid': 0}
+        records = []
+        for report in import_bibliography(upload, bibliography_format, request.user):
+            counts[report['status']] += 1
+            records.append(report)
+        
+        return Response({**counts, 'records': records}, status=status.HTTP_201_CREATED)
     
+    @swagger_auto_schema(
+        request_body=KeywordRescoreSerializer,
+        responses={200: 'Keywords per paper id'}
+    )
+    @action(detail=False, methods=['post'], url_path='keywords/rescore')
+    def rescore_keywords(self, request):
+        """
+        Re-rank the keywords of a batch of papers against current corpus statistics.
+        
+        Scored in one pass over the stored term counts. Only papers you
+        uploaded are rescored; other ids are left out of the response.
+        """
+        serializer = KeywordRescoreSerializer(data=request.data)
+        if serializer.is_valid():
+            papers = ResearchPaper.objects.filter(id__in=serializer.validated_data['ids'])
+            if not request.user.is_staff:
+                papers = papers.filter(uploaded_by=request.user)
+            documents = rescore_keywords('paper', papers.values('id'))
+            return Response({'keywords': {str(document.id): document.keywords for document in documents}})
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @swagger_auto_schema(responses={200: 'Text reused from a duplicate', 202: 'Extraction job accepted'})
     @action(detail=True, methods=['post'])
     def extract_content(self, request, pk=None):
-        """Extract content from uploaded PDF."""
+        """
+        Queue text extraction from the uploaded PDF on a Celery worker.
+        
+        Progress is reported on the paper (``extraction_status``,
+        ``pages_extracted`` of ``page_count``). A paper already being
+        extracted returns its current job, unless that job has made no
+        progress for ``PDF_EXTRACTION_STALE_AFTER`` seconds (its worker
+        died); one with an extracted duplicate (same PDF, or for a paper
+        without one the same DOI or PMID) reuses its text without a job.
+        """
         paper = self.get_object()
+        if not paper.pdf_file:
+            return Response({'error': 'Paper has no PDF file'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        job_id = str(uuid.uuid4())
+        now = timezone.now()
+        claimed = ResearchPaper.objects.filter(id=paper.id).exclude(
+            extraction_status__in=['pending', 'running'],
+            extraction_updated_at__gte=now - timedelta(seconds=settings.PDF_EXTRACTION_STALE_AFTER)
+        ).update(
+            extraction_status='pending', extraction_task_id=job_id, extraction_error='',
+            extraction_updated_at=now
+        )
+        if not claimed:
+            paper.refresh_from_db(fields=['extraction_status', 'extraction_task_id'])
+            return Response(
+                {'job_id': paper.extraction_task_id, 'status': paper.extraction_status},
+                status=status.HTTP_202_ACCEPTED
+            )
+        
+        source = reuse_extracted_content(paper)
+        if source is not None:
+            return Response({'status': 'completed', 'reused_from': str(source.id)})
         
-        # TODO: Implement PDF content extraction
-        # This would use PyPDF2 or pdfminer to extract text
+        try:
+            extract_paper_text_task.apply_async(args=[str(paper.id)], task_id=job_id)
+        except Exception as e:
+            ResearchPaper.objects.filter(id=paper.id).update(extraction_status='', extraction_task_id='')
+            return Response(
+                {'error': f'Failed to queue content extraction: {str(e)}'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         
-        return Response({'message': 'Content extraction started'})
+        return Response({'job_id': job_id, 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['post'])
     def analyze(self, request, pk=None):
@@ -241,7 +658,9 @@ class ProtocolReferenceViewSet(viewsets.ModelViewSet):
         """Filter references by protocol."""
         protocol_id = self.kwargs.get('protocol_pk')
         if protocol_id:
-            return ProtocolReference.objects.filter(protocol_id=protocol_id)
+            return ProtocolReference.objects.filter(protocol_id=protocol_id).select_related(
+                'research_paper__uploaded_by'
+            ).defer('research_paper__extracted_text')
         return ProtocolReference.objects.none()
     
     def perform_create(self, serializer):
@@ -0,0 +1,97 @@
+"""
+ETag / Last-Modified conditional GETs for DRF viewsets.
+"""
+
+import hashlib
+from typing import Optional, Tuple
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    Answer unchanged ``list``/``retrieve`` requests with 304 Not Modified.
+
+    Validators come from one aggregate query over the row version column
+    (``etag_field``, normally an ``auto_now`` timestamp) before anything is
+    serialized: the object's version for detail views (also sent as
+    Last-Modified), and the row count plus the newest version for list
+    views. The strong ETag also covers the query string and response
+    format, so every distinct representation gets its own tag. Related rows
+    rendered inside a response must bump their parent's version when they
+    change.
+    """
+
+    etag_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self._validator_queryset()
+        summary = queryset.aggregate(count=Count('pk'), latest=Max(self.etag_field))
+        # No Last-Modified: deleting a row doesn't move the newest version
+        return self._conditional_response(
+            self._etag(summary['count'], summary['latest']),
+            None,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self._detail_validators()
+        if validators is None:
+            # Missing or not visible; let the normal lookup raise 404
+            return super().retrieve(request, *args, **kwargs)
+        pk, version = validators
+        return self._conditional_response(
+            self._etag(pk, version),
+            version,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def _validator_queryset(self):
+        # Validators only need the version column
+        return self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None).order_by()
+
+    def _detail_validators(self) -> Optional[Tuple]:
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return self._validator_queryset().filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list('pk', self.etag_field).first()
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def _etag(self, *parts) -> str:
+        request = self.request
+        fingerprint = '|'.join(str(part) for part in (
+            self.__class__.__name__, *parts, request.accepted_renderer.format,
+            request.GET.urlencode(),
+        ))
+        return f'"{hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:32]}"'
+
+    def _conditional_response(self, etag: str, last_modified, render) -> Response:
+        headers = {'ETag': etag}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+        if self._not_modified(etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = render()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def _not_modified(self, etag: str, last_modified) -> bool:
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+
+        if_modified_since = parse_http_date_safe(self.request.headers.get('If-Modified-Since'))
+        return (
+            if_modified_since is not None and last_modified is not None and
+            int(last_modified.timestamp()) <= if_modified_since
+        )
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""
+Sparse fieldsets (``?fields=``) and opt-in expansions (``?expand=``) for
+DRF serializers and viewsets.
+"""
+
+from typing import Optional, Set
+from rest_framework import serializers
+
+
+def _parse_list(value: Optional[str]) -> Optional[Set[str]]:
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Serializer mixin that renders only the fields a client asked for.
+
+    Fields named in ``Meta.expandable_fields`` (typically nested relations)
+    are left out unless requested with ``?expand=``. ``?fields=`` further
+    restricts output to the listed fields plus any expansions. Requests are
+    read from the ``fields`` and ``expand`` context keys, which
+    ``SparseFieldsetMixin`` fills in, and only apply to the top-level
+    serializer, not to nested ones.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_root():
+            return fields
+
+        requested = self.context.get('fields')
+        expanded = self.context.get('expand') or set()
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expanded and not (requested and name in requested):
+                fields.pop(name, None)
+
+        if requested is not None:
+            allowed = requested | expanded
+            for name in list(fields):
+                if name not in allowed:
+                    fields.pop(name)
+        return fields
+
+    def _is_root(self) -> bool:
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin that passes ``?fields=``/``?expand=`` to the serializer and
+    loads only the model columns the rendered fields read.
+
+    Applies to reads only; writes always validate and return full objects.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method in ('GET', 'HEAD'):
+            context['fields'] = _parse_list(self.request.query_params.get('fields'))
+            context['expand'] = _parse_list(self.request.query_params.get('expand')) or set()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+
+        columns = self.rendered_columns(queryset.model)
+        if not columns:
+            return queryset
+        # Cursor pagination reads the sort key back off the last row
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        columns |= {
+            name.lstrip('-') for name in ordering
+            if isinstance(name, str) and name.lstrip('-') in concrete
+        }
+        return queryset.only(*columns)
+
+    def field_requested(self, name: str) -> bool:
+        """Whether the serializer for this request renders field ``name``."""
+        return name in self.get_serializer().fields
+
+    def rendered_columns(self, model) -> Set[str]:
+        """
+        Model fields the serializer for this request reads, for ``only()``.
+
+        A dotted source such as ``author.username`` keeps its foreign key.
+        Reverse relations and computed fields need no columns of their own.
+        """
+        concrete = {field.name for field in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+        for field in self.get_serializer().fields.values():
+            if field.source == '*':
+                # The field reads the whole object
+                return set()
+            name = field.source.split('.')[0]
+            if name in concrete:
+                columns.add(name)
+        return columns
\ No newline at end of file
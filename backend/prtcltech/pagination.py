@@ -0,0 +1,58 @@
+"""
+Pagination classes for large, frequently appended collections.
+"""
+
+from django.db.models import QuerySet
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the view's ordering.
+
+    Each page is an indexed range scan from the previous page's last row,
+    so deep pages cost the same as the first and no ``COUNT(*)`` is run.
+    Views must order by their sort key plus a unique tiebreaker (e.g.
+    ``['-updated_at', '-id']``) with a matching composite index.
+    """
+
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        # Views without an OrderingFilter still page on their own ordering
+        self.ordering = getattr(view, 'ordering', None) or self.ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class KeysetOrPageNumberPagination(KeysetPagination):
+    """
+    Keyset pagination by default; page-number pagination on request.
+
+    ``?page=`` switches to numbered pages (with a total count), which suits
+    small collections. Ranked lists that are not querysets, such as search
+    results, are always numbered.
+    """
+
+    page_number_class = PageNumberPagination
+
+    def __init__(self):
+        self.page_number = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_number_class.page_query_param in request.query_params or \
+                not isinstance(queryset, QuerySet):
+            self.page_number = self.page_number_class()
+            return self.page_number.paginate_queryset(queryset, request, view)
+        self.page_number = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number is not None:
+            return self.page_number.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.page_number is not None:
+            return self.page_number.to_html()
+        return super().to_html()
\ No newline at end of file
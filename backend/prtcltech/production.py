@@ -108,7 +108,13 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
         'LOCATION': config('REDIS_URL'),
-    }
+    },
+    # LLM generations; eviction is handled by Redis' allkeys-lru policy
+    'llm': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_URL'),
+        'KEY_PREFIX': 'llm',
+    },
 }
 
 # Session configuration
@@ -144,4 +150,5 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
 # LLM Configuration
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-1.5-flash')
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='') 
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Per-action database query budgets for DRF viewsets.
+"""
+
+import logging
+from typing import Dict
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request runs more queries than its action's budget allows."""
+
+
+class QueryCounter:
+    """
+    ``connection.execute_wrapper`` hook that counts executed statements.
+
+    Savepoint statements are skipped: nested ``atomic()`` blocks (and every
+    block inside a ``TestCase``) issue them where a top-level transaction's
+    BEGIN/COMMIT never reach the wrapper, so counting them would make the same
+    request cost more in tests than in production.
+    """
+
+    TRANSACTION_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(self.TRANSACTION_PREFIXES):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    """
+    Cap the number of queries each viewset action may run.
+
+    ``query_budgets`` maps action names to the most queries one request may
+    execute on the default connection, independent of page or result size.
+    Overruns are logged; with ``QUERY_BUDGET_STRICT`` (enable it in CI) they
+    raise ``QueryBudgetExceeded`` so an N+1 regression fails the build.
+    Queries run after the view returns (e.g. by streaming responses) or on
+    other threads are not counted.
+    """
+
+    query_budgets: Dict[str, int] = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        action = getattr(self, 'action', None)
+        budget = self.query_budgets.get(action)
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{self.__class__.__name__}.{action} ran {counter.count} queries "
+                f"(budget {budget})"
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
\ No newline at end of file
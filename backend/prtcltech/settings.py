@@ -27,6 +27,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -162,10 +163,71 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_TRACK_STARTED = True
+CELERY_RESULT_EXPIRES = 60 * 60 * 24  # Keep generation job results for a day
+CELERY_BEAT_SCHEDULE = {
+    'compact-protocol-versions': {
+        'task': 'protocols.tasks.compact_protocol_versions_task',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+# Cache configuration. Web and Celery workers are separate processes, so
+# cache invalidation and in-flight generation claims only work across them
+# with the shared Redis; the in-process fallback is for running without it.
+CACHE_REDIS_URL = config('REDIS_URL', default='')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'default',
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'llm',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'llm': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'llm',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+    }
 
 # LLM Configuration
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-1.5-flash')
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
+LLM_CACHE_TIMEOUT = config('LLM_CACHE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)  # 1 week
+LLM_INFLIGHT_TIMEOUT = config('LLM_INFLIGHT_TIMEOUT', default=180, cast=int)  # Max wait on a shared generation
+
+# Sentence embeddings (semantic cache and semantic search)
+EMBEDDING_MODEL = config('EMBEDDING_MODEL', default='all-MiniLM-L6-v2')
+EMBEDDING_DIMENSIONS = config('EMBEDDING_DIMENSIONS', default=384, cast=int)  # Must match EMBEDDING_MODEL
+SEMANTIC_CACHE_ENABLED = config('SEMANTIC_CACHE_ENABLED', default=True, cast=bool)
+SEMANTIC_CACHE_THRESHOLD = config('SEMANTIC_CACHE_THRESHOLD', default=0.9, cast=float)
+SEMANTIC_SEARCH_EF_SEARCH = config('SEMANTIC_SEARCH_EF_SEARCH', default=100, cast=int)  # HNSW recall/speed trade-off
+TRIGRAM_SIMILARITY_THRESHOLD = config('TRIGRAM_SIMILARITY_THRESHOLD', default=0.5, cast=float)  # Fuzzy name matching
+SEARCH_CACHE_TIMEOUT = config('SEARCH_CACHE_TIMEOUT', default=60 * 10, cast=int)  # Stale generations expire
+PARAMETER_EXTRACTION_CACHE_TIMEOUT = config('PARAMETER_EXTRACTION_CACHE_TIMEOUT', default=60 * 60 * 24 * 7, cast=int)
+
+# Cross-referencing protocol steps against paper passages (see protocols.passages)
+PASSAGE_WORDS = config('PASSAGE_WORDS', default=120, cast=int)
+PASSAGE_OVERLAP_WORDS = config('PASSAGE_OVERLAP_WORDS', default=30, cast=int)
+CROSS_REFERENCE_TOP_K = config('CROSS_REFERENCE_TOP_K', default=3, cast=int)  # Supporting passages per step
+CROSS_REFERENCE_MIN_SIMILARITY = config('CROSS_REFERENCE_MIN_SIMILARITY', default=0.5, cast=float)
+
+# TF-IDF keywords of papers and protocols (see protocols.keywords)
+KEYWORDS_PER_DOCUMENT = config('KEYWORDS_PER_DOCUMENT', default=10, cast=int)
+KEYWORD_TERMS_PER_DOCUMENT = config('KEYWORD_TERMS_PER_DOCUMENT', default=300, cast=int)  # Terms indexed per document
+KEYWORD_RESCORE_MAX_BATCH = config('KEYWORD_RESCORE_MAX_BATCH', default=1000, cast=int)
 
 # AWS S3 Configuration (for file storage)
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
@@ -184,6 +246,31 @@ if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and AWS_STORAGE_BUCKET_NAME:
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+# Hash uploads while they stream in, for content-addressed storage (see prtcltech.uploads)
+FILE_UPLOAD_HANDLERS = [
+    'prtcltech.uploads.HashingMemoryFileUploadHandler',
+    'prtcltech.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Research paper PDF text extraction (see protocols.pdf_extraction)
+PDF_EXTRACTION_CHUNK_PAGES = config('PDF_EXTRACTION_CHUNK_PAGES', default=10, cast=int)
+PDF_EXTRACTION_PROCESSES = config('PDF_EXTRACTION_PROCESSES', default=4, cast=int)
+PDF_EXTRACTION_PARALLEL_MIN_PAGES = config('PDF_EXTRACTION_PARALLEL_MIN_PAGES', default=40, cast=int)
+PDF_EXTRACTION_MAX_PROCESS_MEMORY_MB = config('PDF_EXTRACTION_MAX_PROCESS_MEMORY_MB', default=1024, cast=int)  # 0 disables
+PDF_EXTRACTION_STALE_AFTER = config('PDF_EXTRACTION_STALE_AFTER', default=15 * 60, cast=int)  # Seconds without progress before a claim can be retaken
+
+# Bulk bibliography import (see protocols.bibliography): records deduplicated and inserted per batch
+BIBLIOGRAPHY_IMPORT_BATCH_SIZE = config('BIBLIOGRAPHY_IMPORT_BATCH_SIZE', default=1000, cast=int)
+
+# Protocol version history: a full snapshot every N versions, deltas between
+PROTOCOL_VERSION_KEYFRAME_INTERVAL = config('PROTOCOL_VERSION_KEYFRAME_INTERVAL', default=10, cast=int)
+# Compaction keeps one version per day for history older than this
+PROTOCOL_VERSION_RETENTION_DAYS = config('PROTOCOL_VERSION_RETENTION_DAYS', default=30, cast=int)
+PROTOCOL_DIFF_CACHE_TIMEOUT = config('PROTOCOL_DIFF_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)  # Diffs never go stale
+
+# Fail requests that exceed their viewset's query budget instead of logging
+# (see prtcltech.query_budgets); enable in CI
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
 
 # Logging configuration
 LOGGING = {
@@ -0,0 +1,109 @@
+"""
+Content-addressed storage for uploaded files.
+
+Uploads are SHA-256 hashed while Django streams them in (see the upload
+handlers below, installed in ``FILE_UPLOAD_HANDLERS``) and stored under a
+path derived from the hash. A row whose upload matches a file already
+stored for the same model is pointed at that blob instead of storing a
+second copy. Blobs may be shared between rows, so deleting a row must
+never delete its file (Django doesn't).
+"""
+
+import hashlib
+import os
+from typing import Any, Dict, Optional
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.utils.deconstruct import deconstructible
+
+
+class HashingUploadMixin:
+    """Upload handler mixin that sets ``content_hash`` on the finished file."""
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # This handler stored the chunk (rather than passing it to the next one)
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_content_hash(file) -> str:
+    """SHA-256 of a file's content, as computed during upload if available."""
+    content_hash = getattr(file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedUploadTo:
+    """
+    ``upload_to`` that stores files as ``<prefix>/<hash[:2]>/<hash><ext>``.
+
+    Uses the instance's ``content_hash``; files saved without one keep
+    their uploaded name.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def __call__(self, instance, filename: str) -> str:
+        content_hash = getattr(instance, 'content_hash', '')
+        if not content_hash:
+            return f"{self.prefix}/{filename}"
+        extension = os.path.splitext(filename)[1].lower()
+        return f"{self.prefix}/{content_hash[:2]}/{content_hash}{extension}"
+
+    def __eq__(self, other):
+        return isinstance(other, ContentAddressedUploadTo) and other.prefix == self.prefix
+
+
+def deduplicate_upload(model, field_name: str, upload: Optional[Any]) -> Dict[str, Any]:
+    """
+    Hash a new upload and find a stored blob with the same content.
+
+    Pass the result to ``serializer.save()`` (or the model constructor): it
+    sets ``content_hash`` and, when ``model`` already has a row with that
+    hash, replaces the upload with the existing file name so nothing is
+    stored twice.
+
+    Args:
+        model: Model with ``field_name`` and a ``content_hash`` field
+        field_name: The FileField
+        upload: The uploaded file, or None if the request has none
+
+    Returns:
+        Extra field values to save with the row
+    """
+    if upload is None:
+        return {}
+    content_hash = file_content_hash(upload)
+    stored = model.objects.filter(content_hash=content_hash, **{f'{field_name}__gt': ''}) \
+        .values_list(field_name, flat=True).first()
+    if stored:
+        return {'content_hash': content_hash, field_name: stored}
+    return {'content_hash': content_hash}
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from prtcltech.fields import SparseFieldsSerializerMixin
 from .models import Visualization, ChartData, ChartTemplate
 
 
-class VisualizationSerializer(serializers.ModelSerializer):
+class VisualizationSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     
     class Meta:
@@ -15,7 +16,7 @@ class VisualizationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
 
 
-class ChartDataSerializer(serializers.ModelSerializer):
+class ChartDataSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ChartData
         fields = [
@@ -24,7 +25,7 @@ class ChartDataSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ChartTemplateSerializer(serializers.ModelSerializer):
+class ChartTemplateSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
     
     class Meta:
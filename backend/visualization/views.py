@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from prtcltech.conditional import ConditionalGetMixin
+from prtcltech.fields import SparseFieldsetMixin
 
 from .models import Visualization, ChartData, ChartTemplate
 from .serializers import (
@@ -11,7 +13,7 @@ from .serializers import (
 )
 
 
-class VisualizationViewSet(viewsets.ModelViewSet):
+class VisualizationViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for Visualization CRUD operations."""
     
     queryset = Visualization.objects.all()
@@ -49,6 +51,8 @@ class VisualizationViewSet(viewsets.ModelViewSet):
         # Add users to shared_with
         users = User.objects.filter(id__in=user_ids)
         visualization.shared_with.add(*users)
+        # shared_with is part of the representation; advance the ETag
+        visualization.save(update_fields=['updated_at'])
         
         return Response({'message': 'Visualization shared successfully'})
     
@@ -63,7 +67,7 @@ class VisualizationViewSet(viewsets.ModelViewSet):
         return Response({'message': 'Export functionality coming soon'})
 
 
-class ChartDataViewSet(viewsets.ModelViewSet):
+class ChartDataViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for ChartData CRUD operations."""
     
     queryset = ChartData.objects.all()
@@ -80,7 +84,7 @@ class ChartDataViewSet(viewsets.ModelViewSet):
         )
 
 
-class ChartTemplateViewSet(viewsets.ModelViewSet):
+class ChartTemplateViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """ViewSet for ChartTemplate CRUD operations."""
     
     queryset = ChartTemplate.objects.all()
@@ -14,12 +14,31 @@ export const fetchProtocols = createAsyncThunk(
   }
 );
 
+const GENERATION_POLL_INTERVAL_MS = 1500;
+// Give up after 5 minutes: a job may wait out a shared generation before its own
+const GENERATION_MAX_POLLS = 200;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 export const generateProtocol = createAsyncThunk(
   'protocols/generateProtocol',
   async (protocolData, { rejectWithValue }) => {
     try {
+      // Generation runs as a background job; poll until the protocol is ready
       const response = await axios.post('/api/v1/protocols/generate/', protocolData);
-      return response.data;
+      const { job_id: jobId } = response.data;
+
+      for (let attempt = 0; attempt < GENERATION_MAX_POLLS; attempt += 1) {
+        await sleep(GENERATION_POLL_INTERVAL_MS);
+        const job = await axios.get(`/api/v1/protocols/generate/${jobId}/`);
+        if (job.data.status === 'completed') {
+          return job.data.protocol;
+        }
+        if (job.data.status === 'failed') {
+          return rejectWithValue(job.data);
+        }
+      }
+      return rejectWithValue({ job_id: jobId, status: 'timeout', error: 'Protocol generation timed out' });
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to generate protocol');
     }